@@ -1,27 +1,151 @@
 import os
-import pyzipper
+import time
+import uuid
+from contextlib import contextmanager
+from timing import Span
 
-def MakeZip(zip_path, file_paths, password=None):
-    """Bundle file_paths into a single zip at zip_path.
+# Zip output. Compression is configurable in settings.json:
+#   zip_compression      "deflated" (default), "stored", "bzip2" or "lzma"
+#   zip_compresslevel    e.g. 1 (fast) to 9 (small); null for the default
+#   zip_pdf_compression  method for the PDFs, "stored" by default: reportlab
+#                        already compresses them, so deflating again only
+#                        costs time
+#   zip_direct           true (default): write the outputs straight into the
+#                        zip, no loose files; false: write the files first
+#                        and zip them afterwards
+# Either way the archive is built under a temporary name next to its final
+# place and renamed in one step, so there is never a half-written zip. The
+# temporary file is created with the usual permissions (0666 less the
+# umask), so the zip ends up with the same mode as any other output file.
+
+_METHODS = {
+    "stored": "ZIP_STORED",
+    "deflated": "ZIP_DEFLATED",
+    "bzip2": "ZIP_BZIP2",
+    "lzma": "ZIP_LZMA",
+}
+
+def ZipOptions(settings):
+    return {
+        "compression": settings.get("zip_compression") or "deflated",
+        "compresslevel": settings.get("zip_compresslevel"),
+        "pdf_compression": settings.get("zip_pdf_compression") or "stored",
+        "direct": settings.get("zip_direct", True),
+    }
+
+def _CreateTemp(path, suffix):
+    # A new hidden file next to path; os.open applies the umask as open() would
+    while True:
+        tmp_path = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}{suffix}")
+        try:
+            os.close(os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+            return tmp_path
+        except FileExistsError:
+            continue
+
+def _Method(name):
+    import pyzipper
+
+    if name not in _METHODS:
+        raise ValueError(f"Unknown zip compression: {name} (use {', '.join(_METHODS)})")
+    return getattr(pyzipper, _METHODS[name])
+
+
+class ZipOutput:
+    """A zip archive that is filled entry by entry and only appears at
+    zip_path once commit() is called.
 
     When a password is given, the archive is AES-256 encrypted. Note that
     AES zips require an AES-capable extractor (7-Zip, WinRAR, PeaZip, ...);
     the Windows Explorer built-in "Extract All" cannot open them.
+    Used as a context manager it commits on success and discards on error.
+    """
+
+    def __init__(self, zip_path, password=None, compression="deflated", compresslevel=None):
+        # Imported on first use to keep it off the app's start-up path
+        import pyzipper
+
+        self.zip_path = zip_path
+        self.compresslevel = compresslevel
+        self._tmp_path = _CreateTemp(zip_path, ".tmp")
+        try:
+            if password:
+                self._zf = pyzipper.AESZipFile(self._tmp_path, "w", compression=_Method(compression),
+                                               compresslevel=compresslevel, encryption=pyzipper.WZ_AES)
+                self._zf.setpassword(password.encode("utf-8"))
+            else:
+                self._zf = pyzipper.AESZipFile(self._tmp_path, "w", compression=_Method(compression),
+                                               compresslevel=compresslevel)
+        except Exception:
+            os.remove(self._tmp_path)
+            raise
+
+    # compression is the method for this entry ("stored", ...), None for the
+    # archive's; the level is always the archive's
+    def writestr(self, name, data, compression=None):
+        # Dated now and rw-r--r--, like the entries write() adds from files
+        zinfo = self._zf.zipinfo_cls(name, date_time=time.localtime()[:6])
+        zinfo.external_attr = 0o100644 << 16
+        self._zf.writestr(zinfo, data, compress_type=_Method(compression) if compression else self._zf.compression,
+                          compresslevel=self.compresslevel)
+
+    def write(self, path, name, compression=None):
+        # Add the file at path as entry name
+        self._zf.write(path, name, compress_type=_Method(compression) if compression else None,
+                       compresslevel=self.compresslevel)
+
+    @contextmanager
+    def stream(self, name, compression=None):
+        """A binary file to write entry name into, e.g. from an XML writer
+        that streams its output. It may be read back (seek first) before the
+        block ends; the entry is added when it ends without an error.
+
+        The data goes through a hidden temporary file next to the archive
+        (the zip format can't take an entry of unknown size with these
+        settings otherwise), which is removed either way.
+        """
+        tmp_path = _CreateTemp(self.zip_path, ".part")
+        try:
+            with open(tmp_path, "w+b") as f:
+                yield f
+            self.write(tmp_path, name, compression)
+        finally:
+            os.remove(tmp_path)
+
+    def commit(self):
+        with Span("zip finish") as span:
+            self._zf.close()
+            os.replace(self._tmp_path, self.zip_path)
+            span.set(bytes=os.path.getsize(self.zip_path))
+
+    def discard(self):
+        try:
+            self._zf.close()
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def MakeZip(zip_path, file_paths, password=None, options=None):
+    """Bundle file_paths into a single zip at zip_path.
+
     When password is None/empty, a normal (unencrypted) zip is written.
+    options is the ZipOptions dict (defaults when None).
     """
-    if password:
-        zf = pyzipper.AESZipFile(
-            zip_path, "w",
-            compression=pyzipper.ZIP_DEFLATED,
-            encryption=pyzipper.WZ_AES,
-        )
-        zf.setpassword(password.encode("utf-8"))
-    else:
-        zf = pyzipper.AESZipFile(
-            zip_path, "w",
-            compression=pyzipper.ZIP_DEFLATED,
-        )
-
-    with zf:
-        for path in file_paths:
-            zf.write(path, arcname=os.path.basename(path))
+    options = options or ZipOptions({})
+    with Span("zip", files=len(file_paths), encrypted=bool(password)) as span:
+        with ZipOutput(zip_path, password, options["compression"], options["compresslevel"]) as zout:
+            for path in file_paths:
+                compression = options["pdf_compression"] if path.lower().endswith(".pdf") else None
+                zout.write(path, os.path.basename(path), compression)
+        span.set(bytes=os.path.getsize(zip_path))
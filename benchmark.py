@@ -0,0 +1,288 @@
+"""
+End-to-end benchmark of the export pipeline on synthetic payment files.
+
+Generates .pay files in both zTree formats (combo files with
+adress/firstName/lastName/Payment, older files with Computer/Name/Profit)
+and runs every stage the GUI runs on them, headlessly: decoding, parsing
+(IBAN checks included), SepaClean, building and exporting the SEPA XML,
+rendering both PDFs and zipping. Each stage is timed and, with --memory,
+its peak Python memory use is measured with tracemalloc in a separate run.
+
+The results are written to a JSON report. Pass an earlier report as
+--baseline to flag stages that got slower or hungrier; the exit code is 1
+when there are regressions.
+
+Example:
+    python benchmark.py --sizes 100 1000 10000 --memory --output report.json
+    python benchmark.py --sizes 100 1000 10000 --memory --output new.json --baseline report.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+from utils import DecodeFile, SepaClean
+from parse import ParseRows
+from iban import ClearIBANLookups
+from export import SepaConfig, MakeSepa
+from pdf import MakePDF
+from rows import PaymentBatch
+from archive import MakeZip, ZipOptions
+
+
+# Bank codes schwifty knows, so the generated IBANs also get a BIC
+_BANK_CODES = ["37040044", "10010010", "50010517", "20041111", "70150000", "12030000"]
+
+_FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Emma", "Felix", "Hannah", "Jonas", "Lea", "Paul"]
+_LAST_NAMES = ["Schmidt", "Becker", "Wagner", "Hoffmann", "Koch", "Richter", "Klein", "Wolf", "Neumann", "Braun"]
+# Non-ASCII names that survive every encoding offered below (cp1252 included)
+_FIRST_NAMES_NON_ASCII = ["Jörg", "Zoë", "Renée", "Søren", "Ángel", "Françoise", "Björn", "Núria"]
+_LAST_NAMES_NON_ASCII = ["Müller", "Größe", "Dubois & Fils", "Øster", "Peña", "Çelik", "Weiß", "Åberg"]
+
+# A=10, B=11, ..., Z=35 as in ISO 7064 mod 97-10
+_NUMERIFY = {ord(c): str(i) for i, c in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZ", 10)}
+
+def _IBAN(rng):
+    bban = rng.choice(_BANK_CODES) + f"{rng.randrange(10 ** 10):010d}"
+    check = 98 - int((bban + "DE00").translate(_NUMERIFY)) % 97
+    return f"DE{check:02d}{bban}"
+
+def _InvalidIBAN(rng):
+    # Wrong checksum, too short or garbage, as they turn up in real files
+    iban = _IBAN(rng)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return iban[:2] + f"{(int(iban[2:4]) + 1) % 100:02d}" + iban[4:]
+    if kind == 1:
+        return iban[:-3]
+    return "not an iban"
+
+def GeneratePayFile(path, rows, fmt="combo", encoding="utf-8", invalid_ratio=0.0, non_ascii_ratio=0.0, seed=0):
+    """Write a synthetic .pay file with rows payees to path.
+
+    fmt is "combo" (zTree 5 and above) or "old". invalid_ratio and
+    non_ascii_ratio are the shares of rows with an invalid IBAN and with a
+    non-ASCII name. The same seed gives the same file. Returns the raw
+    names, in file order.
+    """
+    if fmt not in ("combo", "old"):
+        raise ValueError(f"Unknown .pay format: {fmt}")
+    rng = random.Random(seed)
+    names = []
+    lines = ["subject\tadress\tfirstName\tlastName\tPayment" if fmt == "combo" else "Computer\tName\tProfit"]
+    for i in range(1, rows + 1):
+        if rng.random() < non_ascii_ratio:
+            first, last = rng.choice(_FIRST_NAMES_NON_ASCII), rng.choice(_LAST_NAMES_NON_ASCII)
+        else:
+            first, last = rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)
+        iban = _InvalidIBAN(rng) if rng.random() < invalid_ratio else _IBAN(rng)
+        # Both decimal separators occur in practice
+        amount = f"{rng.randrange(500, 4000) / 100:.2f}"
+        if rng.random() < 0.5:
+            amount = amount.replace(".", ",")
+        if fmt == "combo":
+            # zTree writes the IBAN in groups of four
+            grouped = " ".join(iban[k:k + 4] for k in range(0, len(iban), 4))
+            lines.append(f"{i}\t{grouped}\t{first}\t{last}\t{amount}")
+        else:
+            lines.append(f"C{i}\t{iban},{first} {last}\t{amount}")
+        names.append(f"{first} {last}")
+    with open(path, "w", encoding=encoding, newline="") as f:
+        f.write("\r\n".join(lines) + "\r\n")
+    return names
+
+
+def _Measure(func, repeat, memory):
+    # Best wall time of repeat runs, then optionally one more run under
+    # tracemalloc for the peak (tracemalloc slows everything down, so the
+    # two are never mixed)
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - t0
+        best = seconds if best is None else min(best, seconds)
+    stage = {"seconds": round(best, 6)}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            stage["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return stage, result
+
+def RunCase(work_dir, rows, fmt="combo", encoding="utf-8", invalid_ratio=0.0, non_ascii_ratio=0.0,
+            settings=None, repeat=1, memory=False, password=None, seed=0):
+    """Generate one payment file and run every stage of the pipeline on it.
+
+    Returns the case dict of the report: its parameters, the number of
+    valid payments and per stage {"seconds", "peak_bytes"}.
+    """
+    settings = settings or {}
+    name = f"{fmt}-{encoding}-{rows}"
+    base = os.path.join(work_dir, name)
+    names = GeneratePayFile(base + ".pay", rows, fmt, encoding, invalid_ratio, non_ascii_ratio, seed)
+    config = SepaConfig(settings.get("payer_name", "My Company GmbH"),
+                        settings.get("payer_iban", "DE02100100109307118603"),
+                        settings.get("payer_bic", "PBNKDEFFXXX"), settings.get("currency", "EUR"),
+                        "Benchmark", name, settings.get("pdf_engine", "platypus"))
+    schema = settings.get("default_schema") or "pain.001.001.03"
+    engine = settings.get("sepa_engine", "sepaxml")
+    stages = {}
+
+    stages["decode"], text = _Measure(lambda: DecodeFile(base + ".pay"), repeat, memory)
+
+    # Cold lookups every time: the in-process caches would hide the IBAN checks
+    def parse():
+        ClearIBANLookups()
+        SepaClean.cache_clear()
+        return ParseRows(text)
+    stages["parse"], (payments, discarded) = _Measure(parse, repeat, memory)
+
+    def clean():
+        SepaClean.cache_clear()
+        return [SepaClean(n) for n in names]
+    stages["sepa_clean"], _ = _Measure(clean, repeat, memory)
+
+    payments = PaymentBatch(sorted(payments, key=lambda r: r["name"].lower()))
+    stages["sepa_export"], xml = _Measure(lambda: MakeSepa(config, payments, schema, engine).export(), repeat, memory)
+
+    def pdf(anonymous):
+        buffer = io.BytesIO()
+        MakePDF(buffer, name, payments, config["currency"], config["reference"], anonymous, config["pdf_engine"])
+        return buffer.getvalue()
+    stages["pdf"], regular = _Measure(lambda: pdf(False), repeat, memory)
+    stages["pdf_anonymous"], anonymous = _Measure(lambda: pdf(True), repeat, memory)
+
+    files = []
+    for path, data in ((base + ".xml", xml), (base + ".pdf", regular), (base + "_anonymous.pdf", anonymous)):
+        with open(path, "wb") as f:
+            f.write(data)
+        files.append(path)
+    options = ZipOptions(settings)
+    stages["zip"], _ = _Measure(lambda: MakeZip(base + ".zip", files, password, options), repeat, memory)
+
+    return {
+        "name": name,
+        "format": fmt,
+        "encoding": encoding,
+        "rows": rows,
+        "invalid_ratio": invalid_ratio,
+        "non_ascii_ratio": non_ascii_ratio,
+        "payments": len(payments),
+        "discarded": len(discarded),
+        "bytes": {"pay": os.path.getsize(base + ".pay"), "xml": len(xml), "pdf": len(regular),
+                  "pdf_anonymous": len(anonymous), "zip": os.path.getsize(base + ".zip")},
+        "stages": stages,
+    }
+
+def CompareReports(report, baseline, tolerance=0.25, min_seconds=0.005):
+    """List the stages that regressed against baseline.
+
+    A stage regresses when it takes more than tolerance (a fraction) longer
+    than in the baseline, and at least min_seconds longer, so the noise of
+    very short stages is ignored; or when its peak memory grows by more than
+    tolerance. Cases are matched by name.
+    """
+    base_cases = {case["name"]: case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in report["cases"]:
+        base_case = base_cases.get(case["name"])
+        if base_case is None:
+            continue
+        for stage, result in case["stages"].items():
+            before = base_case["stages"].get(stage)
+            if before is None:
+                continue
+            seconds, old_seconds = result["seconds"], before["seconds"]
+            if seconds > old_seconds * (1 + tolerance) and seconds - old_seconds >= min_seconds:
+                regressions.append(f"{case['name']} {stage}: {old_seconds:.4f} s -> {seconds:.4f} s")
+            peak, old_peak = result.get("peak_bytes"), before.get("peak_bytes")
+            if peak and old_peak and peak > old_peak * (1 + tolerance):
+                regressions.append(f"{case['name']} {stage}: peak {old_peak / 1024:.0f} KiB -> {peak / 1024:.0f} KiB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the export pipeline on synthetic .pay files.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="payees per file (default: 100 1000 10000; 100000 works but takes minutes)")
+    parser.add_argument("--formats", nargs="+", default=["combo", "old"], choices=["combo", "old"])
+    parser.add_argument("--encodings", nargs="+", default=["utf-8", "cp1252"],
+                        help="encodings of the generated files, e.g. utf-8 utf-8-sig cp1252 utf-16")
+    parser.add_argument("--invalid", type=float, default=0.02, help="share of rows with an invalid IBAN")
+    parser.add_argument("--non-ascii", type=float, default=0.2, help="share of rows with a non-ASCII name")
+    parser.add_argument("--settings", help="settings.json to take the payer info and engines from")
+    parser.add_argument("--password", help="AES-encrypt the zip, as the GUI does when asked to")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the fastest counts")
+    parser.add_argument("--memory", action="store_true", help="also measure the peak memory of every stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown / memory growth against the baseline (default: 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    # Read first: the new report may replace it
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    settings = {}
+    if args.settings:
+        with open(args.settings, "r", encoding="utf-8-sig") as f:
+            settings = json.load(f)
+
+    import schwifty
+    import sepaxml
+    import reportlab
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": {"schwifty": schwifty.__version__, "sepaxml": getattr(sepaxml, "__version__", None),
+                     "reportlab": reportlab.Version},
+        "settings": {key: settings.get(key) for key in ("sepa_engine", "pdf_engine", "default_schema",
+                                                        "zip_compression", "zip_compresslevel")},
+        "repeat": args.repeat,
+        "cases": [],
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        # A small unreported run first, so the first case doesn't pay for
+        # importing the packages and loading the bank registry
+        RunCase(work_dir, 10, settings=settings, password=args.password)
+        for fmt in args.formats:
+            for encoding in args.encodings:
+                for rows in args.sizes:
+                    case = RunCase(work_dir, rows, fmt, encoding, args.invalid, args.non_ascii, settings,
+                                   args.repeat, args.memory, args.password, args.seed)
+                    report["cases"].append(case)
+                    timings = ", ".join(f"{stage} {result['seconds']:.3f}" for stage, result in case["stages"].items())
+                    print(f"{case['name']}: {timings}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if baseline is not None:
+        regressions = CompareReports(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"    regression: {line}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Headless batch converter for zTree payment files.
+
+Runs the same pipeline as the GUI (decode, parse, SEPA XML, PDFs, optional
+zip) for many .pay files at once, one output set per session, spread over a
+process pool. Nothing here needs Tk: problems are reported as structured
+diagnostics instead of dialogs.
+
+Example:
+    python cli.py sessions/ --settings settings.json --reference "Lab Payment July" --output-dir out
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from parse import IterParseFile
+from iban import ValidateIBAN, UseIBANCache, SaveIBANCache
+from export import SepaConfig, InvalidAmounts, MakeSepa, WriteOutputs
+from split import BatchLimits, SplitRows, WriteBatch
+from pdfjobs import PDFJobs
+from merge import DropComboTwins
+from archive import ZipOptions
+from timing import Span, EnableTracing, StartTrace, WriteTraceReport
+from ledger import SourceFiles, RecordBatch, FindDuplicates
+from rows import PaymentBatch, FormatCents
+from rules import ParseRules, ApplyRules
+
+
+def CollectPayFiles(inputs):
+    """Expand directories and glob patterns into a sorted list of .pay files.
+
+    zTree writes both DATE_TIME.pay and DATE_TIME_combo.pay for a session; if
+    both are present only the combo file is kept, so nobody is paid twice.
+    """
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            found.update(glob.glob(os.path.join(item, "*.pay")))
+        elif glob.has_magic(item):
+            found.update(p for p in glob.glob(item) if os.path.isfile(p))
+        else:
+            found.add(item)
+
+    return sorted(DropComboTwins({os.path.abspath(p) for p in found}))
+
+
+def ConvertFile(pay_path, settings, reference, experiment, output_dir, zip_output=False, password=None, iban_cache=None, ledger=None,
+                allow_duplicates=False, rules=()):
+    """Convert one .pay file and return a diagnostics dict (never raises).
+
+    With a ledger, a session that was already exported (the same file, or
+    payments with the same IBAN and amount for the same experiment) is not
+    converted unless allow_duplicates is set. rules are payout rule lines
+    (see rules.py) applied to the amounts first.
+    """
+    if iban_cache:
+        UseIBANCache(iban_cache)
+    stem = os.path.splitext(os.path.basename(pay_path))[0]
+    result = {
+        "file": pay_path,
+        "status": "ok",
+        "payments": 0,
+        "total": "0.00",
+        "encoding": {},
+        "chunks": 1,
+        "duplicates": [],
+        "discarded": [],
+        "outputs": [],
+        "problems": [],
+        "pdf_timings": {},
+        "trace": None,
+        "error": None,
+    }
+    # Each session is one traced run (a no-op unless "trace" is on)
+    EnableTracing(settings.get("trace", False), settings.get("trace_memory", False))
+    StartTrace()
+    try:
+        discarded = result["discarded"]
+        with Span("parse") as span:
+            rows = PaymentBatch(IterParseFile(pay_path, discarded.append, result["encoding"]))
+            span.set(rows=len(rows), discarded=len(discarded), bytes=os.path.getsize(pay_path))
+        if rules:
+            rows.set_cents(ApplyRules(rows, ParseRules(rules)))
+        result["payments"] = len(rows)
+        result["total"] = FormatCents(rows.total_cents)
+        if not rows:
+            raise ValueError("No valid payment entries were found.")
+
+        invalid_rows = InvalidAmounts(rows)
+        if invalid_rows:
+            info = "; ".join(f"row {idx}: {row['name']} ({row['amount']:.2f})" for idx, row in invalid_rows)
+            raise ValueError(f"All payment amounts must be greater than zero: {info}")
+
+        rows = PaymentBatch(sorted(rows, key=lambda r: r["name"].lower()))
+        config = SepaConfig(settings.get("payer_name", ""), settings.get("payer_iban", ""),
+                            settings.get("payer_bic", ""), settings.get("currency", "EUR"),
+                            reference, experiment or stem, settings.get("pdf_engine", "platypus"))
+        sources = SourceFiles([pay_path])
+        if ledger:
+            files, duplicates = FindDuplicates(ledger, rows, config["experiment"], sources)
+            result["duplicates"] = ([f"file already exported on {f['created']} ({f['experiment']}, {f['reference']})" for f in files] +
+                                    [f"{rows[i]['name']} ({rows[i]['amount']:.2f}) already paid on {earlier[0]['created']} ({earlier[0]['reference']})"
+                                     for i, earlier in duplicates.items()])
+            if result["duplicates"] and not allow_duplicates:
+                raise ValueError("Already exported (see duplicates); use --allow-duplicates to export it anyway.")
+        schema = settings.get("default_schema") or "pain.001.001.03"
+        engine = settings.get("sepa_engine", "sepaxml")
+        limits = BatchLimits(settings)
+        chunks = SplitRows(rows, limits, config, schema)
+        base_path = os.path.join(output_dir, stem)
+        # Sessions already run in parallel, so the parts and PDFs of one
+        # session are rendered one by one
+        pdfs = PDFJobs(config, rows, use_process=False)
+        if len(chunks) == 1:
+            outputs, problems = WriteOutputs(base_path, MakeSepa(config, rows, schema, engine), config, rows,
+                                             zip_output=zip_output, password=password, pdfs=pdfs,
+                                             zip_options=ZipOptions(settings))
+        else:
+            outputs, problems = WriteBatch(base_path, config, chunks, schema, engine, limits["per"],
+                                           zip_output=zip_output, password=password, workers=1, pdfs=pdfs,
+                                           zip_options=ZipOptions(settings))
+            result["chunks"] = len(chunks)
+        result["pdf_timings"] = {job: round(seconds, 4) for job, seconds in pdfs.timings.items()}
+        result["outputs"] = outputs
+        result["problems"] = problems
+        if ledger:
+            try:
+                RecordBatch(ledger, config, rows, outputs, sources)
+            except Exception as e:
+                problems.append(f"Payment ledger: {e}")
+        try:
+            result["trace"] = WriteTraceReport(base_path, settings.get("trace_report", "json"))
+        except Exception as e:
+            problems.append(f"Trace report: {e}")
+        if problems or discarded or result["duplicates"]:
+            result["status"] = "warning"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    # Pool workers exit without running atexit handlers, so save explicitly
+    SaveIBANCache()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert zTree .pay files to SEPA XML and PDFs without the GUI.")
+    parser.add_argument("inputs", nargs="+", help=".pay files, directories or glob patterns")
+    parser.add_argument("--settings", required=True, help="settings.json with the payer banking info")
+    parser.add_argument("--reference", required=True, help="payment reference used for every transfer")
+    parser.add_argument("--experiment", help="experiment name (default: the session file name)")
+    parser.add_argument("--output-dir", default=".", help="directory for the generated files")
+    parser.add_argument("--zip", action="store_true", help="bundle each session's outputs into a zip")
+    parser.add_argument("--password", help="AES-encrypt the zips with this password (implies --zip)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--iban-cache", help="on-disk IBAN/BIC cache to use (e.g. the iban_cache.json next to the GUI)")
+    parser.add_argument("--ledger", help="payment ledger to record the batches in (e.g. the ledger.db next to the GUI)")
+    parser.add_argument("--allow-duplicates", action="store_true", help="export sessions the ledger lists as already exported")
+    parser.add_argument("--rules", help='apply this rule set from "payout_rules" in the settings file to the amounts')
+    parser.add_argument("--json", action="store_true", help="print the diagnostics as JSON")
+    args = parser.parse_args(argv)
+
+    # utf-8-sig also tolerates a BOM, which Notepad may add when users edit the file
+    with open(args.settings, "r", encoding="utf-8-sig") as f:
+        settings = json.load(f)
+
+    try:
+        ValidateIBAN(settings.get("payer_iban", ""))
+    except Exception:
+        parser.error("payer IBAN in the settings file is not valid")
+
+    rules = ()
+    if args.rules:
+        rules = (settings.get("payout_rules") or {}).get(args.rules)
+        if rules is None:
+            parser.error(f'no rule set "{args.rules}" in "payout_rules" of the settings file')
+        try:
+            ParseRules(rules)
+        except ValueError as e:
+            parser.error(str(e))
+
+    pay_files = CollectPayFiles(args.inputs)
+    if not pay_files:
+        parser.error("no .pay files found")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    zip_output = args.zip or bool(args.password)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(ConvertFile, path, settings, args.reference, args.experiment,
+                               args.output_dir, zip_output, args.password, args.iban_cache, args.ledger,
+                               args.allow_duplicates, rules)
+                   for path in pay_files]
+        results = [f.result() for f in futures]
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        for r in results:
+            line = f"[{r['status']}] {os.path.basename(r['file'])}: {r['payments']} payments, total {r['total']}"
+            if r["encoding"]:
+                line += f" ({r['encoding']['encoding']} via {r['encoding']['method']})"
+            if r["chunks"] > 1:
+                line += f", split into {r['chunks']} parts"
+            if r["error"]:
+                line += f" - {r['error']}"
+            print(line)
+            for d in r["discarded"]:
+                print(f"    discarded: {d['name']} | IBAN: {d['iban']} ({d['reason']})")
+            for d in r["duplicates"]:
+                print(f"    duplicate: {d}")
+            for p in r["problems"]:
+                print(f"    problem: {p}")
+
+    return 1 if any(r["status"] == "error" for r in results) else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
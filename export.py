@@ -0,0 +1,264 @@
+import os
+import datetime
+import uuid
+from utils import NoUmlauts, SepaClean
+from pdfjobs import PDFJobs
+from archive import MakeZip, ZipOptions, ZipOutput
+from timing import Span
+
+# The export pipeline shared by the GUI (main.py) and the batch CLI (cli.py).
+# Nothing in here talks to the user: problems are raised or returned so the
+# caller can show a dialog or print a diagnostic as appropriate.
+
+def SepaConfig(payer_name, payer_iban, payer_bic, currency, reference, experiment, pdf_engine="platypus"):
+    return {
+        "name": SepaClean(payer_name),
+        "IBAN": payer_iban.strip().replace(" ", ""),
+        "BIC": payer_bic.strip(),
+        "batch": True,
+        # "domestic": True, # This seems to be required in CH (but ZKB accepts it without?), not sure if adding this will break things in DE
+        "currency": currency.strip().upper(),
+        "reference": SepaClean(reference),
+        "experiment": experiment,
+        "pdf_engine": pdf_engine
+    }
+
+def SafeBasename(experiment, reference):
+    # Build safe default filename
+    experiment_raw = NoUmlauts(experiment)
+    reference_raw = NoUmlauts(reference)
+    safe_experiment = experiment_raw.replace(" ", "_").replace(".", "").replace(":", "")
+    safe_reference = reference_raw.replace(" ", "_").replace(".", "").replace(":", "")
+    return f"{safe_experiment}_{safe_reference}"
+
+def InvalidAmounts(data_rows):
+    # SEPA only allows positive transfer amounts (can happen after "Add amount to all payoffs" with a negative value)
+    return [(idx, row) for idx, row in enumerate(data_rows, 1) if row["cents"] <= 0]
+
+def SepaPayment(row, config, execution_date, endtoend_id=None):
+    # The payment dict the SEPA engines take for one preview row
+    payment = {
+        "name": row["name"][:70],
+        "IBAN": row["iban"],
+        "amount": row["cents"],
+        "execution_date": execution_date,
+        "description": config["reference"][:140],
+        "endtoend_id": endtoend_id or row["endtoend_id"]
+    }
+    # Omit the BIC key when unknown: sepaxml emits an empty <BIC/>
+    # for "" which fails schema validation, but skips it when absent
+    if row.get("bic"):
+        payment["BIC"] = row["bic"]
+    return payment
+
+def _BlockNumbers(blocks):
+    # PmtInf number of each row, for consecutive blocks of the given sizes
+    for k, size in enumerate(blocks):
+        for _ in range(size):
+            yield k
+
+def NoProgress(stage, done=None, total=None):
+    # Default for the progress callbacks below. The GUI passes a
+    # progress.Progress, which may also raise to cancel the export.
+    pass
+
+def MakeSepa(config, data_rows, schema, engine="sepaxml", blocks=None, progress=None):
+    """Build the SEPA transfer for data_rows.
+
+    engine is "sepaxml" (the whole document is built in memory) or "stream"
+    (SepaStream: only the totals are kept, the XML is written straight to the
+    output file by WriteOutputs). Both produce the same document.
+
+    blocks optionally splits the rows into several PmtInf blocks: a list of
+    block sizes, consecutive in data_rows. Only the stream engine can do that.
+    progress is called with the number of rows added so far.
+    """
+    progress = progress or NoProgress
+    execution_date = datetime.date.today() + datetime.timedelta(days=2)
+    if blocks and len(blocks) > 1:
+        engine = "stream"
+
+    # Payment dicts for the rows; the stream engine asks for them again while writing
+    def payments():
+        if not blocks:
+            return (SepaPayment(row, config, execution_date) for row in data_rows)
+        return (dict(SepaPayment(row, config, execution_date), pmtinf=k)
+                for row, k in zip(data_rows, _BlockNumbers(blocks)))
+
+    if engine == "stream":
+        from sepastream import SepaStream
+
+        sepa = SepaStream(config, schema, payments)
+    elif engine == "sepaxml":
+        # sepaxml is imported on first use to keep it off the app's start-up path
+        from sepaxml import SepaTransfer
+
+        sepa = SepaTransfer(config, schema = schema, clean=True)
+    else:
+        raise ValueError(f"Unknown SEPA engine: {engine}")
+
+    # Unique across sessions so the bank's duplicate detection isn't tripped.
+    # Stored back on the rows so the anonymous PDF can identify each payment by it.
+    with Span("sepa build", rows=len(data_rows), engine=engine):
+        for row in data_rows:
+            row["endtoend_id"] = uuid.uuid4().hex
+        first_pass = payments()
+        for idx, row in enumerate(data_rows, 1):
+            progress("Building SEPA payments", idx - 1, len(data_rows))
+            try:
+                sepa.add_payment(next(first_pass))
+            except Exception as e:
+                raise Exception(f"Error in row {idx} ({row['name']} - {row['iban']}): {e}")
+    return sepa
+
+def WriteSepa(xml_path, sepa, archive=None):
+    """Write the SEPA XML of a MakeSepa result to xml_path.
+
+    With archive (a ZipOutput) it becomes the entry named after xml_path's
+    file name instead, and nothing is written next to it.
+    """
+    with Span("sepa export") as span:
+        if archive is not None:
+            span.set(bytes=_WriteSepaEntry(os.path.basename(xml_path), sepa, archive))
+        else:
+            _WriteSepaFile(xml_path, sepa)
+            span.set(bytes=os.path.getsize(xml_path))
+
+def _WriteSepaEntry(name, sepa, archive):
+    # Returns the size of the XML
+    if not hasattr(sepa, "write"):
+        data = sepa.export()
+        archive.writestr(name, data)
+        return len(data)
+
+    # Streaming engine: validated before it goes into the zip
+    from sepastream import ValidateSepaFile
+
+    with archive.stream(name) as out:
+        sepa.write(out)
+        size = out.tell()
+        out.seek(0)
+        ValidateSepaFile(out, sepa.schema)
+    return size
+
+def _WriteSepaFile(xml_path, sepa):
+    if hasattr(sepa, "write"):
+        # Streaming engine: written straight to the file, then validated from it
+        from sepastream import ValidateSepaFile
+
+        try:
+            with open(xml_path, "wb") as out:
+                sepa.write(out)
+            ValidateSepaFile(xml_path, sepa.schema)
+        except Exception:
+            # Don't leave a broken or invalid payment file behind
+            if os.path.exists(xml_path):
+                os.remove(xml_path)
+            raise
+    else:
+        with open(xml_path, "wb") as out:
+            out.write(sepa.export())
+
+def OpenArchive(base_path, zip_output, password=None, zip_options=None):
+    """The ZipOutput to write base_path's outputs into directly, or None.
+
+    None means loose files, zipped afterwards by WriteDocuments if
+    zip_output is set: when direct zipping is off in zip_options, or when
+    the archive can't be created (WriteDocuments then reports why).
+    """
+    zip_options = zip_options or ZipOptions({})
+    if not zip_output or not zip_options["direct"]:
+        return None
+    try:
+        return ZipOutput(base_path + ".zip", password, zip_options["compression"], zip_options["compresslevel"])
+    except Exception:
+        return None
+
+def WriteOutputs(base_path, sepa, config, data_rows, zip_output=False, password=None, pdfs=None, zip_options=None,
+                 progress=None):
+    """Write the XML, the regular and the anonymous PDF for base_path.
+
+    The XML is mandatory, so a failure there is raised. PDF and zip problems
+    are collected instead and returned alongside the list of files that ended
+    up on disk: (output_files, problems). When zip_output is set, the outputs
+    end up in base_path + ".zip" instead (see archive.py for zip_options).
+
+    pdfs is the PDFJobs of this export, if the caller already started it
+    (e.g. to print); by default the PDFs are rendered here, one by one.
+    progress is called at the start of every stage; if it raises (the user
+    cancelled), nothing of this export is left on disk.
+    """
+    progress = progress or NoProgress
+    xml_path = base_path + ".xml"
+    progress("Writing SEPA XML")
+    archive = OpenArchive(base_path, zip_output, password, zip_options)
+    if archive is None:
+        WriteSepa(xml_path, sepa)
+        return WriteDocuments(base_path, [xml_path], config, data_rows, zip_output, password, pdfs, zip_options,
+                              progress=progress)
+
+    # Straight into the zip; it only appears once everything is in it
+    with archive:
+        WriteSepa(xml_path, sepa, archive)
+        return WriteDocuments(base_path, [], config, data_rows, zip_output, password, pdfs, zip_options, archive,
+                              progress=progress)
+
+def WriteDocuments(base_path, files, config, data_rows, zip_output=False, password=None, pdfs=None,
+                   zip_options=None, archive=None, progress=None):
+    """Add the PDFs for data_rows to the already written files and zip them.
+
+    With archive, the files are already in that ZipOutput and the PDFs are
+    added to it as well; the caller commits it. Returns (output_files,
+    problems) like WriteOutputs. If anything raises, the files are removed.
+    """
+    generated_files = list(files)
+    try:
+        return _WriteDocuments(base_path, generated_files, config, data_rows, zip_output, password, pdfs,
+                               zip_options, archive, progress or NoProgress)
+    except Exception:
+        for f in generated_files:
+            if os.path.exists(f):
+                os.remove(f)
+        raise
+
+def _WriteDocuments(base_path, generated_files, config, data_rows, zip_output, password, pdfs, zip_options, archive,
+                    progress):
+    # generated_files is extended in place, so WriteDocuments can clean up
+    zip_options = zip_options or ZipOptions({})
+    if pdfs is None:
+        pdfs = PDFJobs(config, data_rows, use_process=False)
+    # The anonymous PDF renders in the worker while the regular one renders here
+    pdfs.start_anonymous()
+
+    # Generate PDF next to XML with same base name, plus an
+    # anonymous twin that lists only the End-to-End IDs (no names/IBANs).
+    # Each PDF is attempted independently so a failure in one still
+    # produces the other.
+    problems = []
+    for path, anon in ((base_path + ".pdf", False), (base_path + "_anonymous.pdf", True)):
+        progress("Rendering anonymous PDF" if anon else "Rendering PDF")
+        try:
+            if archive is not None:
+                data = pdfs.anonymous() if anon else pdfs.regular()
+                archive.writestr(os.path.basename(path), data, zip_options["pdf_compression"])
+            else:
+                generated_files.append(pdfs.save(path, anonymous=anon))
+        except Exception as e:
+            problems.append(f"{os.path.basename(path)}: {e}")
+
+    if archive is not None:
+        return [archive.zip_path], problems
+
+    if zip_output:
+        progress("Zipping")
+        zip_path = base_path + ".zip"
+        try:
+            MakeZip(zip_path, generated_files, password, zip_options)
+            # Bundled successfully: replace the loose files with the zip.
+            for f in generated_files:
+                os.remove(f)
+            generated_files[:] = [zip_path]
+        except Exception as e:
+            problems.append(f"Zip: {e}")
+
+    return generated_files, problems
@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import atexit
+import hashlib
+import tempfile
+from functools import lru_cache
+from array import array
+
+# Shared IBAN validation and BIC lookup. The same participants come back
+# session after session, so results are memoized in-process and, optionally,
+# in a small on-disk cache. The disk cache never stores IBANs in clear: keys
+# are SHA-256 hashes of the normalized IBAN and values only the verdict and
+# BIC. It is thrown away whenever the installed schwifty (and with it the
+# bank registry) changes version.
+#
+# schwifty loads its bank registry on first use, which is slow, so it is only
+# imported inside the functions below and the disk cache is only read when
+# the first lookup happens.
+
+_disk_path = None
+_disk_entries = None
+_disk_new = {}
+_save_registered = False
+
+def NormalizeIBAN(iban_raw):
+    # Same normalization schwifty applies: drop all whitespace, upper-case
+    return "".join(iban_raw.split()).upper()
+
+def IBANHash(iban):
+    return hashlib.sha256(NormalizeIBAN(iban).encode("ascii", "replace")).hexdigest()
+
+def UseIBANCache(path):
+    """Back the IBAN lookups with the on-disk cache at path.
+
+    An unreadable cache or one written by another schwifty version is
+    ignored (and replaced on the next save). New entries are saved at exit,
+    or earlier via SaveIBANCache. Calling it again with the same path (e.g.
+    once per file in a long-lived worker) keeps the lookups made so far.
+    """
+    global _disk_path, _disk_entries, _save_registered
+    if path == _disk_path:
+        return
+    _disk_path = path
+    _disk_entries = None
+    _Lookup.cache_clear()
+    if not _save_registered:
+        atexit.register(SaveIBANCache)
+        _save_registered = True
+
+def _ReadCache(path):
+    import schwifty
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("schwifty") == schwifty.__version__:
+            return data.get("entries", {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}
+
+def SaveIBANCache():
+    """Write newly looked-up IBANs to the disk cache, if one is in use.
+
+    The file is re-read and merged first so several processes sharing one
+    cache don't drop each other's entries, then replaced atomically.
+    """
+    if not _disk_path or not _disk_new:
+        return
+    import schwifty
+
+    entries = _ReadCache(_disk_path)
+    entries.update(_disk_new)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(_disk_path)), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"schwifty": schwifty.__version__, "entries": entries}, f)
+        os.replace(tmp_path, _disk_path)
+        _disk_new.clear()
+    except OSError:
+        # The cache is only an optimisation; failing to write it is harmless
+        pass
+
+@lru_cache(maxsize=8192)
+def _Lookup(iban):
+    # Returns (bic, error) for a normalized IBAN, consulting the disk cache
+    # before the schwifty registry
+    global _disk_entries
+    from schwifty import IBAN
+
+    key = None
+    if _disk_path:
+        if _disk_entries is None:
+            _disk_entries = _ReadCache(_disk_path)
+        key = IBANHash(iban)
+        if key in _disk_entries:
+            bic, error = _disk_entries[key]
+            return bic, error
+
+    try:
+        bic = IBAN(iban).bic
+        result = (str(bic) if bic else None, None)
+    except Exception as e:
+        result = (None, str(e) or type(e).__name__)
+
+    if key is not None:
+        _disk_entries[key] = _disk_new[key] = list(result)
+    return result
+
+def ClearIBANLookups():
+    # Forget the in-process lookups (not the disk cache), e.g. to time cold lookups
+    _Lookup.cache_clear()
+
+def ValidateIBAN(iban_raw):
+    """Validate iban_raw and look up its BIC.
+
+    Returns (iban, bic) with the IBAN in compact form and the BIC as a string
+    (None if unknown). Raises ValueError with schwifty's message if the IBAN
+    is not valid.
+    """
+    iban = NormalizeIBAN(iban_raw)
+    bic, error = _Lookup(iban)
+    if error:
+        raise ValueError(error)
+    return iban, bic
+
+
+# Verdicts of PrevalidateIBANs. Anything but IBAN_OK means the IBAN is
+# certainly invalid; IBAN_OK only means it is worth asking schwifty (which
+# also checks the country specific BBAN structure and finds the BIC).
+IBAN_OK = 0
+IBAN_INVALID_CHARACTERS = 1
+IBAN_UNKNOWN_COUNTRY = 2
+IBAN_INVALID_LENGTH = 3
+IBAN_INVALID_CHECKSUM = 4
+
+_IBAN_SHAPE = re.compile(r"[A-Z]{2}\d{2}[A-Z0-9]+")
+
+# A=10, B=11, ..., Z=35 as in ISO 7064 mod 97-10
+_NUMERIFY = {ord(c): str(i) for i, c in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZ", 10)}
+
+@lru_cache(maxsize=None)
+def _IBANLength(country_code):
+    # None for countries schwifty doesn't know
+    from schwifty import registry
+
+    try:
+        return registry.get_iban_spec(country_code).iban_length
+    except Exception:
+        return None
+
+def PrevalidateIBANs(ibans):
+    """Cheaply check a whole column of IBANs before any schwifty lookups.
+
+    Checks characters, country code, length per country and the mod-97
+    checksum, in the same order schwifty does, and returns an array of
+    verdicts (IBAN_OK or one of the IBAN_* error codes), one per input.
+    """
+    verdicts = array("B", bytes(len(ibans)))
+    for i, iban in enumerate(map(NormalizeIBAN, ibans)):
+        if not _IBAN_SHAPE.fullmatch(iban):
+            verdicts[i] = IBAN_INVALID_CHARACTERS
+            continue
+        length = _IBANLength(iban[:2])
+        if length is None:
+            verdicts[i] = IBAN_UNKNOWN_COUNTRY
+        elif length != len(iban):
+            verdicts[i] = IBAN_INVALID_LENGTH
+        elif int((iban[4:] + iban[:4]).translate(_NUMERIFY)) % 97 != 1:
+            verdicts[i] = IBAN_INVALID_CHECKSUM
+    return verdicts
+
+def IBANErrorMessage(verdict, iban):
+    # Same wording as the corresponding schwifty exceptions
+    iban = NormalizeIBAN(iban)
+    if verdict == IBAN_INVALID_CHARACTERS:
+        return f"Invalid characters in IBAN {iban}"
+    if verdict == IBAN_UNKNOWN_COUNTRY:
+        return f"Unknown country-code '{iban[:2]}'"
+    if verdict == IBAN_INVALID_LENGTH:
+        return "Invalid IBAN length"
+    if verdict == IBAN_INVALID_CHECKSUM:
+        return "Invalid checksum digits"
+    return None
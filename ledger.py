@@ -0,0 +1,268 @@
+import os
+import hmac
+import json
+import sqlite3
+import hashlib
+import secrets
+import datetime
+
+from iban import IBANHash
+from rows import TotalCents
+from timing import Span
+
+# A local record of every batch that was exported, so "was this person
+# already paid for session X?" can be answered without opening old zips.
+# One SQLite file holds a row per batch (experiment, reference, outputs)
+# and a row per transfer (End-to-End ID, name, amount, session). IBANs are
+# only stored as HMAC-SHA-256 hashes with a random key created with the
+# ledger and kept in its meta table: IBANs are so predictable that a plain
+# hash could be reversed by trying them all, and the key also keeps the
+# hashes of two ledgers from being matched against each other. Look-ups by
+# IBAN hash the IBAN typed in and go through the index on the hash.
+#
+# Each export is written in one transaction, so a batch is either recorded
+# completely or not at all, and several CLI workers can record at the same
+# time (SQLite serializes the writers).
+#
+# Before an export FindDuplicates checks the batch against the ledger: the
+# .pay files by a SHA-256 of their content (the same file imported twice)
+# and every payment by (IBAN hash, amount, experiment) (someone paid twice
+# for the same experiment, e.g. in two overlapping batches). Both go through
+# indexes, so the check costs about the same for one year of history or ten.
+
+# Bumped when the tables change; _Connect upgrades older files
+_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    experiment TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    payments INTEGER NOT NULL,
+    total_cents INTEGER NOT NULL,
+    outputs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id),
+    endtoend_id TEXT,
+    iban_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    session TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    batch_id INTEGER NOT NULL REFERENCES batches(id),
+    name TEXT NOT NULL,
+    file_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batches_experiment ON batches(experiment);
+DROP INDEX IF EXISTS transactions_iban;
+CREATE INDEX IF NOT EXISTS transactions_payment ON transactions(iban_hash, amount_cents);
+CREATE INDEX IF NOT EXISTS sources_hash ON sources(file_hash);
+CREATE INDEX IF NOT EXISTS transactions_endtoend ON transactions(endtoend_id);
+CREATE INDEX IF NOT EXISTS transactions_batch ON transactions(batch_id);
+"""
+
+def _Connect(ledger_path):
+    # Another process may be recording; wait for it rather than failing
+    connection = sqlite3.connect(ledger_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    if connection.execute("PRAGMA user_version").fetchone()[0] < _VERSION:
+        connection.executescript(_SCHEMA)
+        with connection:
+            # Under a write lock and checked again, so two processes opening
+            # an old file at the same time don't both create a key
+            connection.execute("BEGIN IMMEDIATE")
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < _VERSION:
+                key = secrets.token_bytes(32)
+                connection.execute("INSERT INTO meta (name, value) VALUES ('iban_key', ?)", (key.hex(),))
+                if version:
+                    # Earlier versions stored the plain IBANHash, which is
+                    # exactly what the keyed hash is computed from
+                    connection.create_function("keyed", 1, lambda digest: _Keyed(key, digest))
+                    connection.execute("UPDATE transactions SET iban_hash = keyed(iban_hash)")
+                connection.execute(f"PRAGMA user_version = {_VERSION}")
+    return connection
+
+def _Keyed(key, digest):
+    return hmac.new(key, digest.encode("ascii"), hashlib.sha256).hexdigest()
+
+def _IBANHasher(connection):
+    # The ledger's hash function for IBANs: its key applied to IBANHash
+    key = bytes.fromhex(connection.execute("SELECT value FROM meta WHERE name = 'iban_key'").fetchone()[0])
+    return lambda iban: _Keyed(key, IBANHash(iban))
+
+def FileHash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def SourceFiles(paths):
+    # The (file name, content hash) pairs RecordBatch and FindDuplicates take
+    return [(os.path.basename(path), FileHash(path)) for path in paths]
+
+def RecordBatch(ledger_path, config, data_rows, outputs, sources=()):
+    """Record an exported batch and its transfers; returns the batch id.
+
+    data_rows are the rows as exported (with their End-to-End IDs), outputs
+    the files that were written and sources the SourceFiles of the .pay
+    files the batch was made from.
+    """
+    with Span("ledger record", rows=len(data_rows)):
+        created = datetime.datetime.now().isoformat(timespec="seconds")
+        connection = _Connect(ledger_path)
+        try:
+            iban_hash = _IBANHasher(connection)
+            with connection:
+                batch_id = connection.execute(
+                    "INSERT INTO batches (created, experiment, reference, currency, payments, total_cents, outputs) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (created, config["experiment"], config["reference"], config["currency"], len(data_rows),
+                     TotalCents(data_rows), json.dumps([os.path.abspath(p) for p in outputs]))
+                ).lastrowid
+                connection.executemany(
+                    "INSERT INTO transactions (batch_id, endtoend_id, iban_hash, name, amount_cents, session) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    ((batch_id, row.get("endtoend_id"), iban_hash(row["iban"]), row["name"], row["cents"], row.get("session"))
+                     for row in data_rows)
+                )
+                connection.executemany("INSERT INTO sources (batch_id, name, file_hash) VALUES (?, ?, ?)",
+                                       ((batch_id, name, file_hash) for name, file_hash in sources))
+        finally:
+            connection.close()
+    return batch_id
+
+def FindPayments(ledger_path, iban=None, endtoend_id=None, experiment=None, name=None, limit=1000):
+    """Look up recorded transfers, newest first.
+
+    iban, endtoend_id and experiment must match exactly and are answered
+    from the indexes; name matches any part of the name, case-insensitive
+    (a scan, so best combined with one of the others). Criteria left out
+    (None or "") match everything. Returns at most limit dicts with the
+    transfer and its batch's created, experiment, reference and currency;
+    amounts are in cents.
+    """
+    conditions, params = [], []
+    if iban:
+        conditions.append("t.iban_hash = ?")
+        params.append(iban)
+    if endtoend_id:
+        conditions.append("t.endtoend_id = ?")
+        params.append(endtoend_id.strip())
+    if experiment:
+        conditions.append("b.experiment = ?")
+        params.append(experiment.strip())
+    if name:
+        conditions.append("t.name LIKE ? ESCAPE '\\'")
+        params.append("%" + name.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    if not os.path.exists(ledger_path):
+        return []
+    with Span("ledger lookup"):
+        connection = _Connect(ledger_path)
+        try:
+            if iban:
+                params[0] = _IBANHasher(connection)(iban)
+            rows = connection.execute(
+                "SELECT b.id AS batch_id, b.created, b.experiment, b.reference, b.currency, "
+                "t.endtoend_id, t.name, t.amount_cents, t.session "
+                "FROM transactions t JOIN batches b ON b.id = t.batch_id"
+                # Rows are only ever appended, so the rowid order is the
+                # newest-first order and needs no sort
+                f"{where} ORDER BY t.id DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        finally:
+            connection.close()
+    return [dict(row) for row in rows]
+
+def FindDuplicates(ledger_path, data_rows, experiment, sources=()):
+    """Check a batch against the earlier exports in the ledger.
+
+    Returns (files, rows):
+      files - for each of sources (see SourceFiles) exported before, a dict
+              with its name and the batch's id, created, experiment and
+              reference
+      rows  - {index in data_rows: [earlier payments]} for the rows whose
+              IBAN and amount were already paid under experiment, each
+              earlier payment a dict with the batch's id, created and
+              reference and the payment's name and End-to-End ID
+    """
+    if not os.path.exists(ledger_path):
+        return [], {}
+    with Span("duplicate check", rows=len(data_rows)) as span:
+        connection = _Connect(ledger_path)
+        try:
+            iban_hash = _IBANHasher(connection)
+            files = []
+            for name, file_hash in sources:
+                files.extend(dict(row, name=name) for row in connection.execute(
+                    "SELECT b.id AS batch_id, b.created, b.experiment, b.reference FROM sources s "
+                    "JOIN batches b ON b.id = s.batch_id WHERE s.file_hash = ? ORDER BY b.id", (file_hash,)))
+
+            # The batch goes into a temporary table and is joined against the
+            # (IBAN hash, amount) index in one query, not one query per row.
+            # CROSS JOIN makes SQLite keep that order instead of starting
+            # from every earlier payment of the experiment.
+            connection.execute("CREATE TEMP TABLE candidates (position INTEGER, iban_hash TEXT, amount_cents INTEGER)")
+            connection.executemany("INSERT INTO candidates VALUES (?, ?, ?)",
+                                   ((i, iban_hash(row["iban"]), row["cents"]) for i, row in enumerate(data_rows)))
+            rows = {}
+            for row in connection.execute(
+                    "SELECT c.position, b.id AS batch_id, b.created, b.reference, t.name, t.endtoend_id FROM candidates c "
+                    "CROSS JOIN transactions t ON t.iban_hash = c.iban_hash AND t.amount_cents = c.amount_cents "
+                    "JOIN batches b ON b.id = t.batch_id WHERE b.experiment = ? ORDER BY c.position, b.id", (experiment,)):
+                earlier = dict(row)
+                rows.setdefault(earlier.pop("position"), []).append(earlier)
+        finally:
+            connection.close()
+        span.set(files=len(files), duplicates=len(rows))
+    return files, rows
+
+def BatchesOf(ledger_path, endtoend_ids):
+    """The ids of the batches that exported any of endtoend_ids."""
+    endtoend_ids = list(endtoend_ids)
+    if not endtoend_ids or not os.path.exists(ledger_path):
+        return set()
+    batch_ids = set()
+    connection = _Connect(ledger_path)
+    try:
+        # SQLite limits the number of parameters per statement
+        for start in range(0, len(endtoend_ids), 500):
+            chunk = endtoend_ids[start:start + 500]
+            batch_ids.update(row[0] for row in connection.execute(
+                f"SELECT DISTINCT batch_id FROM transactions WHERE endtoend_id IN ({', '.join('?' * len(chunk))})", chunk))
+    finally:
+        connection.close()
+    return batch_ids
+
+def LoadBatches(ledger_path, batch_ids):
+    """The batches with the given ids as dicts (the batches columns, outputs
+    as a list), each with its transfers in "transfers" (as FindPayments,
+    without the batch fields). Unknown ids are left out."""
+    if not os.path.exists(ledger_path):
+        return []
+    batches = []
+    connection = _Connect(ledger_path)
+    try:
+        for batch_id in sorted(batch_ids):
+            row = connection.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if row is None:
+                continue
+            payments = connection.execute("SELECT endtoend_id, name, amount_cents, session FROM transactions "
+                                          "WHERE batch_id = ? ORDER BY id", (batch_id,)).fetchall()
+            batches.append(dict(row, outputs=json.loads(row["outputs"]), transfers=[dict(p) for p in payments]))
+    finally:
+        connection.close()
+    return batches
@@ -14,43 +14,53 @@ version_date = "15 June 2026"
 github_link = "https://github.com/jokannes/zTreeSepa"
 
 
+# Startup profiling (set ZTREESEPA_PROFILE=1 to see per-import/phase timings).
+# Imported first so it can time everything that follows.
+from timing import Phase, ProfileImports, WarmUp, EnableTracing, Tracing, StartTrace, SaveTrace, TraceSpans, SummarizeSpans, WriteTraceReport
+ProfileImports()
+
+
 # Packages
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
 import sys
+import queue
 import tempfile
-import datetime, uuid
+import threading
+import multiprocessing
 import webbrowser
-from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
-from schwifty import IBAN
-from sepaxml import SepaTransfer
+from collections import Counter
+from decimal import Decimal, ROUND_HALF_UP
 
 
 # Import own functions
-from utils import NoUmlauts, SepaClean, DecodeFile
-from settings import LoadSettings
-from pdf import MakePDF
-from parse import ParseFile
-from archive import MakeZip
-
-
-# Get correct working directory
-if getattr(sys, 'frozen', False):
-    # Running as exe
-    app_path = os.path.dirname(sys.executable)
-else:
-    # Running as script
-    app_path = os.path.dirname(os.path.abspath(__file__))
-
-
-# Load settings (payer banking info is here)
-settings_file = os.path.join(app_path, "settings.json")
-settings = LoadSettings(settings_file)
-
-
-# Function for reading a .pay file
-def ImportFile(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder):
+from utils import SepaClean, DecodeFile
+from settings import LoadSettings, SaveSettings
+from iban import ValidateIBAN, UseIBANCache, NormalizeIBAN
+from pdfjobs import PDFJobs
+from parse import ParseRows, ShowDiscarded
+from preview import MakePaymentTable
+from rows import PaymentRows, Cents
+from rules import ParseRules, ApplyRules, RulesSummary, DescribeSummary
+from merge import DropComboTwins, ReadSessions, AggregateByIBAN
+from export import SepaConfig, SafeBasename, InvalidAmounts, MakeSepa, WriteOutputs
+from split import BatchLimits, SplitRows, WriteBatch
+from archive import ZipOptions
+from ledger import SourceFiles, RecordBatch, FindPayments, FindDuplicates
+from reconcile import Reconcile
+from watch import WatchFolder
+from tail import TailParser
+from progress import RunInBackground, Cancelled
+# Heavy third-party packages (schwifty, sepaxml, reportlab, pyzipper, chardet)
+# are imported by the modules above on first use, and warmed up in the
+# background once the main window is shown (see the end of this file).
+Phase("imports done")
+
+
+# The SepaConfig for an import from the fields of the main window, or None
+# (after telling the user) if something is missing or invalid
+def ImportConfig(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder):
     payer_name = SepaClean(payer_name)
     payer_iban = payer_iban.strip().replace(" ", "")
     payer_bic = payer_bic.strip()
@@ -65,38 +75,168 @@ def ImportFile(payer_name, payer_iban, payer_bic, currency, reference, reference
         return
 
     try:
-        IBAN(payer_iban)
+        ValidateIBAN(payer_iban)
     except Exception:
         messagebox.showerror("Invalid IBAN", "Payer IBAN is not valid.")
         return
 
-    file_path = filedialog.askopenfilename(filetypes=[("Import payment file", "*.pay")])
-    if not file_path:
+    return SepaConfig(payer_name, payer_iban, payer_bic, currency, reference, experiment, settings.get("pdf_engine", "platypus"))
+
+
+# Function for reading one or several .pay files (several sessions are merged
+# into one batch)
+def ImportFile(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder):
+    config = ImportConfig(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder)
+    if config is None:
         return
 
+    file_paths = filedialog.askopenfilenames(filetypes=[("Import payment file", "*.pay")], initialdir=watcher.folder if watcher else None)
+    if not file_paths:
+        return
+    file_paths = DropComboTwins(list(file_paths))
+
+    # Decoding and parsing (IBAN checks included) run on a worker thread; the
+    # files of several sessions are read in parallel by worker processes
+    # (the content hashes are for the duplicate check, see ledger.py). Files
+    # the watch folder has already read are taken from there.
+    def read(progress):
+        sources = SourceFiles(file_paths)
+        cached = watcher.result if watcher else None
+        if len(file_paths) > 1:
+            progress("Reading sessions", 0, len(file_paths))
+            return ReadSessions(file_paths, progress=lambda done, total: progress("Reading sessions", done, total), cached=cached) + (sources,)
+        result = cached and cached(file_paths[0])
+        if result:
+            return result + (sources,)
+        progress("Reading file")
+        raw_file = DecodeFile(file_paths[0])
+        return ParseRows(raw_file, lambda count: progress("Checking names and IBANs", count)) + (sources,)
+
     try:
-        raw_file = DecodeFile(file_path)
-        rows = ParseFile(raw_file)
+        StartTrace()
+        rows, discarded_rows, sources = RunInBackground(root, "Import", read)
+        ShowDiscarded(discarded_rows)
 
         if not rows:
             messagebox.showwarning("No Valid Payments", "No valid payment entries were found.")
             return
 
-        rows.sort(key=lambda r: r["name"].lower())
-        FileView(rows, {
-            "name": payer_name,
-            "IBAN": payer_iban,
-            "BIC": payer_bic,
-            "batch": True,
-            # "domestic": True, # This seems to be required in CH (but ZKB accepts it without?), not sure if adding this will break things in DE
-            "currency": currency,
-            "reference": SepaClean(reference),
-            "experiment": experiment
-        })
+        FileView(PaymentRows(rows, "name"), config, SaveTrace(), sessions=len(file_paths), sources=sources)
+    except Cancelled:
+        return
     except Exception as e:
         messagebox.showerror("Error", str(e))
 
 
+# Live view of a .pay file zTree is still writing (File menu), so invalid
+# IBANs can be fixed while the participants are still in the lab. A worker
+# thread reads what was appended every "monitor_interval" seconds (see
+# tail.py); new valid and invalid rows are added to the list as they arrive.
+# make_config is called for the SepaConfig when continuing to the preview.
+def ShowPaymentMonitor(parent, make_config):
+    pay_path = filedialog.askopenfilename(filetypes=[("Payment file", "*.pay")], initialdir=watcher.folder if watcher else None)
+    if not pay_path:
+        return
+
+    tail = TailParser(pay_path)
+    updates = queue.Queue()
+    stop = threading.Event()
+    interval = settings.get("monitor_interval", 1)
+
+    def follow():
+        while not stop.is_set():
+            try:
+                updates.put(tail.read())
+            except Exception as e:
+                updates.put(e)
+            stop.wait(interval)
+
+    window = tk.Toplevel(parent)
+    window.title(f"Payment Monitor - {os.path.basename(pay_path)}")
+    window.geometry("850x400")
+
+    status = tk.Label(window, text = "Waiting for the file...", anchor="w")
+    status.pack(fill="x", padx=10, pady=(10, 0))
+
+    columns = ("Status", "Name", "IBAN", "Amount", "Problem")
+    table_frame = tk.Frame(window)
+    tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+    for col in columns:
+        tree.heading(col, text = col)
+        tree.column(col, width=60 if col in ("Status", "Amount") else 200, anchor="e" if col == "Amount" else "w")
+    tree.tag_configure("invalid", background="#f4c7c3")
+    scrollbar = tk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    scrollbar.pack(side="right", fill="y")
+    tree.pack(side="left", fill="both", expand=True)
+    table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def add(rows, discarded_rows):
+        for row in rows:
+            tree.insert("", "end", values=("OK", row["name"], row["iban"], f"{row['amount']:.2f}", ""))
+        for row in discarded_rows:
+            tree.insert("", "end", values=("Invalid", row["name"], row["iban"], "", row["reason"]), tags=("invalid",))
+        if rows or discarded_rows:
+            tree.see(tree.get_children()[-1])
+        status.config(text = f"{len(tail.rows)} valid and {len(tail.discarded_rows)} invalid rows so far")
+
+    def apply(update):
+        if isinstance(update, Exception):
+            status.config(text = f"Could not read the file: {update}")
+            return
+        rows, discarded_rows, restarted = update
+        if restarted:
+            # The file was rewritten: show it again from the start
+            tree.delete(*tree.get_children())
+        add(rows, discarded_rows)
+
+    def poll():
+        if not window.winfo_exists():
+            return
+        while True:
+            try:
+                apply(updates.get_nowait())
+            except queue.Empty:
+                break
+        window.after(200, poll)
+
+    def close():
+        stop.set()
+        window.destroy()
+
+    def continue_to_preview():
+        config = make_config()
+        if config is None:
+            return
+        # The file is complete now: stop following it and read the rest,
+        # including a last line without a line break
+        stop.set()
+        reader.join()
+        try:
+            while not updates.empty():
+                apply(updates.get_nowait())
+            apply(tail.read(final=True))
+        except Exception as e:
+            messagebox.showerror("Error", str(e), parent=window)
+            return
+        if not tail.rows:
+            messagebox.showwarning("No Valid Payments", "No valid payment entries were found.", parent=window)
+            return
+        window.destroy()
+        StartTrace()
+        FileView(PaymentRows(tail.rows, "name"), config, SaveTrace(), sources=SourceFiles([pay_path]))
+
+    btn_frame = tk.Frame(window)
+    btn_frame.pack(pady=(0, 10))
+    tk.Button(btn_frame, text = "Continue to preview", command = continue_to_preview).grid(row=0, column=0, padx=10)
+    tk.Button(btn_frame, text = "Close", command = close).grid(row=0, column=1, padx=10)
+    window.protocol("WM_DELETE_WINDOW", close)
+
+    reader = threading.Thread(target=follow, daemon=True)
+    reader.start()
+    poll()
+
+
 # Yes/No prompt asking whether to print the regular (non-anonymous) payment
 # PDF. Built as a custom Toplevel rather than messagebox.askyesno so it carries
 # no system question-mark icon. Returns True if the user chose Yes.
@@ -221,70 +361,352 @@ def AskZipOptions(parent):
     return result if state["ok"] else None
 
 
-# Set up the file viewer for after a .pay file has been opened
-def FileView(data_rows, config):
-    preview_window = tk.Toplevel(root)
-    preview_window.title("Payment Preview")
-    preview_window.geometry("800x400")
-
-    tree_frame = tk.Frame(preview_window)
-    tree_frame.pack(fill="both", expand=True, pady=10)
-    
-    # Scrollbars
-    tree_scroll_y = tk.Scrollbar(tree_frame, orient="vertical")
-    tree_scroll_x = tk.Scrollbar(tree_frame, orient="horizontal")
-    
-    # Treeview widget
-    tree = ttk.Treeview(
-        tree_frame,
-        columns=("Index", "Name", "IBAN", "BIC", "Amount"),
-        show="headings",
-        yscrollcommand=tree_scroll_y.set,
-        xscrollcommand=tree_scroll_x.set
-    )
-    
-    # Configure scrollbars
-    tree_scroll_y.config(command=tree.yview)
-    tree_scroll_x.config(command=tree.xview)
-    
-    tree_scroll_y.pack(side="right", fill="y")
-    tree_scroll_x.pack(side="bottom", fill="x")
+# Window listing the spans of the last import or export (Help menu). Only
+# filled when tracing is on, see timing.py.
+def ShowLastRunTimings(parent):
+    if not Tracing():
+        messagebox.showinfo("Last Run Timings", 'Tracing is off. Set "trace" to true in settings.json (or the environment variable ZTREESEPA_TRACE to 1) and restart.')
+        return
+    spans = TraceSpans()
+    if not spans:
+        messagebox.showinfo("Last Run Timings", "Nothing has been timed yet. Import a payment file first.")
+        return
+
+    window = tk.Toplevel(parent)
+    window.title("Last Run Timings")
+    window.geometry("760x400")
+
+    columns = ("ms", "rows", "bytes", "peak")
+    tree = ttk.Treeview(window, columns=columns)
+    tree.heading("#0", text="Stage")
+    tree.column("#0", width=260)
+    for column, title in zip(columns, ("Time (ms)", "Rows", "Bytes", "Peak memory (bytes)")):
+        tree.heading(column, text=title)
+        tree.column(column, width=110, anchor="e")
+
+    def cell(value):
+        return "" if value is None else f"{value:,}"
+
+    # Per stage first, then every span (nested spans indented)
+    totals = tree.insert("", "end", text="Totals per stage", open=True)
+    for entry in SummarizeSpans(spans):
+        tree.insert(totals, "end", text=f"{entry['name']} ({entry['count']}x)", values=(cell(entry["duration_ms"]), "", "", ""))
+    all_spans = tree.insert("", "end", text="All spans", open=False)
+    for span in spans:
+        tree.insert(all_spans, "end", text="    " * span["depth"] + span["name"],
+                    values=(cell(span["duration_ms"]), cell(span.get("rows")), cell(span.get("bytes")), cell(span.get("peak_bytes"))))
+
+    scrollbar = tk.Scrollbar(window, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    scrollbar.pack(side="right", fill="y")
+    tree.pack(fill="both", expand=True)
+
+
+# Search window for the payment ledger (File menu): everything paid to an
+# IBAN, under an experiment or with an End-to-End ID, newest first
+def ShowLedger(parent):
+    if not ledger_path:
+        messagebox.showinfo("Payment Ledger", 'The payment ledger is off. Set "ledger" to true in settings.json and restart.')
+        return
+
+    window = tk.Toplevel(parent)
+    window.title("Payment Ledger")
+    window.geometry("1000x450")
+
+    search_frame = tk.Frame(window)
+    search_frame.pack(fill="x", padx=10, pady=10)
+    fields = {}
+    for i, (key, label) in enumerate((("iban", "IBAN:"), ("name", "Name:"), ("experiment", "Experiment:"), ("endtoend_id", "End-to-End ID:"))):
+        tk.Label(search_frame, text = label).grid(row=i // 2, column=(i % 2) * 2, sticky="e", padx=(10, 2), pady=2)
+        fields[key] = tk.Entry(search_frame, width=36)
+        fields[key].grid(row=i // 2, column=(i % 2) * 2 + 1, sticky="w", pady=2)
+
+    columns = ("Date", "Experiment", "Reference", "Name", "Amount", "Session", "End-to-End ID")
+    table_frame = tk.Frame(window)
+    tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+    for col in columns:
+        tree.heading(col, text = col)
+        tree.column(col, width=70 if col == "Amount" else 140, anchor="e" if col == "Amount" else "w")
+    scrollbar = tk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    status = tk.Label(window, text = "", fg="gray", anchor="w")
+
+    limit = 1000
+
+    def search(event=None):
+        try:
+            found = FindPayments(ledger_path, limit=limit, **{key: entry.get().strip() for key, entry in fields.items()})
+        except Exception as e:
+            messagebox.showerror("Payment Ledger", f"Could not read the payment ledger:\n{e}", parent=window)
+            return
+        tree.delete(*tree.get_children())
+        for payment in found:
+            tree.insert("", "end", values=(payment["created"].replace("T", " "), payment["experiment"], payment["reference"], payment["name"],
+                                           f"{Decimal(payment['amount_cents']) / 100:.2f} {payment['currency']}",
+                                           payment["session"] or "", payment["endtoend_id"] or ""))
+        if len(found) == limit:
+            status.config(text = f"Showing the newest {limit} payments; narrow the search to see older ones.")
+        else:
+            status.config(text = f"{len(found)} payments")
+
+    tk.Button(search_frame, text = "Search", width=10, command=search).grid(row=0, column=4, rowspan=2, padx=10)
+    window.bind("<Return>", search)
+
+    status.pack(side="bottom", fill="x", padx=10, pady=(0, 5))
+    table_frame.pack(fill="both", expand=True, padx=10)
+    scrollbar.pack(side="right", fill="y")
     tree.pack(side="left", fill="both", expand=True)
-    
-    # Column headings and widths
-    for col in ("Index", "Name", "IBAN", "BIC", "Amount"):
+    search()
+
+
+# Check bank statements (camt.053/camt.054) against the exported batches
+# (File menu): which payments of each batch were paid, returned or are
+# still missing, see reconcile.py
+def ReconcileStatements(parent):
+    if not ledger_path:
+        messagebox.showinfo("Reconcile", 'The payment ledger is off. Set "ledger" to true in settings.json and restart.')
+        return
+    statement_paths = filedialog.askopenfilenames(filetypes=[("Bank statements (camt.053/camt.054)", "*.xml"), ("All files", "*.*")])
+    if not statement_paths:
+        return
+    try:
+        result = RunInBackground(parent, "Reconcile", lambda progress: Reconcile(ledger_path, list(statement_paths), progress=progress))
+    except Cancelled:
+        return
+    except Exception as e:
+        messagebox.showerror("Reconcile", f"Could not read the bank statements:\n{e}")
+        return
+    if not result["batches"]:
+        messagebox.showinfo("Reconcile", f"None of the {result['booked']} bookings in the statements belongs to a batch in the payment ledger.")
+        return
+
+    window = tk.Toplevel(parent)
+    window.title("Reconciliation")
+    window.geometry("900x450")
+
+    columns = ("Status", "Amount", "Booked", "Reason", "End-to-End ID")
+    tree = ttk.Treeview(window, columns=columns)
+    tree.heading("#0", text="Batch / Payment")
+    tree.column("#0", width=300)
+    for col in columns:
         tree.heading(col, text = col)
-        anchor = "e" if col == "Amount" else "w"
-        width = 60 if col in ("Index", "Amount") else 180
-        tree.column(col, width=width, anchor=anchor)
+        tree.column(col, width=80 if col != "End-to-End ID" else 240, anchor="e" if col == "Amount" else "w")
+    tree.tag_configure("problem", foreground="#a61c00")
+
+    def amount(cents):
+        return "" if cents is None else f"{Decimal(cents) / 100:.2f}"
+
+    # Batches with returned or missing payments are opened
+    for batch in result["batches"]:
+        problems = len(batch["returned"]) + len(batch["missing"])
+        item = tree.insert("", "end", open=bool(problems), tags=("problem",) if problems else (),
+                           text=f"{batch['created'][:10]} {batch['experiment']} - {batch['reference']}",
+                           values=(f"{len(batch['paid'])} paid, {len(batch['returned'])} returned, {len(batch['missing'])} missing", amount(batch["total_cents"])))
+        for status in ("returned", "missing", "paid"):
+            for payment in batch[status]:
+                tree.insert(item, "end", text=payment["name"], tags=("problem",) if status != "paid" else (),
+                            values=(status, amount(payment["amount_cents"]), payment.get("booking_date") or "",
+                                    payment.get("reason") or "", payment["endtoend_id"]))
+
+    notes = []
+    if result["unmatched"]:
+        notes.append(f"{len(result['unmatched'])} bookings have an End-to-End ID that is not in the payment ledger.")
+    if result["without_id"]:
+        notes.append(f"{result['without_id']} bookings have no End-to-End ID and could not be matched.")
+    tk.Label(window, text = " ".join(notes), fg="gray", anchor="w").pack(side="bottom", fill="x", padx=10, pady=(0, 5))
+
+    scrollbar = tk.Scrollbar(window, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    scrollbar.pack(side="right", fill="y")
+    tree.pack(fill="both", expand=True)
+
+
+# Set up the file viewer for after a .pay file has been opened. import_trace
+# holds the trace of reading the file (see timing.py), continued by each
+# export so its report covers the whole run. sessions is the number of .pay
+# files merged into data_rows; with more than one, each row shows its session.
+# sources are their SourceFiles, to recognize files that were exported before.
+def FileView(data_rows, config, import_trace=None, sessions=1, sources=()):
+    preview_window = tk.Toplevel(root)
+    preview_window.title("Payment Preview" if sessions == 1 else f"Payment Preview ({sessions} sessions)")
+    preview_window.geometry("800x400" if sessions == 1 else "900x400")
+
+    # Large (e.g. merged) batches get the virtualized table that only
+    # renders the rows currently visible
+    virtual = len(data_rows) >= settings.get("virtual_preview_threshold", 2000)
+    table = MakePaymentTable(preview_window, data_rows, virtual, sessions > 1)
+    table.pack(fill="both", expand=True, pady=10)
+
+    # Payments with the same IBAN and amount as one already exported for
+    # this experiment are highlighted. The check runs when the preview opens,
+    # after every change and once more before anything is written.
+    duplicates_label = tk.Label(preview_window, text = "", fg="#a61c00", anchor="w")
+
+    def check_duplicates():
+        if not ledger_path:
+            return [], {}
+        files, duplicates = FindDuplicates(ledger_path, data_rows, config["experiment"], sources)
+        table.set_flagged([data_rows[i] for i in duplicates])
+        if duplicates:
+            duplicates_label.config(text = f"{len(duplicates)} highlighted payments have the same IBAN and amount as payments already exported for this experiment.")
+            duplicates_label.pack(before=table.frame, fill="x", padx=10, pady=(10, 0))
+        else:
+            duplicates_label.pack_forget()
+        return files, duplicates
+
+    def recheck_duplicates():
+        try:
+            check_duplicates()
+        except Exception:
+            # Reported when generating; editing the preview must still work
+            pass
+
+    def duplicate_lines(files, duplicates):
+        lines = [f"{f['name']} was already exported on {f['created'].replace('T', ' ')} ({f['experiment']}, {f['reference']})." for f in files]
+        for i, earlier in list(duplicates.items())[:10]:
+            row = data_rows[i]
+            paid = ", ".join(f"{e['created'][:10]} ({e['reference']})" for e in earlier)
+            lines.append(f"{row['name']}, {row['amount']:.2f}: already paid on {paid}")
+        if len(duplicates) > 10:
+            lines.append(f"... and {len(duplicates) - 10} more")
+        return lines
+
+    try:
+        files, _ = check_duplicates()
+        if files:
+            messagebox.showwarning("Already Exported", "\n".join(duplicate_lines(files, {})), parent=preview_window)
+    except Exception as e:
+        messagebox.showwarning("Payment Ledger", f"Could not check the payment ledger for duplicates:\n{e}", parent=preview_window)
 
-    for idx, row in enumerate(data_rows, 1):
-        tree.insert("", "end", values=(idx, row["name"], row["iban"], row.get("bic") or "", f"{row['amount']:.2f}"))
+    # Payout rules (see rules.py): show-up fee, minimum, cap, rounding, ...
+    # applied to all amounts at once, with the totals before and after shown
+    # first. Rule sets can be saved by name in settings.json.
+    def payout_rules():
+        rule_sets = settings.get("payout_rules") or {}
 
-    def profit_masschange():
-        def apply_profit_masschange():
+        def computed():
+            # The new amounts, or None after reporting why there are none
+            try:
+                rules = ParseRules(rules_text.get("1.0", "end").splitlines())
+            except ValueError as e:
+                messagebox.showerror("Invalid Rule", str(e), parent=rules_window)
+                return None
+            return ApplyRules(data_rows.batch, rules)
+
+        def preview_rules():
+            amounts = computed()
+            if amounts is not None:
+                summary_label.config(text = DescribeSummary(RulesSummary(data_rows.batch, amounts), config["currency"]))
+
+        def load_rule_set(event=None):
+            rules_text.delete("1.0", "end")
+            rules_text.insert("1.0", "\n".join(rule_sets.get(rule_set.get(), [])))
+            summary_label.config(text = "")
+
+        def save_rule_set():
+            name = rule_set.get().strip()
+            if not name:
+                messagebox.showwarning("Missing Info", "Enter a name for the rule set.", parent=rules_window)
+                return
+            lines = [line.strip() for line in rules_text.get("1.0", "end").splitlines() if line.strip()]
             try:
-                delta = Decimal(entry_amount_change.get().strip().replace(",", ".")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            except InvalidOperation:
-                messagebox.showerror("Invalid Input", "Please enter a valid number.")
+                ParseRules(lines)
+                settings["payout_rules"] = dict(rule_sets, **{name: lines})
+                SaveSettings(settings_file, settings)
+            except ValueError as e:
+                messagebox.showerror("Invalid Rule", str(e), parent=rules_window)
+                return
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not save settings.json:\n{e}", parent=rules_window)
+                return
+            rule_sets[name] = lines
+            rule_set.config(values=sorted(rule_sets))
+
+        def apply_rules():
+            amounts = computed()
+            if amounts is None:
+                return
+            data_rows.batch.set_cents(amounts)
+            data_rows.changed("amount")
+            # Rules like a minimum can change the order by amount
+            if data_rows.sort_column == "amount":
+                data_rows.sort_by("amount", data_rows.descending)
+                table.refresh()
+            else:
+                table.refresh_amounts()
+            recheck_duplicates()
+            rules_window.destroy()
+
+        rules_window = tk.Toplevel(preview_window)
+        rules_window.title("Payout Rules")
+
+        tk.Label(rules_window, text = "Rule set:").grid(row=0, column=0, sticky="e", padx=(10, 2), pady=10)
+        rule_set = ttk.Combobox(rules_window, values=sorted(rule_sets), width=37)
+        rule_set.grid(row=0, column=1, sticky="w", pady=10)
+        rule_set.bind("<<ComboboxSelected>>", load_rule_set)
+
+        tk.Label(rules_window, text = "Rules:").grid(row=1, column=0, sticky="ne", padx=(10, 2))
+        rules_text = tk.Text(rules_window, width=40, height=8)
+        rules_text.grid(row=1, column=1, sticky="w")
+        tk.Label(rules_window, text = "One rule per line, applied in order, e.g.\nadd 5\nmin 10\nmax 40\nround up 0.50\nmultiply 1.5 session SESSION",
+                 fg="gray", anchor="nw", justify="left").grid(row=1, column=2, sticky="nw", padx=10)
+
+        summary_label = tk.Label(rules_window, text = "", anchor="w", justify="left")
+        summary_label.grid(row=2, column=1, columnspan=2, sticky="w", pady=10)
+
+        buttons = tk.Frame(rules_window)
+        buttons.grid(row=3, column=0, columnspan=3, pady=10)
+        tk.Button(buttons, text = "Preview totals", command = preview_rules).grid(row=0, column=0, padx=10)
+        tk.Button(buttons, text = "Save rule set", command = save_rule_set).grid(row=0, column=1, padx=10)
+        tk.Button(buttons, text = "Apply", command = apply_rules).grid(row=0, column=2, padx=10)
+        tk.Button(buttons, text = "Cancel", command = rules_window.destroy).grid(row=0, column=3, padx=10)
+
+        if rule_sets:
+            rule_set.set(sorted(rule_sets)[0])
+            load_rule_set()
+
+    # Double-click (or Enter) on a payment to correct its amount; only that
+    # item is updated, unless the rows are sorted by amount. The dialog is
+    # modal, so the rows can't be sorted, combined or deleted under it and i
+    # stays the row's index until it is closed
+    def edit_amount(i):
+        row = data_rows[i]
+
+        def save_amount():
+            try:
+                amount = Decimal(entry_amount.get().strip().replace(",", ".")).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+                # The most a SEPA transfer can carry; larger amounts wouldn't
+                # fit the batch's cents column either
+                if abs(amount) > Decimal("999999999.99"):
+                    raise ValueError(amount)
+                row["amount"] = amount
+            except Exception:
+                messagebox.showwarning("Invalid Input", "Please enter a valid amount.", parent=edit_window)
                 return
 
-            for row in data_rows:
-                row["amount"] += delta
+            data_rows.changed("amount")
+            if data_rows.sort_column == "amount":
+                data_rows.sort_by("amount", data_rows.descending)
+                table.reorder()
+            else:
+                table.update_row(i)
+            recheck_duplicates()
 
-            for item in tree.get_children():
-                tree.delete(item)
-            for idx, row in enumerate(data_rows, 1):
-                tree.insert("", "end", values=(idx, row["name"], row["iban"], row.get("bic") or "", f"{row['amount']:.2f}"))
+            edit_window.destroy()
 
-            add_window.destroy()
+        edit_window = tk.Toplevel(preview_window)
+        edit_window.title("Edit Amount")
+        edit_window.transient(preview_window)
+        edit_window.grab_set()
+        tk.Label(edit_window, text = f"{row['name']} ({row['iban']}):").grid(row=0, column=0, padx=10, pady=10)
+        entry_amount = tk.Entry(edit_window, width=10, justify="left")
+        entry_amount.insert(0, f"{row['amount']:.2f}")
+        entry_amount.grid(row=0, column=1, padx=10, pady=10)
+        entry_amount.focus_set()
+        entry_amount.bind("<Return>", lambda event: save_amount())
+        tk.Button(edit_window, text = "Apply", command = save_amount).grid(row=1, column=0, columnspan=2, pady=10)
 
-        add_window = tk.Toplevel(preview_window)
-        add_window.title("Add amount to all payoffs")
-        tk.Label(add_window, text = "Enter amount to add (e.g., 5 or -3):").grid(row=0, column=0, padx=10, pady=10)
-        entry_amount_change = tk.Entry(add_window, width=10, justify="left")
-        entry_amount_change.grid(row=0, column=1, padx=10, pady=10)
-        tk.Button(add_window, text = "Apply", command=apply_profit_masschange).grid(row=1, column=0, columnspan=2, pady=10)
+    table.on_activate(edit_amount)
 
     def add_surplus_participant():
         def save_surplus_participant():
@@ -297,22 +719,17 @@ def FileView(data_rows, config):
                 return
 
             try:
-                IBAN(iban_raw)
+                iban, bic = ValidateIBAN(iban_raw)
                 amount = Decimal(amount_str.replace(',', '.')).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
             except Exception:
                 messagebox.showwarning("Invalid Input", "Check IBAN and amount format.")
                 return
 
-            bic = IBAN(iban_raw).bic
-            data_rows.append({"name": name, "iban": iban_raw, "bic": bic, "amount": amount})
-            data_rows.sort(key=lambda r: r["name"].lower())
-            
-            # Clear and re-insert all rows with index
-            for row in tree.get_children():
-                tree.delete(row)
-            
-            for idx, row in enumerate(data_rows, 1):
-                tree.insert("", "end", values=(idx, row["name"], row["iban"], row.get("bic") or "", f"{row['amount']:.2f}"))
+            # Placed by binary search in the current order; only the new item
+            # is inserted into the table
+            idx = data_rows.insert_sorted(data_rows.batch.append(name, iban, Cents(amount), bic))
+            table.insert_row(idx)
+            recheck_duplicates()
             
             add_window.destroy()
 
@@ -339,57 +756,97 @@ def FileView(data_rows, config):
 
         tk.Button(add_window, text = "Add", command = save_surplus_participant).grid(row=3, column=0, columnspan=2, pady=10)
 
+    def combine_same_iban():
+        # One transfer per account: payments to the same IBAN (e.g. someone
+        # who took part in two sessions) are summed up
+        combined = AggregateByIBAN(data_rows)
+        if len(combined) == len(data_rows):
+            messagebox.showinfo("Combine Payments", "Every IBAN appears only once.", parent=preview_window)
+            return
+        # Counted in the preview as it is, so rows combined before and not
+        # repeated since don't count
+        repeated = [count for count in Counter(NormalizeIBAN(row["iban"]) for row in data_rows).values() if count > 1]
+        if not messagebox.askyesno("Combine Payments",
+                                   f"{sum(repeated)} payments go to {len(repeated)} IBANs that appear more than once. "
+                                   "Combine them into one transfer per IBAN?", parent=preview_window):
+            return
+        data_rows.replace(combined)
+        table.refresh()
+        recheck_duplicates()
+
     def confirm_and_generate():
         try:
             
-            # Build safe default filename
-            experiment_raw = NoUmlauts(config["experiment"])
-            reference_raw = NoUmlauts(config["reference"])
-            safe_experiment = experiment_raw.replace(" ", "_").replace(".", "").replace(":", "")
-            safe_reference = reference_raw.replace(" ", "_").replace(".", "").replace(":", "")
-            default_basename = f"{safe_experiment}_{safe_reference}"
-
-            # SEPA only allows positive transfer amounts (can happen after "Add amount to all payoffs" with a negative value)
-            invalid_rows = [(idx, row) for idx, row in enumerate(data_rows, 1) if row["amount"] <= 0]
+            default_basename = SafeBasename(config["experiment"], config["reference"])
+
+            invalid_rows = InvalidAmounts(data_rows)
             if invalid_rows:
                 info = "\n".join(f"Row {idx}: {row['name']} ({row['amount']:.2f})" for idx, row in invalid_rows)
                 messagebox.showerror("Invalid Amounts", f"All payment amounts must be greater than zero. Please check:\n\n{info}")
                 return
 
-            sepa = SepaTransfer(config, schema = schema, clean=True)
-            for idx, row in enumerate(data_rows, 1):
-                try:
-                    # Unique across sessions so the bank's duplicate detection isn't tripped.
-                    # Stored back on the row so the anonymous PDF can identify each payment by it.
-                    endtoend_id = uuid.uuid4().hex
-                    row["endtoend_id"] = endtoend_id
-                    payment = {
-                        "name": row["name"][:70],
-                        "IBAN": row["iban"],
-                        "amount": int(row["amount"] * 100),
-                        "execution_date": datetime.date.today() + datetime.timedelta(days=2),
-                        "description": config["reference"][:140],
-                        "endtoend_id": endtoend_id
-                    }
-                    # Omit the BIC key when unknown: sepaxml emits an empty <BIC/>
-                    # for "" which fails schema validation, but skips it when absent
-                    if row.get("bic"):
-                        payment["BIC"] = row["bic"]
-                    sepa.add_payment(payment)
-                except Exception as e:
-                    raise Exception(f"Error in row {idx} ({row['name']} - {row['iban']}): {e}")
-    
+            StartTrace(import_trace)
+
+            # Last look at the ledger before anything is written
+            try:
+                files, duplicates = check_duplicates()
+            except Exception as e:
+                if not messagebox.askyesno("Payment Ledger", f"Could not check the payment ledger for duplicates:\n{e}\n\nGenerate the output files anyway?",
+                                           icon="warning", parent=preview_window):
+                    return
+            else:
+                if (files or duplicates) and not messagebox.askyesno(
+                        "Possible Duplicates", "\n".join(duplicate_lines(files, duplicates)) + "\n\nGenerate the output files anyway?",
+                        icon="warning", parent=preview_window):
+                    return
+
+            engine = settings.get("sepa_engine", "sepaxml")
+            limits = BatchLimits(settings)
+
+            # The regular PDF is rendered once, for printing and saving; the
+            # anonymous one renders in a worker process while the dialogs below
+            # are open (it needs the End-to-End IDs MakeSepa assigns)
+            pdfs = PDFJobs(config, data_rows)
+
+            # Split into several files / PmtInf blocks if the batch exceeds
+            # the bank's limits from settings.json, and build the payments.
+            # This and the writing below run on a worker thread behind a
+            # progress dialog, so the window stays responsive.
+            def prepare(progress):
+                progress("Checking bank limits")
+                chunks = SplitRows(data_rows, limits, config, schema)
+                sepa = None
+                if len(chunks) == 1:
+                    sepa = MakeSepa(config, data_rows, schema, engine, progress=progress)
+                    pdfs.start_anonymous()
+                return chunks, sepa
+
+            try:
+                chunks, sepa = RunInBackground(preview_window, "Preparing Payments", prepare)
+            except Cancelled:
+                pdfs.cancel()
+                return
+            if len(chunks) > 1:
+                parts = "SEPA files" if limits["per"] == "file" else "payment blocks in one SEPA file"
+                messagebox.showinfo("Split Batch", f"The payments exceed the bank limits in settings.json and will be split into {len(chunks)} {parts}.", parent=preview_window)
+
             # Offer to print the regular (non-anonymous) PDF before continuing.
-            # A throwaway copy is generated in the temp directory and handed to
+            # A throwaway copy is written to the temp directory and handed to
             # the OS "print" verb, which sends it to the default printer. The
             # real PDFs are still written to the chosen location further below.
             # The temp file is left for the OS to clean up: the print handler
             # opens it asynchronously, so deleting it here could cut printing off.
             if AskPrintOption(preview_window):
+                tmp_pdf = os.path.join(tempfile.gettempdir(), default_basename + "_print.pdf")
+
+                def render(progress):
+                    progress("Rendering PDF")
+                    return pdfs.save(tmp_pdf)
+
                 try:
-                    tmp_pdf = os.path.join(tempfile.gettempdir(), default_basename + "_print.pdf")
-                    MakePDF(tmp_pdf, config.get("experiment"), data_rows, config.get("currency"), config.get("reference"), anonymous=False)
-                    os.startfile(tmp_pdf, "print")
+                    os.startfile(RunInBackground(preview_window, "Print PDF", render), "print")
+                except Cancelled:
+                    pass
                 except Exception as e:
                     messagebox.showwarning("Print Failed", f"Could not print the PDF:\n{e}", parent=preview_window)
 
@@ -398,6 +855,7 @@ def FileView(data_rows, config):
             # payment list.
             zip_choice = AskZipOptions(preview_window)
             if zip_choice is None:
+                pdfs.cancel()
                 return
 
             # Then choose where to save. When zipping, offer the .zip extension so
@@ -416,38 +874,36 @@ def FileView(data_rows, config):
                 # The chosen path may carry the .zip or .xml extension; derive the
                 # base name and always write the XML/PDFs from that.
                 base_path = os.path.splitext(output_path)[0]
-                xml_path = base_path + ".xml"
-                with open(xml_path, "wb") as out:
-                    out.write(sepa.export())
-
-                # Generate PDF next to XML with same base name, plus an
-                # anonymous twin that lists only the End-to-End IDs (no names/IBANs).
-                # Each PDF is attempted independently so a failure in one still
-                # produces the other.
-                generated_files = [xml_path]
-                pdf_errors = []
-                for path, anon in ((base_path + ".pdf", False), (base_path + "_anonymous.pdf", True)):
-                    try:
-                        MakePDF(path, config.get("experiment"), data_rows, config.get("currency"), config.get("reference"), anonymous=anon)
-                        generated_files.append(path)
-                    except Exception as e:
-                        pdf_errors.append(f"{os.path.basename(path)}: {e}")
+                password = zip_choice["password"] if zip_choice["encrypt"] else None
+
+                def write(progress):
+                    if len(chunks) == 1:
+                        return WriteOutputs(base_path, sepa, config, data_rows, zip_output=zip_choice["zip"], password=password, pdfs=pdfs,
+                                            zip_options=ZipOptions(settings), progress=progress)
+                    return WriteBatch(base_path, config, chunks, schema, engine, limits["per"],
+                                      zip_output=zip_choice["zip"], password=password, workers=limits["workers"], pdfs=pdfs,
+                                      zip_options=ZipOptions(settings), progress=progress)
 
-                zip_error = None
-                if zip_choice["zip"]:
-                    zip_path = base_path + ".zip"
-                    password = zip_choice["password"] if zip_choice["encrypt"] else None
+                try:
+                    outputs, problems = RunInBackground(preview_window, "Generating Output Files", write)
+                except Cancelled:
+                    # The partial outputs have been removed on the way out
+                    pdfs.cancel()
+                    messagebox.showinfo("Cancelled", "The export was cancelled. No output files were written.", parent=preview_window)
+                    return
+                if ledger_path:
                     try:
-                        MakeZip(zip_path, generated_files, password)
-                        # Bundled successfully: replace the loose files with the zip.
-                        for f in generated_files:
-                            os.remove(f)
+                        RecordBatch(ledger_path, config, data_rows, outputs, sources)
                     except Exception as e:
-                        zip_error = str(e)
+                        problems.append(f"The batch could not be recorded in the payment ledger: {e}")
+                for job, seconds in pdfs.timings.items():
+                    Phase(f"pdf {job} ({seconds * 1000:.1f} ms)")
+                try:
+                    WriteTraceReport(base_path, settings.get("trace_report", "json"))
+                except Exception:
+                    # The report is a diagnostic; it must never fail an export
+                    pass
 
-                problems = list(pdf_errors)
-                if zip_error:
-                    problems.append(f"Zip: {zip_error}")
                 if problems:
                     messagebox.showwarning("Output Warning",
                                            "The SEPA XML file was written, but there were problems:\n" + "\n".join(problems))
@@ -455,115 +911,201 @@ def FileView(data_rows, config):
                     messagebox.showinfo("Success", "Output files generated.")
 
                 preview_window.destroy()
+            else:
+                pdfs.cancel()
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
     btn_frame = tk.Frame(preview_window)
     btn_frame.pack(pady=10)
 
-    tk.Button(btn_frame, text = "Add amount to all payoffs", command = profit_masschange).grid(row=0, column=0, padx=10)
+    tk.Button(btn_frame, text = "Payout rules", command = payout_rules).grid(row=0, column=0, padx=10)
     tk.Button(btn_frame, text = "Add surplus participant", command = add_surplus_participant).grid(row=0, column=1, padx=10)
-    tk.Button(btn_frame, text = "Generate output files", command = confirm_and_generate).grid(row=0, column=2, padx=10)
-    tk.Button(btn_frame, text = "Cancel", command = preview_window.destroy).grid(row=0, column=3, padx=10)
+    tk.Button(btn_frame, text = "Combine same IBAN", command = combine_same_iban).grid(row=0, column=2, padx=10)
+    tk.Button(btn_frame, text = "Generate output files", command = confirm_and_generate).grid(row=0, column=3, padx=10)
+    tk.Button(btn_frame, text = "Cancel", command = preview_window.destroy).grid(row=0, column=4, padx=10)
 
 
-# Make GUI resolution adaptive to screen resolution
-import ctypes
-try:
-    ctypes.windll.shcore.SetProcessDpiAwareness(2)
-except Exception:
-    pass
+# Only the app itself loads the settings and builds the window: worker
+# processes (split parts, PDFs, reading sessions, the watch folder) import
+# this file too, and in the .exe freeze_support() takes them over before any
+# of the start-up work below
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
 
 
-# Initialise GUI
-root = tk.Tk()
+    # Get correct working directory
+    if getattr(sys, 'frozen', False):
+        # Running as exe
+        app_path = os.path.dirname(sys.executable)
+    else:
+        # Running as script
+        app_path = os.path.dirname(os.path.abspath(__file__))
 
 
-# GUI settings 
-screen_w = int(root.winfo_screenwidth())
-screen_h = int(root.winfo_screenheight())
-root.minsize(800, 400)
-root.maxsize(screen_w, screen_h)
-root.title("zTreeSepa")
+    # Load settings (payer banking info is here)
+    settings_file = os.path.join(app_path, "settings.json")
+    settings = LoadSettings(settings_file)
 
 
-# Add top menu bar
-menubar = tk.Menu(root)
+    # Remember validated IBANs/BICs between sessions (no IBANs are stored in clear)
+    if settings.get("iban_cache", True):
+        UseIBANCache(os.path.join(app_path, "iban_cache.json"))
 
+    # Record every exported batch in a local payment ledger (see ledger.py)
+    ledger_path = os.path.join(app_path, "ledger.db") if settings.get("ledger", True) else None
 
-# Add file menu
-file_menu = tk.Menu(menubar, tearoff = 0)
-file_menu.add_command(label = "Import payment file", command = lambda: ImportFile(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder))
-file_menu.add_separator()
-file_menu.add_command(label = "Quit", command = root.quit)
-menubar.add_cascade(label = "File", menu = file_menu)
+    # Watch mode (see watch.py): started with the main window below
+    watcher = None
 
+    # Per-stage run reports (see timing.py); the ZTREESEPA_TRACE variable also works
+    EnableTracing(settings.get("trace", False), settings.get("trace_memory", False))
+    Phase("settings loaded")
 
-# Add help menu
-help_menu = tk.Menu(menubar, tearoff = 0)
-help_menu.add_command(label="Open GitHub", command = lambda: webbrowser.open(github_link))
-help_menu.add_command(label = "About", command = lambda: tk.messagebox.showinfo("About", f"zTreeSepa\n\nVersion {version}\nVersion date: {version_date}"))
-menubar.add_cascade(label = "Help", menu = help_menu)
 
-root.config(menu=menubar)
+    # Make GUI resolution adaptive to screen resolution
+    import ctypes
+    try:
+        ctypes.windll.shcore.SetProcessDpiAwareness(2)
+    except Exception:
+        pass
+
+
+    # Initialise GUI
+    root = tk.Tk()
+    Phase("Tk initialised")
+
+
+    # GUI settings 
+    screen_w = int(root.winfo_screenwidth())
+    screen_h = int(root.winfo_screenheight())
+    root.minsize(800, 400)
+    root.maxsize(screen_w, screen_h)
+    root.title("zTreeSepa")
 
-# Use the zTreeSepa icon for the main window and every dialog. Passing
-# default=... sets it as the application-wide icon so child Toplevels inherit
-# it instead of falling back to the Tk feather.
-try:
-    if getattr(sys, 'frozen', False):
-        icon_source = sys.executable  # icon is embedded in the .exe
-    else:
-        icon_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.ico")
-    root.iconbitmap(default=icon_source)
-except Exception:
-    pass
-
-# Set up frame with payer infos
-frame_settings = tk.LabelFrame(root, text = "Payer Banking Info", padx=10, pady=10)
-frame_settings.pack(fill="x", padx=20, pady=10)
-
-info_label = tk.Label(root, text = "Payer details are read-only.\nTo change, edit settings.json manually.", fg="gray", justify="left")
-info_label.pack(pady=(0, 10), padx=20, anchor="w")
-
-payer_name = settings.get("payer_name", "")
-payer_iban = settings.get("payer_iban", "")
-payer_bic = settings.get("payer_bic", "")
-currency = settings.get("currency", "EUR")
-schema = settings.get("default_schema") or "pain.001.001.03"
-                    
-payer_name_label = tk.Label(frame_settings, text = payer_name, width=60, anchor="w")
-payer_iban_label = tk.Label(frame_settings, text = payer_iban, width=60, anchor="w")
-payer_bic_label = tk.Label(frame_settings, text = payer_bic, width=60, anchor="w")
-currency_label = tk.Label(frame_settings, text = currency, width=60, anchor="w")
 
-reference = tk.Entry(frame_settings, width=70, justify="left")
-experiment = tk.Entry(frame_settings, width=70, justify="left")
+    # Add top menu bar
+    menubar = tk.Menu(root)
 
-widgets = [
-    ("Payer Name:", payer_name_label),
-    ("Payer IBAN:", payer_iban_label),
-    ("Payer BIC:", payer_bic_label),
-    ("Currency:", currency_label),
-    ("Payment Reference:", reference),
-    ("Experiment Name:", experiment),
-]
 
-for i, (label, widget) in enumerate(widgets):
-    tk.Label(frame_settings, text = label).grid(row=i, column=0, sticky="e")
-    widget.grid(row=i, column=1, padx=(10,0), pady=5, sticky="w")
+    # Add file menu
+    file_menu = tk.Menu(menubar, tearoff = 0)
+    file_menu.add_command(label = "Import payment file", command = lambda: ImportFile(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder))
+    file_menu.add_command(label = "Payment monitor", command = lambda: ShowPaymentMonitor(root, lambda: ImportConfig(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder)))
+    file_menu.add_command(label = "Payment ledger", command = lambda: ShowLedger(root))
+    file_menu.add_command(label = "Reconcile bank statements", command = lambda: ReconcileStatements(root))
+    file_menu.add_separator()
+    file_menu.add_command(label = "Quit", command = root.quit)
+    menubar.add_cascade(label = "File", menu = file_menu)
 
-# Placeholder setup
-reference_placeholder = settings.get("placeholder_reference", "e.g. Payment Round 3")
-experiment_placeholder = settings.get("placeholder_experiment", "e.g. Study A - Session 1")
 
-reference_placeholder_label = tk.Label(frame_settings, text = reference_placeholder, fg="gray", anchor="w", justify="left")
-reference_placeholder_label.grid(row=4, column=2, sticky="w", padx=(1,10))
+    # Add help menu
+    help_menu = tk.Menu(menubar, tearoff = 0)
+    help_menu.add_command(label="Open GitHub", command = lambda: webbrowser.open(github_link))
+    help_menu.add_command(label = "Last run timings", command = lambda: ShowLastRunTimings(root))
+    help_menu.add_command(label = "About", command = lambda: tk.messagebox.showinfo("About", f"zTreeSepa\n\nVersion {version}\nVersion date: {version_date}"))
+    menubar.add_cascade(label = "Help", menu = help_menu)
 
-experiment_placeholder_label = tk.Label(frame_settings, text = experiment_placeholder, fg="gray", anchor="w", justify="left")
-experiment_placeholder_label.grid(row=5, column=2, sticky="w", padx=(1,10))
+    root.config(menu=menubar)
 
-# Add button to import .pay file
-tk.Button(root, text = "Import payment file", command = lambda: ImportFile(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder), height=2, width=25).pack(pady=20)
+    # Use the zTreeSepa icon for the main window and every dialog. Passing
+    # default=... sets it as the application-wide icon so child Toplevels inherit
+    # it instead of falling back to the Tk feather.
+    try:
+        if getattr(sys, 'frozen', False):
+            icon_source = sys.executable  # icon is embedded in the .exe
+        else:
+            icon_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.ico")
+        root.iconbitmap(default=icon_source)
+    except Exception:
+        pass
+
+    # Set up frame with payer infos
+    frame_settings = tk.LabelFrame(root, text = "Payer Banking Info", padx=10, pady=10)
+    frame_settings.pack(fill="x", padx=20, pady=10)
 
-root.mainloop()
\ No newline at end of file
+    info_label = tk.Label(root, text = "Payer details are read-only.\nTo change, edit settings.json manually.", fg="gray", justify="left")
+    info_label.pack(pady=(0, 10), padx=20, anchor="w")
+
+    payer_name = settings.get("payer_name", "")
+    payer_iban = settings.get("payer_iban", "")
+    payer_bic = settings.get("payer_bic", "")
+    currency = settings.get("currency", "EUR")
+    schema = settings.get("default_schema") or "pain.001.001.03"
+                    
+    payer_name_label = tk.Label(frame_settings, text = payer_name, width=60, anchor="w")
+    payer_iban_label = tk.Label(frame_settings, text = payer_iban, width=60, anchor="w")
+    payer_bic_label = tk.Label(frame_settings, text = payer_bic, width=60, anchor="w")
+    currency_label = tk.Label(frame_settings, text = currency, width=60, anchor="w")
+
+    reference = tk.Entry(frame_settings, width=70, justify="left")
+    experiment = tk.Entry(frame_settings, width=70, justify="left")
+
+    widgets = [
+        ("Payer Name:", payer_name_label),
+        ("Payer IBAN:", payer_iban_label),
+        ("Payer BIC:", payer_bic_label),
+        ("Currency:", currency_label),
+        ("Payment Reference:", reference),
+        ("Experiment Name:", experiment),
+    ]
+
+    for i, (label, widget) in enumerate(widgets):
+        tk.Label(frame_settings, text = label).grid(row=i, column=0, sticky="e")
+        widget.grid(row=i, column=1, padx=(10,0), pady=5, sticky="w")
+
+    # Placeholder setup
+    reference_placeholder = settings.get("placeholder_reference", "e.g. Payment Round 3")
+    experiment_placeholder = settings.get("placeholder_experiment", "e.g. Study A - Session 1")
+
+    reference_placeholder_label = tk.Label(frame_settings, text = reference_placeholder, fg="gray", anchor="w", justify="left")
+    reference_placeholder_label.grid(row=4, column=2, sticky="w", padx=(1,10))
+
+    experiment_placeholder_label = tk.Label(frame_settings, text = experiment_placeholder, fg="gray", anchor="w", justify="left")
+    experiment_placeholder_label.grid(row=5, column=2, sticky="w", padx=(1,10))
+
+    # Add button to import .pay file
+    tk.Button(root, text = "Import payment file", command = lambda: ImportFile(payer_name, payer_iban, payer_bic, currency, reference, reference_placeholder, experiment, experiment_placeholder), height=2, width=25).pack(pady=20)
+    # Watch mode: .pay files copied into the watch folder are read in the
+    # background, so importing them is instant
+    watch_folder = settings.get("watch_folder", "")
+    if watch_folder:
+        if os.path.isdir(watch_folder):
+            watcher = WatchFolder(watch_folder, settings.get("watch_interval", 2), settings.get("watch_debounce", 2),
+                                  int(settings.get("watch_workers") or 0) or None)
+            watcher.start()
+            watch_label = tk.Label(root, text = "", fg="gray")
+            watch_label.pack()
+
+            def update_watch_label():
+                ready, waiting = watcher.counts()
+                text = f"Watching {watcher.folder}: {ready} payment files ready"
+                if waiting:
+                    text += f", {waiting} being read"
+                watch_label.config(text = text)
+                root.after(1000, update_watch_label)
+
+            update_watch_label()
+        else:
+            messagebox.showwarning("Watch Folder", f"The watch folder in settings.json does not exist:\n{watch_folder}")
+    Phase("main window built")
+
+    # Once the window has been drawn, load the heavy dependencies on a background
+    # thread so the first import/export doesn't have to wait for them. Validating
+    # the payer IBAN also loads schwifty's IBAN registry.
+    def warm_up():
+        def schwifty_registry():
+            ValidateIBAN(payer_iban)
+
+        Phase("main window shown")
+        WarmUp([
+            schwifty_registry,
+            "chardet",
+            "text_unidecode",
+            "sepaxml",
+            "reportlab.platypus",
+            "pyzipper",
+        ])
+
+    root.after_idle(warm_up)
+    root.mainloop()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import DecodeFile
+from parse import ParseRows
+from iban import NormalizeIBAN, SaveIBANCache
+from rows import PaymentBatch
+from timing import Span
+
+# Paying several sessions in one upload. The .pay files are decoded and
+# parsed in parallel, one process each, and merged into one list in which
+# every row keeps the session it came from (the file name without .pay).
+# AggregateByIBAN then turns several payments to the same account into one
+# transfer.
+
+def SessionName(pay_path):
+    return os.path.splitext(os.path.basename(pay_path))[0]
+
+def DropComboTwins(paths):
+    """Drop DATE_TIME.pay when DATE_TIME_combo.pay of the same session is
+    also among paths (zTree writes both), so nobody is paid twice. Keeps
+    the order of paths."""
+    absolute = [os.path.abspath(p) for p in paths]
+    combo_twins = {p[:-len("_combo.pay")] + ".pay" for p in absolute if p.endswith("_combo.pay")}
+    return [p for p, a in zip(paths, absolute) if a not in combo_twins]
+
+def ReadSession(pay_path):
+    """Decode and parse one .pay file; runs in a worker process.
+
+    Returns (rows, discarded_rows) with the session name set on each.
+    """
+    session = SessionName(pay_path)
+    rows, discarded_rows = ParseRows(DecodeFile(pay_path))
+    for row in rows:
+        row["session"] = session
+    for row in discarded_rows:
+        row["session"] = session
+    # Pool workers exit without running atexit handlers, so save explicitly
+    SaveIBANCache()
+    return rows, discarded_rows
+
+def ReadSessions(pay_paths, workers=None, progress=None, cached=None):
+    """Read several .pay files in parallel and merge them.
+
+    Returns (rows, discarded_rows), the rows of all files in the order of
+    pay_paths. progress, if given, is called with the number of files done
+    and may raise to stop (files not started yet are then skipped).
+    cached, if given, is called with each path and returns (rows,
+    discarded_rows) if the file was already read (see watch.py) or None.
+    """
+    rows, discarded_rows = [], []
+    with Span("read sessions", files=len(pay_paths)) as span:
+        results = {path: cached(path) for path in pay_paths} if cached else {}
+        to_read = [path for path in pay_paths if results.get(path) is None]
+        span.set(cached=len(pay_paths) - len(to_read))
+        if len(to_read) == 1:
+            results[to_read[0]] = ReadSession(to_read[0])
+        elif to_read:
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(to_read))) as pool:
+                futures = [pool.submit(ReadSession, path) for path in to_read]
+                try:
+                    done = len(pay_paths) - len(to_read)
+                    for path, f in zip(to_read, futures):
+                        results[path] = f.result()
+                        done += 1
+                        if progress is not None:
+                            progress(done, len(pay_paths))
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+        for session_rows, session_discarded in (results[path] for path in pay_paths):
+            rows.extend(session_rows)
+            discarded_rows.extend(session_discarded)
+        span.set(rows=len(rows), discarded=len(discarded_rows))
+    return rows, discarded_rows
+
+def AggregateByIBAN(rows):
+    """Combine the payments to the same IBAN into one.
+
+    Returns a new PaymentBatch in the order each IBAN first appears. A
+    combined row keeps the first row's name and BIC, carries the sum of the
+    amounts, the sessions joined with "+" and the number of payments it
+    replaces in "combined". Rows are looked up through a dict keyed by the normalized
+    IBAN, so this is one pass over the rows.
+    """
+    by_iban = {}
+    combined = PaymentBatch()
+    for row in rows:
+        key = NormalizeIBAN(row["iban"])
+        target = by_iban.get(key)
+        if target is None:
+            target = by_iban[key] = combined.append(row["name"], row["iban"], row["cents"], row.get("bic"), row.get("session"))
+            # Rows combined before keep their count
+            target["combined"] = row["combined"]
+            continue
+        target["cents"] += row["cents"]
+        target["combined"] += row["combined"]
+        session = row.get("session")
+        if session and session not in target.get("session", "").split("+"):
+            target["session"] = f"{target['session']}+{session}" if target.get("session") else session
+    return combined
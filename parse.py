@@ -1,20 +1,68 @@
 import csv
 import io
 from decimal import Decimal, ROUND_HALF_UP
-from utils import SepaClean
-from schwifty import IBAN
-from tkinter import messagebox
+from utils import SepaCleanMany, OpenPaymentFile
+from iban import ValidateIBAN, PrevalidateIBANs, IBANErrorMessage
+from timing import Span
 
-def ParseFile(file_content):
-    valid_rows = []
-    discarded_rows = []
-    f = io.StringIO(file_content)
-    reader = csv.DictReader(f, delimiter='\t')
+# Rows are collected into batches of this size so their IBANs can be
+# pre-validated and their names cleaned together; only survivors go through
+# schwifty for the BIC
+_BATCH_SIZE = 1024
+
+def _Discard(on_discard, name, iban_raw, error):
+    if on_discard is not None:
+        on_discard({"name": name, "iban": iban_raw or "<unknown>", "reason": str(error) or type(error).__name__})
+
+def _ValidateBatch(pending, on_discard):
+    # The valid rows of one batch, as a list
+    valid = []
+    with Span("iban check", rows=len(pending)):
+        verdicts = PrevalidateIBANs([iban_raw for _, iban_raw, _ in pending])
+        names = SepaCleanMany([name for name, _, _ in pending])
+        for name, (_, iban_raw, amount), verdict in zip(names, pending, verdicts):
+            try:
+                if verdict:
+                    raise ValueError(IBANErrorMessage(verdict, iban_raw))
+                iban, bic = ValidateIBAN(iban_raw)
+            except Exception as e:
+                _Discard(on_discard, name, iban_raw, e)
+                continue
+            valid.append({"name": name, "iban": iban, "amount": amount, "bic": bic})
+    return valid
+
+def IterParseFile(source, on_discard=None, detection=None):
+    """Yield validated payment rows from a .pay file one at a time.
+
+    source is either the path of a .pay file, which is then read
+    incrementally in its detected encoding, or an already opened text
+    stream. At most one batch of rows is held in memory at a time. Rows that are
+    rejected are not yielded; instead on_discard (if given) is called with
+    a dict carrying the name and raw IBAN of the payee (as far as they
+    could be read) plus the reason the row was rejected. For paths, the
+    encoding detection result is written into the detection dict if given.
+    """
+    if isinstance(source, str):
+        with OpenPaymentFile(source, detection) as f:
+            yield from IterParseFile(f, on_discard)
+        return
+
+    reader = csv.DictReader(source, delimiter='\t')
     if reader.fieldnames is None:
         raise ValueError("The payment file is empty.")
-    old_format = 'adress' not in reader.fieldnames
+    yield from IterParseRecords(reader, reader.fieldnames, on_discard)
+
+def IterParseRecords(records, fieldnames, on_discard=None):
+    """Yield validated payment rows from the records of a .pay file.
+
+    records are dicts keyed by the header fields, as csv.DictReader makes
+    them, and fieldnames the header, which tells the zTree format apart.
+    Rejected rows are reported to on_discard, see IterParseFile.
+    """
+    old_format = 'adress' not in fieldnames
 
-    for row in reader:
+    pending = []
+    for row in records:
         name = None
         iban_raw = None
         try:
@@ -26,7 +74,6 @@ def ParseFile(file_content):
                 if not row.get('Name') or not row.get('Profit') or not row.get('Computer'):
                     continue
                 name_iban, name = row['Name'].split(',', 1)
-                name = SepaClean(name)
                 iban_raw = name_iban.strip().replace(" ", "")
                 amount = Decimal(row['Profit'].strip().replace(',', '.'))
             
@@ -38,27 +85,61 @@ def ParseFile(file_content):
                     continue
                 first = row.get('firstName', '').strip()
                 last = row.get('lastName', '').strip()
-                name = SepaClean(f"{first} {last}")
+                name = f"{first} {last}"
                 iban_raw = row.get('adress', '').strip().replace(" ", "").upper()
                 amount = Decimal(row['Payment'].strip().replace(',', '.'))
 
             amount = amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            iban_obj = IBAN(iban_raw)
-            valid_rows.append({"name": name, "iban": str(iban_obj), "amount": amount, "bic": getattr(iban_obj, "bic", None)})
-        except Exception:
+        except Exception as e:
             # name/iban_raw may not have been set yet when the error occurred -
             # fall back to the raw fields so the warning still identifies the row
             if name is None:
                 name = (row.get('Name')
                         or f"{row.get('firstName') or ''} {row.get('lastName') or ''}".strip()
                         or "<unknown>")
-            discarded_rows.append({"name": name, "iban": iban_raw or "<unknown>"})
+            _Discard(on_discard, name, iban_raw, e)
+            continue
+
+        pending.append((name, iban_raw, amount))
+        if len(pending) >= _BATCH_SIZE:
+            yield from _ValidateBatch(pending, on_discard)
+            pending = []
+
+    yield from _ValidateBatch(pending, on_discard)
+
+def ParseRows(file_content, progress=None):
+    """Parse the decoded content of a .pay file without any UI.
+
+    Returns (valid_rows, discarded_rows), see IterParseFile. progress, if
+    given, is called with the number of valid rows read so far.
+    """
+    discarded_rows = []
+    with Span("parse") as span:
+        if progress is None:
+            valid_rows = list(IterParseFile(io.StringIO(file_content), discarded_rows.append))
+        else:
+            valid_rows = []
+            for row in IterParseFile(io.StringIO(file_content), discarded_rows.append):
+                valid_rows.append(row)
+                progress(len(valid_rows))
+        span.set(rows=len(valid_rows), discarded=len(discarded_rows))
+    return valid_rows, discarded_rows
+
+def ShowDiscarded(discarded_rows):
+    # tkinter is imported here rather than at module level so ParseRows stays
+    # usable on headless machines (batch CLI) where Tk may not be installed
+    from tkinter import messagebox
 
     if discarded_rows:
-        discard_info = "\n".join(f"{r['name']} | IBAN: {r['iban']}" for r in discarded_rows)
+        # Rows merged from several sessions say which one they came from
+        discard_info = "\n".join(f"{r['session'] + ': ' if r.get('session') else ''}{r['name']} | IBAN: {r['iban']}"
+                                 for r in discarded_rows)
         messagebox.showwarning(
             "Invalid or Skipped Rows",
             f"{len(discarded_rows)} rows were discarded due to invalid IBANs or parsing errors:\n\n{discard_info}"
         )
-    
+
+def ParseFile(file_content):
+    valid_rows, discarded_rows = ParseRows(file_content)
+    ShowDiscarded(discarded_rows)
     return valid_rows
\ No newline at end of file
@@ -1,45 +1,67 @@
 import datetime
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 
-def MakePDF(file_path, experiment_name, payments, currency, reference, anonymous=False):
-    doc = SimpleDocTemplate(file_path, pagesize=landscape(A4))
-    styles = getSampleStyleSheet()
-    elements = []
+from rows import FormatCents, TotalCents
 
-    # Title
-    title_suffix = " (anonymous)" if anonymous else ""
-    title = Paragraph(f"<b>Experiment: {experiment_name}{title_suffix}</b>", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 12))
+# Two engines render the same payment list:
+#   "platypus" - reportlab's document layout with one big Table (the original)
+#   "canvas"   - draws the fixed-column list straight onto the page canvas,
+#                page by page with a repeated header; much faster for large
+#                batches because nothing has to measure and split the table
+# Select one with "pdf_engine" in settings.json.
 
+def _TableData(payments, currency, reference, anonymous):
     # Table data: header + rows. The anonymous variant replaces the personal
     # columns (Name, IBAN) with the unique End-to-End ID of each payment.
     if anonymous:
-        data = [["Index", "End-to-End ID", "Amount", "Currency", "Reference"]]
+        header = ["Index", "End-to-End ID", "Amount", "Currency", "Reference"]
     else:
-        data = [["Index", "Name", "IBAN", "Amount", "Currency", "Reference"]]
+        header = ["Index", "Name", "IBAN", "Amount", "Currency", "Reference"]
 
+    rows = []
     for idx, payment in enumerate(payments, 1):
         if anonymous:
-            data.append([
+            rows.append([
                 str(idx),
                 payment.get("endtoend_id", ""),
-                f"{payment['amount']:.2f}",
+                FormatCents(payment["cents"]),
                 currency,
                 reference
             ])
         else:
-            data.append([
+            rows.append([
                 str(idx),
                 payment["name"],
                 payment["iban"],
-                f"{payment['amount']:.2f}",
+                FormatCents(payment["cents"]),
                 currency,
                 reference
             ])
+    return header, rows
+
+def MakePDF(file_path, experiment_name, payments, currency, reference, anonymous=False, engine="platypus"):
+    if engine == "canvas":
+        return _CanvasPDF(file_path, experiment_name, payments, currency, reference, anonymous)
+    if engine != "platypus":
+        raise ValueError(f"Unknown PDF engine: {engine}")
+
+    # reportlab is imported on first use to keep it off the app's start-up path
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    doc = SimpleDocTemplate(file_path, pagesize=landscape(A4))
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Title
+    title_suffix = " (anonymous)" if anonymous else ""
+    title = Paragraph(f"<b>Experiment: {experiment_name}{title_suffix}</b>", styles['Title'])
+    elements.append(title)
+    elements.append(Spacer(1, 12))
+
+    header, rows = _TableData(payments, currency, reference, anonymous)
+    data = [header] + rows
 
     # Table style
     table = Table(data, repeatRows=1, hAlign='LEFT')
@@ -58,18 +80,125 @@ def MakePDF(file_path, experiment_name, payments, currency, reference, anonymous
     elements.append(Spacer(1, 12))
 
     # Total sum
-    total_amount = sum(p["amount"] for p in payments)
+    total_amount = FormatCents(TotalCents(payments))
     elements.append(Spacer(1, 12))
-    elements.append(Paragraph(f"<b>Gesamtsumme:</b> {total_amount:.2f} {currency}", styles['Normal']))
-    
+    elements.append(Paragraph(f"<b>Gesamtsumme:</b> {total_amount} {currency}", styles['Normal']))
+
     # Signature line
     elements.append(Spacer(1, 24))
     elements.append(Paragraph("Unterschrift Experimentator: ____________________________", styles['Normal']))
-    
+
     # Timestamp
     timestamp = datetime.datetime.now().strftime("Datei erstellt am %d.%m.%Y um %H:%M Uhr")
     elements.append(Spacer(1, 12))
     elements.append(Paragraph(f"<i>{timestamp}</i>", styles['Normal']))
 
     # Build PDF
-    doc.build(elements)
\ No newline at end of file
+    doc.build(elements)
+
+
+# Layout of the canvas engine, matching the platypus defaults used above
+_MARGIN = 72 + 6          # page margin plus frame padding
+_PAD_X = 6                # cell padding left and right
+_HEADER_HEIGHT = 23       # leading 12 + padding 3 (top) and 8 (bottom)
+_ROW_HEIGHT = 18          # 10pt: leading 12 + padding 3 and 3
+
+def _CanvasPDF(file_path, experiment_name, payments, currency, reference, anonymous):
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib import colors
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen import canvas
+
+    page_w, page_h = landscape(A4)
+    c = canvas.Canvas(file_path, pagesize=(page_w, page_h))
+    header, rows = _TableData(payments, currency, reference, anonymous)
+
+    # Column widths from the widest cell of each column, measured once per
+    # distinct value (Currency and Reference are the same in every row)
+    widths = []
+    for col, title in enumerate(header):
+        values = {row[col] for row in rows}
+        widest = max([stringWidth(v, "Helvetica", 10) for v in values] + [stringWidth(title, "Helvetica-Bold", 12)])
+        widths.append(widest + 2 * _PAD_X)
+    xs = [_MARGIN]
+    for w in widths:
+        xs.append(xs[-1] + w)
+
+    top = page_h - _MARGIN
+    bottom = _MARGIN
+
+    # Title, on the first page only (Title style: 18pt bold, centred)
+    title_suffix = " (anonymous)" if anonymous else ""
+    c.setFont("Helvetica-Bold", 18)
+    c.drawCentredString(page_w / 2, top - 18, f"Experiment: {experiment_name}{title_suffix}")
+    y = top - 22 - 6 - 12  # leading, space after, spacer
+
+    def draw_page(start, end, y):
+        # Header and rows start..end as one grid block below y
+        block_bottom = y - _HEADER_HEIGHT - (end - start) * _ROW_HEIGHT
+        c.setFillColor(colors.grey)
+        c.rect(xs[0], y - _HEADER_HEIGHT, xs[-1] - xs[0], _HEADER_HEIGHT, stroke=0, fill=1)
+
+        # Text sits on the bottom padding plus (leading - font size), as in platypus
+        c.setFillColor(colors.whitesmoke)
+        c.setFont("Helvetica-Bold", 12)
+        for x, title in zip(xs, header):
+            c.drawString(x + _PAD_X, y - _HEADER_HEIGHT + 8, title)
+
+        # One text object per column, one line per row
+        c.setFillColor(colors.black)
+        first_baseline = y - _HEADER_HEIGHT - _ROW_HEIGHT + 3 + 2
+        for col, x in enumerate(xs[:-1]):
+            text = c.beginText(x + _PAD_X, first_baseline)
+            # The leading is the row height, so each textLine moves down a row
+            text.setFont("Helvetica", 10, _ROW_HEIGHT)
+            for i in range(start, end):
+                text.textLine(rows[i][col])
+            c.drawText(text)
+
+        c.setStrokeColor(colors.black)
+        c.setLineWidth(0.5)
+        lines = [(x, y, x, block_bottom) for x in xs]
+        lines.append((xs[0], y, xs[-1], y))
+        row_y = y - _HEADER_HEIGHT
+        for _ in range(start, end + 1):
+            lines.append((xs[0], row_y, xs[-1], row_y))
+            row_y -= _ROW_HEIGHT
+        c.lines(lines)
+        return block_bottom
+
+    start = 0
+    while True:
+        fit = max(0, int((y - bottom - _HEADER_HEIGHT) // _ROW_HEIGHT))
+        end = min(len(rows), start + fit)
+        if end > start or not rows:
+            y = draw_page(start, end, y)
+        start = end
+        if start >= len(rows):
+            break
+        c.showPage()
+        y = top
+
+    # Total, signature line and timestamp (10pt, leading 12) below the table,
+    # on a new page if they don't fit
+    if y - (24 + 12 + 24 + 12 + 12 + 12) < bottom:
+        c.showPage()
+        y = top
+    total_amount = FormatCents(TotalCents(payments))
+    label = "Gesamtsumme:"
+    y -= 24
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(_MARGIN, y - 10, label)
+    c.setFont("Helvetica", 10)
+    c.drawString(_MARGIN + stringWidth(label + " ", "Helvetica-Bold", 10), y - 10, f"{total_amount} {currency}")
+    y -= 12 + 24
+    c.drawString(_MARGIN, y - 10, "Unterschrift Experimentator: ____________________________")
+
+    timestamp = datetime.datetime.now().strftime("Datei erstellt am %d.%m.%Y um %H:%M Uhr")
+    y -= 12 + 12
+    c.setFont("Helvetica-Oblique", 10)
+    c.drawString(_MARGIN, y - 10, timestamp)
+
+    c.showPage()
+    c.save()
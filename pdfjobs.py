@@ -0,0 +1,107 @@
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pdf import MakePDF
+from rows import PaymentBatch
+from timing import Span, AddSpan
+
+# The PDFs of one export. The regular PDF is rendered once, in memory, and
+# the same bytes serve the print copy and the saved file. The anonymous PDF
+# only needs the End-to-End IDs and amounts, so it is rendered in a worker
+# process (one, shared by all exports) while the user is still answering the
+# print/zip/save dialogs. timings records how long each job took, in seconds.
+
+_pool = None
+
+def _Pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=1)
+    return _pool
+
+def _Render(experiment_name, payments, currency, reference, anonymous, engine):
+    t0 = time.perf_counter()
+    buffer = io.BytesIO()
+    MakePDF(buffer, experiment_name, payments, currency, reference, anonymous=anonymous, engine=engine)
+    return buffer.getvalue(), time.perf_counter() - t0
+
+
+class PDFJobs:
+    def __init__(self, config, data_rows, use_process=True):
+        self.experiment = config.get("experiment")
+        self.currency = config.get("currency")
+        self.reference = config.get("reference")
+        self.engine = config.get("pdf_engine", "platypus")
+        self.data_rows = data_rows
+        self.use_process = use_process
+        self.timings = {}
+        self._regular = None
+        self._anonymous = None
+        self._future = None
+
+    def _render(self, anonymous):
+        with Span("pdf anonymous" if anonymous else "pdf", rows=len(self.data_rows), engine=self.engine) as span:
+            data, seconds = _Render(self.experiment, self._anonymous_rows() if anonymous else self.data_rows,
+                                    self.currency, self.reference, anonymous, self.engine)
+            span.set(bytes=len(data))
+        return data, seconds
+
+    def _anonymous_rows(self):
+        # Names and IBANs don't leave this process
+        rows = PaymentBatch()
+        for row in self.data_rows:
+            rows.append("", "", row["cents"], endtoend_id=row.get("endtoend_id", ""))
+        return rows
+
+    def start_anonymous(self):
+        """Start rendering the anonymous PDF in the background.
+
+        Call once the rows have their End-to-End IDs (after MakeSepa). Without
+        a worker process it is rendered on demand by anonymous() instead.
+        """
+        if not self.use_process or self._future is not None or self._anonymous is not None:
+            return
+        try:
+            self._future = _Pool().submit(_Render, self.experiment, self._anonymous_rows(), self.currency,
+                                          self.reference, True, self.engine)
+        except Exception:
+            self._future = None
+
+    def regular(self):
+        if self._regular is None:
+            self._regular, self.timings["regular"] = self._render(False)
+        return self._regular
+
+    def anonymous(self):
+        global _pool
+        if self._anonymous is None:
+            if self._future is not None:
+                t0 = time.perf_counter()
+                try:
+                    self._anonymous, self.timings["anonymous"] = self._future.result()
+                    self.timings["anonymous_wait"] = time.perf_counter() - t0
+                    AddSpan("pdf anonymous", self.timings["anonymous"], rows=len(self.data_rows),
+                            engine=self.engine, bytes=len(self._anonymous),
+                            wait_ms=round(self.timings["anonymous_wait"] * 1000, 3))
+                except BrokenProcessPool:
+                    # The worker died (or could not start); do it here
+                    _pool = None
+                self._future = None
+            if self._anonymous is None:
+                self._anonymous, self.timings["anonymous"] = self._render(True)
+        return self._anonymous
+
+    def save(self, path, anonymous=False):
+        """Write the regular or anonymous PDF to path and return path."""
+        data = self.anonymous() if anonymous else self.regular()
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def cancel(self):
+        # The export was abandoned; drop the background job if it hasn't started
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
@@ -0,0 +1,284 @@
+import tkinter as tk
+from tkinter import ttk
+
+from rows import FormatCents
+
+# The payment table shown in the preview window. Two flavours share one
+# interface so FileView doesn't care which one it got:
+#   PaymentTable        - one Treeview item per payment; fine for a session
+#   VirtualPaymentTable - only the rows that fit in the window exist as
+#                         Treeview items and are refilled while scrolling,
+#                         so merged batches of tens of thousands of rows stay
+#                         responsive
+# Both update single rows and the Amount column in place instead of deleting
+# and re-inserting everything. When data_rows is a PaymentRows list, clicking
+# the Name, IBAN, Amount or Session heading sorts by that column (again to
+# reverse). The Session column is only there for batches merged from
+# several .pay files. Rows passed to set_flagged (e.g. payments that were
+# already exported before) are highlighted. on_activate reports the row
+# double-clicked (or chosen with Enter), e.g. to edit it.
+
+COLUMNS = ("Index", "Name", "IBAN", "BIC", "Amount")
+SORTABLE = {"Name": "name", "IBAN": "iban", "Amount": "amount", "Session": "session"}
+FLAGGED_COLOR = "#f4c7c3"
+
+def RowValues(idx, row, sessions=False):
+    values = (idx, row["name"], row["iban"], row.get("bic") or "", FormatCents(row["cents"]))
+    if sessions:
+        values += (row.get("session", ""),)
+    return values
+
+def MakePaymentTable(parent, data_rows, virtual, sessions=False):
+    cls = VirtualPaymentTable if virtual else PaymentTable
+    return cls(parent, data_rows, sessions)
+
+
+class PaymentTable:
+    def __init__(self, parent, data_rows, sessions=False):
+        self.data_rows = data_rows
+        self.sessions = sessions
+        self.flagged = set()
+        self.columns = COLUMNS + ("Session",) if sessions else COLUMNS
+
+        self.frame = tk.Frame(parent)
+
+        # Scrollbars
+        self.scroll_y = tk.Scrollbar(self.frame, orient="vertical")
+        self.scroll_x = tk.Scrollbar(self.frame, orient="horizontal")
+
+        # Treeview widget
+        self.tree = ttk.Treeview(
+            self.frame,
+            columns=self.columns,
+            show="headings",
+            xscrollcommand=self.scroll_x.set
+        )
+        self.scroll_x.config(command=self.tree.xview)
+        self.tree.tag_configure("flagged", background=FLAGGED_COLOR)
+        self._connect_y()
+
+        self.scroll_y.pack(side="right", fill="y")
+        self.scroll_x.pack(side="bottom", fill="x")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        # Column headings and widths
+        for col in self.columns:
+            self.tree.heading(col, text = col)
+            if col in SORTABLE and hasattr(data_rows, "sort_by"):
+                self.tree.heading(col, command=lambda c=col: self.sort(c))
+            anchor = "e" if col == "Amount" else "w"
+            width = 60 if col in ("Index", "Amount") else 180
+            self.tree.column(col, width=width, anchor=anchor)
+
+        self._update_headings()
+        self.refresh()
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def sort(self, col):
+        column = SORTABLE[col]
+        descending = column == self.data_rows.sort_column and not self.data_rows.descending
+        self.data_rows.sort_by(column, descending)
+        self._update_headings()
+        self.reorder()
+
+    def _update_headings(self):
+        # Arrow on the heading of the column the rows are sorted by
+        sort_column = getattr(self.data_rows, "sort_column", None)
+        for col, column in SORTABLE.items():
+            if col not in self.columns:
+                continue
+            arrow = ""
+            if column == sort_column:
+                arrow = " \u25bc" if self.data_rows.descending else " \u25b2"
+            self.tree.heading(col, text = col + arrow)
+
+    def _connect_y(self):
+        self.tree.config(yscrollcommand=self.scroll_y.set)
+        self.scroll_y.config(command=self.tree.yview)
+
+    def _iid(self, row):
+        # Items are keyed by the row they show, so they survive re-ordering
+        return str(id(row))
+
+    def _tags(self, row):
+        return ("flagged",) if id(row) in self.flagged else ()
+
+    def set_flagged(self, rows):
+        # Highlight exactly these rows (by identity, so sorting keeps them)
+        self.flagged = {id(row) for row in rows}
+        for row in self.data_rows:
+            self.tree.item(self._iid(row), tags=self._tags(row))
+
+    def refresh(self):
+        # Rebuild every item; only needed when the row set was replaced
+        self.tree.delete(*self.tree.get_children())
+        for idx, row in enumerate(self.data_rows, 1):
+            self.tree.insert("", "end", iid=self._iid(row), values=RowValues(idx, row, self.sessions), tags=self._tags(row))
+
+    def reorder(self):
+        # Rows were re-sorted: move the existing items instead of rebuilding
+        for i, row in enumerate(self.data_rows):
+            iid = self._iid(row)
+            self.tree.move(iid, "", i)
+            self.tree.set(iid, "Index", i + 1)
+
+    def insert_row(self, i):
+        # data_rows[i] is new: add its item and renumber the rows below it
+        row = self.data_rows[i]
+        self.tree.insert("", i, iid=self._iid(row), values=RowValues(i + 1, row, self.sessions), tags=self._tags(row))
+        for j in range(i + 1, len(self.data_rows)):
+            self.tree.set(self._iid(self.data_rows[j]), "Index", j + 1)
+        self.tree.see(self._iid(row))
+
+    def update_row(self, i):
+        row = self.data_rows[i]
+        self.tree.item(self._iid(row), values=RowValues(i + 1, row, self.sessions), tags=self._tags(row))
+
+    def _index(self, iid):
+        # Position in data_rows of the row shown by item iid, or None
+        return next((i for i, row in enumerate(self.data_rows) if self._iid(row) == iid), None)
+
+    def on_activate(self, callback):
+        # callback(i) for the row double-clicked, or focused when Enter is pressed
+        def activate(iid):
+            i = self._index(iid) if iid else None
+            if i is not None:
+                callback(i)
+        self.tree.bind("<Double-1>", lambda event: activate(self.tree.identify_row(event.y)))
+        self.tree.bind("<Return>", lambda event: activate(self.tree.focus()))
+
+    def refresh_amounts(self):
+        for row in self.data_rows:
+            self.tree.set(self._iid(row), "Amount", FormatCents(row["cents"]))
+
+
+class VirtualPaymentTable(PaymentTable):
+    def __init__(self, parent, data_rows, sessions=False):
+        self.offset = 0       # index of the first row shown
+        self.visible = 1      # number of rows that fit in the window
+        self._row_height = None
+        self._header_height = None
+        self._remeasured = False
+        super().__init__(parent, data_rows, sessions)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_wheel)  # Windows/macOS
+        self.tree.bind("<Button-4>", lambda e: self._scroll_to(self.offset - 3) or "break")  # X11
+        self.tree.bind("<Button-5>", lambda e: self._scroll_to(self.offset + 3) or "break")
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", None), ("<Next>", None)):
+            self.tree.bind(key, self._on_key(key, step))
+        self.tree.bind("<Home>", lambda e: self._scroll_to(0) or "break")
+        self.tree.bind("<End>", lambda e: self._scroll_to(len(self.data_rows)) or "break")
+
+    def _connect_y(self):
+        # The scrollbar describes the position in data_rows, not in the tree
+        self.scroll_y.config(command=self._on_scrollbar)
+
+    def _slot(self, k):
+        return f"slot{k}"
+
+    def _measure(self):
+        # Row and heading heights are only known once an item is on screen
+        if self._row_height is None:
+            style_height = ttk.Style().lookup("Treeview", "rowheight")
+            self._row_height = int(style_height) if style_height else 20
+        if self._header_height is None and self.tree.get_children():
+            bbox = self.tree.bbox(self.tree.get_children()[0])
+            if bbox:
+                self._header_height = bbox[1]
+                self._row_height = bbox[3]
+
+    def _on_resize(self, event=None):
+        self._measure()
+        header = self._header_height if self._header_height is not None else 25
+        visible = max(1, (self.tree.winfo_height() - header) // self._row_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.refresh()
+        # The first pass has to guess the heading height; measure again once
+        # the rows are drawn
+        if self._header_height is None and not self._remeasured:
+            self._remeasured = True
+            self.tree.after_idle(self._on_resize)
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.data_rows) - self.visible))
+        if offset != self.offset:
+            self.offset = offset
+            # Slots get other rows now, so a selection would point elsewhere
+            self.tree.selection_remove(*self.tree.selection())
+            self.refresh()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.data_rows)))
+        elif action == "scroll":
+            step = self.visible if unit == "pages" else 1
+            self._scroll_to(self.offset + int(amount) * step)
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        notches = event.delta // 120 if abs(event.delta) >= 120 else (1 if event.delta > 0 else -1)
+        self._scroll_to(self.offset - 3 * notches)
+        return "break"
+
+    def _on_key(self, key, step):
+        def handler(event):
+            if step is None:
+                page = self.visible if key == "<Next>" else -self.visible
+                self._scroll_to(self.offset + page)
+            else:
+                self._scroll_to(self.offset + step)
+            return "break"
+        return handler
+
+    def refresh(self):
+        # Fill the pool of slot items with the rows of the current window
+        self.offset = max(0, min(self.offset, len(self.data_rows) - self.visible))
+        shown = min(self.visible, len(self.data_rows) - self.offset)
+        existing = len(self.tree.get_children())
+        for k in range(shown):
+            i = self.offset + k
+            values = RowValues(i + 1, self.data_rows[i], self.sessions)
+            tags = self._tags(self.data_rows[i])
+            if k < existing:
+                self.tree.item(self._slot(k), values=values, tags=tags)
+            else:
+                self.tree.insert("", "end", iid=self._slot(k), values=values, tags=tags)
+        for k in range(shown, existing):
+            self.tree.delete(self._slot(k))
+
+        total = len(self.data_rows)
+        if total:
+            self.scroll_y.set(self.offset / total, (self.offset + shown) / total)
+        else:
+            self.scroll_y.set(0, 1)
+
+    def reorder(self):
+        self.refresh()
+
+    def set_flagged(self, rows):
+        self.flagged = {id(row) for row in rows}
+        self.refresh()
+
+    def insert_row(self, i):
+        # Scroll so the new row is in view (refresh happens either way)
+        if not self.offset <= i < self.offset + self.visible:
+            self.offset = i - self.visible // 2
+        self.refresh()
+
+    def _index(self, iid):
+        i = self.offset + int(iid[len("slot"):])
+        return i if i < len(self.data_rows) else None
+
+    def update_row(self, i):
+        if self.offset <= i < self.offset + self.visible:
+            row = self.data_rows[i]
+            self.tree.item(self._slot(i - self.offset), values=RowValues(i + 1, row, self.sessions), tags=self._tags(row))
+
+    def refresh_amounts(self):
+        for k in range(len(self.tree.get_children())):
+            row = self.data_rows[self.offset + k]
+            self.tree.set(self._slot(k), "Amount", FormatCents(row["cents"]))
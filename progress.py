@@ -0,0 +1,143 @@
+import time
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+# Long-running steps (importing a file, building the SEPA payments, writing
+# the XML, PDFs and zip) run on a worker thread so the window keeps
+# repainting instead of showing "Not responding". The worker reports its
+# stage and row counts through a queue that the progress dialog polls with
+# after(); Tk itself is only ever touched from the main thread.
+
+class Cancelled(Exception):
+    pass
+
+
+class Progress:
+    """Handed to the work function, which calls it with its current stage:
+    progress("Building SEPA payments", done, total).
+
+    Once the user has pressed Cancel, the next call raises Cancelled, so the
+    work stops at a stage or row boundary and cleans up on the way out.
+    """
+
+    # Updates within a stage are passed on at most this often (seconds)
+    _INTERVAL = 0.1
+
+    def __init__(self):
+        self.updates = queue.Queue()
+        self._cancel = threading.Event()
+        self._stage = None
+        self._last = 0.0
+
+    def __call__(self, stage, done=None, total=None):
+        if self._cancel.is_set():
+            raise Cancelled()
+        now = time.perf_counter()
+        if stage != self._stage or now - self._last >= self._INTERVAL or (total and done == total):
+            self._stage, self._last = stage, now
+            self.updates.put((stage, done, total))
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+
+def RunInBackground(parent, title, work, delay=250):
+    """Run work(progress) on a worker thread behind a modal progress dialog.
+
+    Returns what work returned and re-raises what it raised (Cancelled if
+    the user cancelled). The dialog is modal from the start, so nothing can
+    start a second job while this one runs, but it only becomes visible if
+    the work takes longer than delay milliseconds, so quick jobs don't flash
+    a window.
+    """
+    progress = Progress()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = work(progress)
+        except BaseException as e:
+            outcome["error"] = e
+        progress.updates.put(None)
+
+    dialog = tk.Toplevel(parent)
+    dialog.withdraw()
+    dialog.title(title)
+    dialog.transient(parent)
+    dialog.resizable(False, False)
+
+    stage_label = tk.Label(dialog, text="Starting...", anchor="w", width=45)
+    stage_label.grid(row=0, column=0, sticky="w", padx=16, pady=(14, 4))
+    bar = ttk.Progressbar(dialog, length=320, mode="indeterminate")
+    bar.grid(row=1, column=0, padx=16, pady=4)
+    count_label = tk.Label(dialog, text="", fg="gray", anchor="w")
+    count_label.grid(row=2, column=0, sticky="w", padx=16)
+
+    def on_cancel():
+        progress.cancel()
+        stage_label.config(text="Cancelling...")
+        cancel_button.config(state="disabled")
+
+    cancel_button = tk.Button(dialog, text="Cancel", width=10, command=on_cancel)
+    cancel_button.grid(row=3, column=0, pady=(8, 12))
+    dialog.protocol("WM_DELETE_WINDOW", on_cancel)
+
+    def show():
+        if dialog.winfo_exists():
+            dialog.attributes("-alpha", 1.0)
+
+    def poll():
+        while True:
+            try:
+                update = progress.updates.get_nowait()
+            except queue.Empty:
+                break
+            if update is None:
+                dialog.destroy()
+                return
+            if progress.cancelled:
+                continue
+            stage, done, total = update
+            stage_label.config(text=stage)
+            if total:
+                if str(bar["mode"]) != "determinate":
+                    bar.stop()
+                bar.config(mode="determinate", maximum=total, value=done or 0)
+                count_label.config(text=f"{done or 0} of {total}")
+            else:
+                if str(bar["mode"]) != "indeterminate":
+                    bar.config(mode="indeterminate", value=0)
+                    bar.start(15)
+                count_label.config(text="" if done is None else f"{done} so far")
+        dialog.after(50, poll)
+
+    # Center over the parent window rather than the top-left corner.
+    dialog.update_idletasks()
+    dw, dh = dialog.winfo_reqwidth(), dialog.winfo_reqheight()
+    x = parent.winfo_rootx() + (parent.winfo_width() - dw) // 2
+    y = parent.winfo_rooty() + (parent.winfo_height() - dh) // 2
+    dialog.geometry(f"+{x}+{y}")
+    # Mapped and grabbed right away, but transparent until show(): a grab
+    # needs a mapped window, and without it the windows behind would take
+    # clicks (Generate, Combine, ...) that start a second job on the same
+    # rows. Window managers without transparency show it at once instead.
+    dialog.attributes("-alpha", 0.0)
+    dialog.deiconify()
+    dialog.grab_set()
+    dialog.focus_set()
+
+    bar.start(15)
+    threading.Thread(target=run, daemon=True).start()
+    dialog.after(delay, show)
+    dialog.after(50, poll)
+    parent.wait_window(dialog)
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
@@ -0,0 +1,236 @@
+"""
+Reconcile bank statements against the exported batches.
+
+Reads camt.053 (account statement) and camt.054 (debit/credit notification)
+XML from the bank and matches every booking to the payment with the same
+End-to-End ID in the payment ledger (see ledger.py). For each batch that
+shows up in the statements it reports which payments were paid, which came
+back (returns and reversals) and which are missing.
+
+Statements are read with iterparse and every entry is dropped as soon as it
+has been read, so even multi-megabyte statements never sit in memory as a
+whole; only the bookings with an End-to-End ID are kept, in a dict keyed by
+that ID.
+
+Example:
+    python reconcile.py statement_2025-07.xml --ledger ledger.db
+"""
+
+import os
+import sys
+import json
+import argparse
+import xml.etree.ElementTree as ET
+from decimal import Decimal, InvalidOperation
+
+from ledger import BatchesOf, LoadBatches
+from timing import Span
+
+
+def _Local(tag):
+    # camt comes in many versions, each with its own namespace
+    return tag.rpartition("}")[2]
+
+def _Find(elem, *path):
+    # Descendant at path (local names, one level each), or None
+    for name in path:
+        elem = next((child for child in elem if _Local(child.tag) == name), None)
+        if elem is None:
+            return None
+    return elem
+
+def _Text(elem, *path):
+    found = _Find(elem, *path)
+    return found.text.strip() if found is not None and found.text else None
+
+def _Cents(elem):
+    if elem is None or not elem.text:
+        return None
+    try:
+        return int(Decimal(elem.text.strip()) * 100)
+    except InvalidOperation:
+        return None
+
+def ReadBookings(statement_path, progress=None):
+    """Yield the transactions booked in a camt.053/camt.054 file.
+
+    Each booking is a dict with endtoend_id (None if the bank gave none),
+    amount_cents, currency, credit_debit ("DBIT" or "CRDT"), returned (a
+    return or reversal), reason (the return reason code), booking_date and
+    status. An entry without transaction details (e.g. a batch booked as
+    one sum) yields one booking without an End-to-End ID. progress, if
+    given, is called with the number of entries read so far.
+    """
+    entry = None
+    entries = 0
+    details = 0
+    elems = []
+    for event, elem in ET.iterparse(statement_path, events=("start", "end")):
+        if event == "start":
+            elems.append(elem)
+            if _Local(elem.tag) == "Ntry":
+                entry = {}
+                details = 0
+            continue
+        elems.pop()
+        name = _Local(elem.tag)
+        if entry is None:
+            continue
+        parent = _Local(elems[-1].tag) if elems else None
+
+        # Entry-level fields come before the transaction details
+        if parent == "Ntry":
+            if name == "Amt":
+                entry["amount_cents"] = _Cents(elem)
+                entry["currency"] = elem.get("Ccy")
+            elif name == "CdtDbtInd":
+                entry["credit_debit"] = (elem.text or "").strip()
+            elif name == "RvslInd":
+                entry["reversal"] = (elem.text or "").strip().lower() == "true"
+            elif name == "Sts":
+                # Plain text up to version 06, <Cd> from 08 on
+                entry["status"] = _Text(elem, "Cd") or (elem.text or "").strip()
+            elif name == "BookgDt":
+                entry["booking_date"] = (_Text(elem, "Dt") or _Text(elem, "DtTm") or "")[:10] or None
+
+        if name == "TxDtls":
+            details += 1
+            yield _Booking(entry, elem)
+            elems[-1].remove(elem)
+        elif name == "Ntry":
+            if not details:
+                yield _Booking(entry, None)
+            entries += 1
+            if progress is not None:
+                progress(entries)
+            entry = None
+            if elems:
+                elems[-1].remove(elem)
+
+def _Booking(entry, details):
+    booking = {
+        "endtoend_id": None,
+        "amount_cents": entry.get("amount_cents"),
+        "currency": entry.get("currency"),
+        "credit_debit": entry.get("credit_debit"),
+        "returned": entry.get("reversal", False),
+        "reason": None,
+        "booking_date": entry.get("booking_date"),
+        "status": entry.get("status") or "BOOK",
+    }
+    if details is None:
+        return booking
+    endtoend_id = _Text(details, "Refs", "EndToEndId")
+    if endtoend_id and endtoend_id != "NOTPROVIDED":
+        booking["endtoend_id"] = endtoend_id
+    # The transaction amount sits in AmtDtls/TxAmt, or directly in TxDtls
+    # from version 08 on
+    amount = _Find(details, "AmtDtls", "TxAmt", "Amt")
+    if amount is None:
+        amount = _Find(details, "Amt")
+    if amount is not None:
+        booking["amount_cents"] = _Cents(amount)
+        booking["currency"] = amount.get("Ccy") or booking["currency"]
+    booking["credit_debit"] = _Text(details, "CdtDbtInd") or booking["credit_debit"]
+    returned = _Find(details, "RtrInf")
+    if returned is not None:
+        booking["returned"] = True
+        booking["reason"] = _Text(returned, "Rsn", "Cd") or _Text(returned, "Rsn", "Prtry")
+    # Money coming back in with one of our End-to-End IDs is a return too
+    if booking["credit_debit"] == "CRDT":
+        booking["returned"] = True
+    return booking
+
+def Reconcile(ledger_path, statement_paths, batch_ids=(), progress=None):
+    """Match the bookings in statement_paths against the payment ledger.
+
+    Returns a dict with
+      batches   - one dict per batch with an End-to-End ID in the
+                  statements (and per batch in batch_ids): the ledger's batch
+                  fields plus "paid", "returned" and "missing", lists of its
+                  payments. A payment that was booked and then returned is
+                  only listed as returned. Payments carry booked_cents,
+                  booking_date and reason from their booking.
+      unmatched - bookings with an End-to-End ID that is not in the ledger
+      booked    - the number of booked transactions read
+      without_id - bookings without an End-to-End ID (batch bookings as
+                  one sum, fees, ...), which can't be matched
+    Only booked entries count; pending ones are skipped. progress is called
+    as progress(stage, done, total).
+    """
+    bookings = {}
+    booked = 0
+    without_id = 0
+    with Span("reconcile read", files=len(statement_paths)) as span:
+        for path in statement_paths:
+            stage = f"Reading {os.path.basename(path)}"
+            for booking in ReadBookings(path, progress and (lambda entries: progress(stage, entries))):
+                if booking["status"] != "BOOK":
+                    continue
+                booked += 1
+                if booking["endtoend_id"] is None:
+                    without_id += 1
+                else:
+                    bookings.setdefault(booking["endtoend_id"], []).append(booking)
+        span.set(rows=booked, bytes=sum(os.path.getsize(p) for p in statement_paths))
+
+    with Span("reconcile match", bookings=len(bookings)):
+        if progress is not None:
+            progress("Matching with the payment ledger")
+        batches = LoadBatches(ledger_path, BatchesOf(ledger_path, bookings) | set(batch_ids))
+        matched = set()
+        for batch in batches:
+            batch["paid"], batch["returned"], batch["missing"] = [], [], []
+            for payment in batch.pop("transfers"):
+                found = bookings.get(payment["endtoend_id"])
+                if not found:
+                    batch["missing"].append(payment)
+                    continue
+                matched.add(payment["endtoend_id"])
+                returned = [b for b in found if b["returned"]]
+                booking = returned[0] if returned else found[0]
+                payment = dict(payment, booked_cents=booking["amount_cents"], booking_date=booking["booking_date"], reason=booking["reason"])
+                batch["returned" if returned else "paid"].append(payment)
+        unmatched = [b for endtoend_id, found in bookings.items() if endtoend_id not in matched for b in found]
+    return {"batches": batches, "unmatched": unmatched, "booked": booked, "without_id": without_id}
+
+def _Amount(cents):
+    return "" if cents is None else f"{Decimal(cents) / 100:.2f}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile camt.053/camt.054 bank statements against the exported batches.")
+    parser.add_argument("statements", nargs="+", help="camt.053/camt.054 XML files")
+    parser.add_argument("--ledger", required=True, help="payment ledger (the ledger.db next to the GUI)")
+    parser.add_argument("--batch", type=int, action="append", default=[],
+                        help="also report this batch id if none of its payments is in the statements (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.ledger):
+        parser.error(f"payment ledger {args.ledger} not found")
+    result = Reconcile(args.ledger, args.statements, args.batch)
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        for batch in result["batches"]:
+            print(f"Batch {batch['id']} ({batch['created'].replace('T', ' ')}, {batch['experiment']}, {batch['reference']}): "
+                  f"{len(batch['paid'])} paid, {len(batch['returned'])} returned, {len(batch['missing'])} missing of {batch['payments']}")
+            for payment in batch["returned"]:
+                print(f"    returned: {payment['name']} {_Amount(payment['amount_cents'])} ({payment['endtoend_id']}, {payment['reason'] or 'no reason given'})")
+            for payment in batch["missing"]:
+                print(f"    missing: {payment['name']} {_Amount(payment['amount_cents'])} ({payment['endtoend_id']})")
+            for payment in batch["paid"]:
+                if payment["booked_cents"] is not None and payment["booked_cents"] != payment["amount_cents"]:
+                    print(f"    paid a different amount: {payment['name']} {_Amount(payment['booked_cents'])} instead of {_Amount(payment['amount_cents'])}")
+        if result["unmatched"]:
+            print(f"{len(result['unmatched'])} bookings with an End-to-End ID that is not in the ledger")
+        if result["without_id"]:
+            print(f"{result['without_id']} bookings without an End-to-End ID")
+
+    return 1 if any(batch["returned"] or batch["missing"] for batch in result["batches"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
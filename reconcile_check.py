@@ -0,0 +1,154 @@
+"""
+Regression check of the statement reconciliation (reconcile.py).
+
+Records three batches in a temporary payment ledger and reconciles them
+against the anonymized statements in reconcile_samples/: a camt.053.001.02
+account statement with a batch booking, a fee, a pending entry and a
+booking without End-to-End ID, and a camt.054.001.08 notification with a
+return (AC04), a reversal and a booking that belongs to no batch. It then
+compares which payments come out as paid, returned (with the reason) or
+missing, the booked amounts and dates, and the counts of unmatched and
+unidentifiable bookings with the expected result. The exit code is 1 if
+anything differs, so run it after touching ReadBookings or Reconcile.
+
+Example:
+    python reconcile_check.py
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+
+from ledger import RecordBatch
+from reconcile import Reconcile
+from rows import PaymentBatch
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reconcile_samples")
+STATEMENTS = ["camt053_batch.xml", "camt054_returns.xml"]
+
+def _Id(batch, number):
+    return f"ZTS{batch}{number:028d}"
+
+# (experiment, [(name, IBAN, cents, End-to-End ID)]) as exported
+BATCHES = [
+    ("Study A - Session 1", [
+        ("Participant One", "DE89370400440532013000", 1250, _Id("A", 1)),
+        ("Participant Two", "DE75512108001245126199", 1500, _Id("A", 2)),
+        ("Participant Three", "DE12500105170648489890", 1000, _Id("A", 3)),
+        ("Participant Four", "DE02120300000000202051", 2000, _Id("A", 4)),
+        ("Participant Five", "DE02500105170137075030", 700, _Id("A", 5)),
+    ]),
+    ("Study B - Session 1", [
+        ("Participant Six", "DE91100000000123456789", 1200, _Id("B", 1)),
+        ("Participant Seven", "DE89370400440532013000", 800, _Id("B", 2)),
+    ]),
+    # Nothing of it in the statements, so only reported when asked for
+    ("Study C - Session 1", [
+        ("Participant Eight", "DE75512108001245126199", 900, _Id("C", 1)),
+    ]),
+]
+
+# Per experiment: End-to-End ID -> (outcome, booked cents, booking date, reason)
+EXPECTED = {
+    "Study A - Session 1": {
+        _Id("A", 1): ("paid", 1250, "2025-07-11", None),
+        _Id("A", 2): ("paid", 1500, "2025-07-11", None),
+        # Booked with a different amount than exported
+        _Id("A", 3): ("paid", 950, "2025-07-11", None),
+        # Paid in the statement, returned in the notification
+        _Id("A", 4): ("returned", 2000, "2025-07-15", "AC04"),
+        # Only pending
+        _Id("A", 5): ("missing", None, None, None),
+    },
+    "Study B - Session 1": {
+        _Id("B", 1): ("returned", 1200, "2025-07-15", None),
+        _Id("B", 2): ("paid", 800, "2025-07-14", None),
+    },
+}
+EXPECTED_REQUESTED = {
+    "Study C - Session 1": {
+        _Id("C", 1): ("missing", None, None, None),
+    },
+}
+EXPECTED_UNMATCHED = [_Id("X", 9999)]
+# Four transactions of the batch booking and four single bookings
+EXPECTED_BOOKED = 10
+# The fee and the NOTPROVIDED booking
+EXPECTED_WITHOUT_ID = 2
+
+
+def RecordSamples(ledger_path):
+    """Record BATCHES in the ledger; returns {experiment: batch id}."""
+    batch_ids = {}
+    for experiment, payments in BATCHES:
+        batch = PaymentBatch()
+        for name, iban, cents, endtoend_id in payments:
+            batch.append(name, iban, cents, endtoend_id=endtoend_id)
+        config = {"experiment": experiment, "reference": "Lab Payment 10 July 2025", "currency": "EUR"}
+        batch_ids[experiment] = RecordBatch(ledger_path, config, batch, [])
+    return batch_ids
+
+def _Outcomes(result):
+    # {experiment: {End-to-End ID: (outcome, booked cents, booking date, reason)}}
+    outcomes = {}
+    for batch in result["batches"]:
+        payments = outcomes.setdefault(batch["experiment"], {})
+        for outcome in ("paid", "returned", "missing"):
+            for payment in batch[outcome]:
+                payments[payment["endtoend_id"]] = (outcome, payment.get("booked_cents"),
+                                                    payment.get("booking_date"), payment.get("reason"))
+    return outcomes
+
+def Compare(result, expected):
+    """Descriptions of every way result (from Reconcile) differs from the
+    expected outcomes and counts."""
+    problems = []
+    outcomes = _Outcomes(result)
+    for experiment in sorted(set(outcomes) | set(expected)):
+        if experiment not in outcomes:
+            problems.append(f"{experiment}: not reported")
+            continue
+        if experiment not in expected:
+            problems.append(f"{experiment}: reported but not expected")
+            continue
+        for endtoend_id, want in expected[experiment].items():
+            got = outcomes[experiment].get(endtoend_id)
+            if got != want:
+                problems.append(f"{experiment}, {endtoend_id}: {got} instead of {want}")
+    unmatched = sorted(b["endtoend_id"] for b in result["unmatched"])
+    if unmatched != EXPECTED_UNMATCHED:
+        problems.append(f"unmatched bookings {unmatched} instead of {EXPECTED_UNMATCHED}")
+    if result["booked"] != EXPECTED_BOOKED:
+        problems.append(f"{result['booked']} booked transactions instead of {EXPECTED_BOOKED}")
+    if result["without_id"] != EXPECTED_WITHOUT_ID:
+        problems.append(f"{result['without_id']} bookings without End-to-End ID instead of {EXPECTED_WITHOUT_ID}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the reconciliation against the sample statements.")
+    parser.add_argument("--samples", default=SAMPLES_DIR, help="directory with the sample statements")
+    args = parser.parse_args(argv)
+
+    statements = [os.path.join(args.samples, name) for name in STATEMENTS]
+    problems = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        ledger_path = os.path.join(work_dir, "ledger.db")
+        batch_ids = RecordSamples(ledger_path)
+        problems += Compare(Reconcile(ledger_path, statements), EXPECTED)
+        # Asking for a batch by id reports it even without bookings
+        requested = Reconcile(ledger_path, statements, [batch_ids["Study C - Session 1"]])
+        problems += [f"with --batch: {p}" for p in Compare(requested, dict(EXPECTED, **EXPECTED_REQUESTED))]
+
+    for problem in problems:
+        print(problem)
+    if problems:
+        print(f"{len(problems)} differences.")
+        return 1
+    print(f"All {len(STATEMENTS)} statements reconcile as expected.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
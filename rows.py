@@ -0,0 +1,219 @@
+import sys
+from array import array
+from decimal import Decimal
+
+# The payments of a batch, from the preview to the export.
+#
+# PaymentBatch stores them column by column: names, IBANs, BICs and sessions
+# as lists of interned strings (the same BIC and session recur on many
+# rows), amounts as integer cents in an array and the End-to-End IDs once
+# MakeSepa assigns them. Each payment is seen through a PaymentRow, a
+# two-slot view that reads and writes like the payment dicts the parser
+# makes (row["name"], row.get("bic"), row["amount"] as a Decimal, ...) plus
+# row["cents"]. The batch keeps the total in cents up to date as amounts
+# change, so totals cost nothing.
+#
+# PaymentRows is the list of row views behind the preview. It stays ordered
+# by one column at a time and caches the collation key of every row per
+# column, so re-sorting by a column that was used before, or placing a new
+# row, never recomputes keys for the existing rows.
+
+def Cents(amount):
+    # Amounts are quantized to cents by the parser, so this is exact
+    return int(amount * 100)
+
+def FormatCents(cents):
+    sign = "-" if cents < 0 else ""
+    whole, part = divmod(abs(cents), 100)
+    return f"{sign}{whole}.{part:02d}"
+
+def TotalCents(rows):
+    # O(1) for a PaymentBatch or PaymentRows, a sum for anything else
+    total = getattr(rows, "total_cents", None)
+    return total if total is not None else sum(row["cents"] for row in rows)
+
+
+class PaymentRow:
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def __getitem__(self, key):
+        batch, i = self.batch, self.index
+        if key == "cents":
+            return batch._cents[i]
+        if key == "amount":
+            return Decimal(batch._cents[i]).scaleb(-2)
+        if key == "combined":
+            return batch._combined[i]
+        try:
+            return batch._columns[key][i]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        batch, i = self.batch, self.index
+        if key in ("amount", "cents"):
+            cents = Cents(value) if key == "amount" else value
+            batch.total_cents += cents - batch._cents[i]
+            batch._cents[i] = cents
+        elif key == "combined":
+            batch._combined[i] = value
+        elif key in batch._columns:
+            batch._columns[key][i] = sys.intern(value) if isinstance(value, str) else value
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        value = self[key]
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"PaymentRow({self['name']!r}, {self['iban']!r}, {FormatCents(self['cents'])})"
+
+
+class PaymentBatch:
+    """Columnar storage of payments; iterating or indexing gives PaymentRow
+    views, which stay the same objects for the life of the batch.
+
+    rows may be payment dicts (with "amount" or "cents") or rows of another
+    batch, which are copied.
+    """
+
+    def __init__(self, rows=()):
+        self._columns = {"name": [], "iban": [], "bic": [], "session": [], "endtoend_id": []}
+        self._cents = array("q")
+        self._combined = array("l")
+        self._rows = []
+        self.total_cents = 0
+        for row in rows:
+            self.append(row["name"], row["iban"], row["cents"] if isinstance(row, PaymentRow) else Cents(row["amount"]),
+                        row.get("bic"), row.get("session"), row.get("endtoend_id"))
+
+    def append(self, name, iban, cents, bic=None, session=None, endtoend_id=None):
+        """Add a payment and return its row."""
+        columns = self._columns
+        columns["name"].append(sys.intern(name))
+        columns["iban"].append(sys.intern(iban))
+        columns["bic"].append(sys.intern(bic) if bic else None)
+        columns["session"].append(sys.intern(session) if session else None)
+        columns["endtoend_id"].append(endtoend_id)
+        self._cents.append(cents)
+        self._combined.append(1)
+        self.total_cents += cents
+        row = PaymentRow(self, len(self._rows))
+        self._rows.append(row)
+        return row
+
+    @property
+    def cents(self):
+        # The amounts in row order (don't modify; use set_cents)
+        return self._cents
+
+    @property
+    def sessions(self):
+        return self._columns["session"]
+
+    def set_cents(self, amounts):
+        # Replace all amounts at once, in row order
+        if len(amounts) != len(self._cents):
+            raise ValueError("set_cents needs one amount per payment")
+        self._cents = array("q", amounts)
+        self.total_cents = sum(self._cents)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __getitem__(self, i):
+        return self._rows[i]
+
+    def __getstate__(self):
+        # Sent to worker processes without the views; they are rebuilt there
+        return self._columns, self._cents, self._combined, self.total_cents
+
+    def __setstate__(self, state):
+        self._columns, self._cents, self._combined, self.total_cents = state
+        self._rows = [PaymentRow(self, i) for i in range(len(self._cents))]
+
+
+SORT_KEYS = {
+    "name": lambda row: row["name"].casefold(),
+    "iban": lambda row: row["iban"],
+    "amount": lambda row: row["cents"],
+    "session": lambda row: row["session"] or "",
+}
+
+class PaymentRows(list):
+    """The rows of a PaymentBatch (made from rows if it isn't one), kept
+    sorted by sort_column.
+
+    It is still a plain list to everything that only reads it (export, PDF,
+    ...). New payments are appended to batch and placed with insert_sorted
+    so the cached keys stay in step; after changing a value in place, call
+    changed(column).
+    """
+
+    def __init__(self, rows=(), column="name", descending=False):
+        self.batch = rows if isinstance(rows, PaymentBatch) else PaymentBatch(rows)
+        super().__init__(self.batch)
+        self._keys = {}
+        self.sort_column = column
+        self.descending = descending
+        self.sort_by(column, descending)
+
+    def keys(self, column):
+        # Cached keys for column, aligned with the current row order
+        keys = self._keys.get(column)
+        if keys is None or len(keys) != len(self):
+            keys = self._keys[column] = [SORT_KEYS[column](row) for row in self]
+        return keys
+
+    @property
+    def total_cents(self):
+        return self.batch.total_cents
+
+    def replace(self, rows):
+        # Swap in a new set of rows, kept in the current order
+        self.batch = rows if isinstance(rows, PaymentBatch) else PaymentBatch(rows)
+        self[:] = self.batch
+        self._keys = {}
+        self.sort_by(self.sort_column, self.descending)
+
+    def changed(self, column):
+        # Values of column were modified in place; drop their cached keys
+        self._keys.pop(column, None)
+
+    def sort_by(self, column, descending=False):
+        keys = self.keys(column)
+        order = sorted(range(len(self)), key=keys.__getitem__, reverse=descending)
+        self[:] = [self[i] for i in order]
+        for col, col_keys in self._keys.items():
+            self._keys[col] = [col_keys[i] for i in order]
+        self.sort_column = column
+        self.descending = descending
+
+    def insert_sorted(self, row):
+        """Insert row at its place in the current order and return the index.
+
+        Rows with an equal key keep their order, the new one goes after them
+        (as appending and re-sorting would do).
+        """
+        keys = self.keys(self.sort_column)
+        key = SORT_KEYS[self.sort_column](row)
+        lo, hi = 0, len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (key < keys[mid]) if not self.descending else (key > keys[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+
+        for col, col_keys in self._keys.items():
+            col_keys.insert(lo, key if col == self.sort_column else SORT_KEYS[col](row))
+        self.insert(lo, row)
+        return lo
@@ -0,0 +1,148 @@
+from array import array
+from decimal import Decimal, InvalidOperation
+
+from rows import FormatCents
+from timing import Span
+
+# Payout rules: an ordered list of amount transformations applied to every
+# payment of a batch, e.g. a show-up fee, a minimum payout, a cap and
+# rounding up to the next 0.50. Rule sets are kept in settings.json under
+# "payout_rules", one list of rule lines per name:
+#
+#   "payout_rules": {
+#       "Standard": ["add 5", "min 10", "max 40", "round up 0.50"]
+#   }
+#
+# A rule line is an operation with its value, optionally limited to some
+# sessions (the .pay file names shown in the Session column):
+#   add AMOUNT                    add AMOUNT (negative to subtract)
+#   min AMOUNT                    raise smaller amounts to AMOUNT
+#   max AMOUNT                    lower larger amounts to AMOUNT
+#   round [up|down] INCREMENT     round to a multiple of INCREMENT (to the
+#                                 nearest one, halves up, unless up or down)
+#   multiply FACTOR               multiply, rounded to the cent (halves up)
+#   ... session NAME [NAME ...]   only for payments of these sessions
+#
+# Everything is computed on the integer cents of the PaymentBatch, the
+# factors as exact fractions, so the result doesn't depend on float
+# rounding or on the size of the batch. The rules are compiled once into
+# integer functions and applied in one pass over the amounts.
+
+OPERATIONS = ("add", "min", "max", "round", "multiply")
+
+def _Decimal(text, what):
+    try:
+        value = Decimal(text.replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"{text} is not a valid {what}") from None
+    if not value.is_finite():
+        raise ValueError(f"{text} is not a valid {what}")
+    return value
+
+def _Cents(text, what="amount"):
+    value = _Decimal(text, what) * 100
+    if value != value.to_integral_value():
+        raise ValueError(f"{text} has more than two decimals")
+    return int(value)
+
+def _RoundHalfUp(numerator, denominator):
+    # numerator / denominator rounded to an integer, halves up
+    return (2 * numerator + denominator) // (2 * denominator)
+
+def _Rule(op, tokens):
+    # The integer function for one rule
+    if op == "round":
+        mode = "nearest"
+        if tokens and tokens[0] in ("up", "down", "nearest"):
+            mode = tokens.pop(0)
+        if len(tokens) != 1:
+            raise ValueError("expected round [up|down] INCREMENT")
+        step = _Cents(tokens[0], "increment")
+        if step <= 0:
+            raise ValueError("the increment must be greater than zero")
+        if mode == "up":
+            return lambda c: -(-c // step) * step
+        if mode == "down":
+            return lambda c: c // step * step
+        return lambda c: _RoundHalfUp(c, step) * step
+    if len(tokens) != 1:
+        raise ValueError(f"expected {op} {'FACTOR' if op == 'multiply' else 'AMOUNT'}")
+    if op == "multiply":
+        numerator, denominator = _Decimal(tokens[0], "factor").as_integer_ratio()
+        if numerator < 0:
+            raise ValueError("the factor must not be negative")
+        return lambda c: _RoundHalfUp(c * numerator, denominator)
+    cents = _Cents(tokens[0])
+    if op == "add":
+        return lambda c: c + cents
+    if op == "min":
+        return lambda c: c if c > cents else cents
+    return lambda c: c if c < cents else cents
+
+def ParseRules(lines):
+    """Compile rule lines (see above) into a list of (function, sessions)
+    pairs, sessions being a set of session names or None for all payments.
+
+    Raises ValueError naming the first rule that can't be read.
+    """
+    rules = []
+    for number, line in enumerate(lines, 1):
+        tokens = line.split()
+        if not tokens:
+            continue
+        try:
+            op = tokens.pop(0).lower()
+            if op not in OPERATIONS:
+                raise ValueError(f"unknown operation, use one of {', '.join(OPERATIONS)}")
+            sessions = None
+            lowered = [t.lower() for t in tokens]
+            if "session" in lowered:
+                at = lowered.index("session")
+                tokens, sessions = tokens[:at], set(tokens[at + 1:])
+                if not sessions:
+                    raise ValueError("expected session names after session")
+            rules.append((_Rule(op, [t.lower() for t in tokens]), sessions))
+        except ValueError as e:
+            raise ValueError(f"Rule {number} ({line.strip()}): {e}.") from None
+    return rules
+
+def ApplyRules(batch, rules):
+    """The amounts of batch (a PaymentBatch) after rules, as an array of
+    cents in the batch's row order. batch itself is not changed."""
+    with Span("payout rules", rows=len(batch), rules=len(rules)):
+        amounts = array("q", batch.cents)
+        if not rules:
+            return amounts
+        if all(sessions is None for _, sessions in rules):
+            functions = [function for function, _ in rules]
+            for i, c in enumerate(amounts):
+                for function in functions:
+                    c = function(c)
+                amounts[i] = c
+        else:
+            for i, (c, session) in enumerate(zip(amounts, batch.sessions)):
+                for function, sessions in rules:
+                    if sessions is None or session in sessions:
+                        c = function(c)
+                amounts[i] = c
+    return amounts
+
+def RulesSummary(batch, amounts):
+    """Before/after figures for showing amounts (from ApplyRules) before
+    they are applied: totals in cents, the number of payments that change
+    and the number that would end up zero or negative."""
+    return {
+        "before": batch.total_cents,
+        "after": sum(amounts),
+        "changed": sum(1 for old, new in zip(batch.cents, amounts) if old != new),
+        "not_positive": sum(1 for c in amounts if c <= 0),
+    }
+
+def DescribeSummary(summary, currency):
+    text = (f"Total before: {FormatCents(summary['before'])} {currency}\n"
+            f"Total after: {FormatCents(summary['after'])} {currency} "
+            f"({'+' if summary['after'] >= summary['before'] else ''}{FormatCents(summary['after'] - summary['before'])})\n"
+            f"Payments changed: {summary['changed']}")
+    if summary["not_positive"]:
+        text += f"\n{summary['not_positive']} payments would be zero or negative"
+    return text
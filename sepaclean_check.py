@@ -0,0 +1,118 @@
+"""
+Equivalence check of SepaClean against its original implementation.
+
+SepaClean (utils.py) maps text through a precompiled translate table with an
+ASCII fast path and a memo; the original did the same in three passes with
+a regular expression. This runs both over a fixed corpus of hand-picked
+cases (umlauts, accents, combining marks, other scripts, whitespace runs,
+control characters, symbols) plus seeded random strings from the same
+character pools, through SepaClean and SepaCleanMany, and reports every
+string where they differ. The exit code is 1 if any does, so run it after
+touching _SEPA_TABLE, _UMLAUTS or SepaClean.
+
+Example:
+    python sepaclean_check.py
+    python sepaclean_check.py --random 100000 --seed 7
+"""
+
+import re
+import sys
+import random
+import argparse
+
+from text_unidecode import unidecode
+
+from utils import SepaClean, SepaCleanMany, _SEPA_ALLOWED
+
+
+def BaselineSepaClean(text):
+    # The implementation SepaClean replaced, kept verbatim as the reference
+    text = (
+        text.replace("ä", "ae").replace("Ä", "Ae")
+            .replace("ö", "oe").replace("Ö", "Oe")
+            .replace("ü", "ue").replace("Ü", "Ue")
+            .replace("ß", "ss")
+    )
+    text = unidecode(text)
+    text = text.replace("&", "+")
+    text = "".join(c if c in _SEPA_ALLOWED else " " for c in text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+CORPUS = [
+    # Plain and empty
+    "", " ", "Max Mustermann", "O'Brien-Smith", "Lab Payment 10 July 2025 - 10am",
+    "a/b-c?d:e(f)g.h,i'j+k", "0123456789",
+    # German umlauts, as precomposed and as combining marks
+    "Jörg Müller", "ÄÖÜ äöü ß", "Straße", "MÜLLER", "Grün", "Müller", "Ärger",
+    # Other Latin accents and combining marks
+    "José García", "François Lefèvre", "Łukasz Żółć", "Søren Ærø", "Ångström", "Dvořák", "Ðorđe",
+    "é", "ñ", "å", "́leading mark", "trailing marķ",
+    # Other scripts
+    "Дмитрий Иванов", "Ελένη", "王小明", "山田太郎", "김민준", "محمد", "דוד", "ศรี",
+    # Whitespace runs and odd whitespace
+    "  Max   Mustermann  ", "Max\tMustermann", "Max\nMustermann", "Max\r\nMustermann",
+    "Max Mustermann", "Max  Mustermann", "Max　Mustermann", "\t \n",
+    # Control and invisible characters
+    "Max\x00Mustermann", "Max\x07", "\x1b[31mred\x1b[0m", "Max​Mustermann", "﻿BOM",
+    "Max­Mustermann", "Max‍Mustermann",
+    # Symbols and punctuation outside the SEPA set
+    "Tom & Jerry", "&&", "R&D", "50%", "100 €", "£5", "¥", "a@b.de", "#1", "*", "x_y", "a;b", "a|b",
+    "\"quoted\"", "«Zitat»", "„Zitat“", "‘single’", "a–b—c", "…", "™ ® ©", "½ ¼", "²³", "°C",
+    "😀 Smile", "♥", "→", "Max!", "[x]", "{x}", "<x>", "a=b", "~", "`", "^", "\\",
+    # Fullwidth and compatibility forms
+    "ＡＢＣ", "ﬁ ﬂ", "Ⅻ", "①",
+]
+
+_POOLS = [
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+    "/-?:().,'+ &",
+    "äöüÄÖÜßéèêáàâíóúñçøåæœłżźćńšžčřğışÉÈÑÇØÅ",
+    "̧̀́̂̃̈̊̌",
+    " \t\n\r   　​﻿\x00\x07",
+    "!\"#$%*;<=>@[\\]^_`{|}~€£¥§°±²³µ¶·¿×÷«»„“”‘’–—…™®©",
+    "ДмитрийИвановΕλένη王小明山田太郎김민준محمدדוד😀♥→ＡＢＣﬁ①",
+]
+
+def RandomCorpus(count, seed):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        length = rng.randint(0, 24)
+        texts.append("".join(rng.choice(rng.choice(_POOLS)) for _ in range(length)))
+    return texts
+
+def Compare(texts):
+    """The (text, expected, SepaClean, SepaCleanMany) of every text where the
+    new implementation differs from the baseline."""
+    SepaClean.cache_clear()
+    many = SepaCleanMany(texts)
+    SepaClean.cache_clear()
+    mismatches = []
+    for text, batch_result in zip(texts, many):
+        expected = BaselineSepaClean(text)
+        single = SepaClean(text)
+        if single != expected or batch_result != expected:
+            mismatches.append((text, expected, single, batch_result))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check SepaClean against its original implementation.")
+    parser.add_argument("--random", type=int, default=20000, help="number of random strings besides the fixed corpus")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random strings")
+    args = parser.parse_args(argv)
+
+    texts = CORPUS + RandomCorpus(args.random, args.seed)
+    mismatches = Compare(texts)
+    for text, expected, single, batch_result in mismatches[:50]:
+        print(f"{text!r}: expected {expected!r}, SepaClean {single!r}, SepaCleanMany {batch_result!r}")
+    if mismatches:
+        print(f"{len(mismatches)} of {len(texts)} strings differ.")
+        return 1
+    print(f"All {len(texts)} strings match.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
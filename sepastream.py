@@ -0,0 +1,201 @@
+import io
+import os
+import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+# Streaming pain.001 writer. Produces the same document as sepaxml's
+# SepaTransfer (batch mode, one PmtInf per execution date) but writes it
+# element by element to a file handle instead of building an ElementTree and
+# serializing it into one big bytes object. Selected with
+# "sepa_engine": "stream" in settings.json.
+#
+# The group header needs the number of transactions and the control sum up
+# front, so payments are passed in twice: add_payment() during the first pass
+# only validates them and keeps running totals (nothing per payment is
+# stored), and write() then pulls them a second time from the payments
+# callable given to the constructor.
+#
+# Payments are grouped into PmtInf blocks by execution date and, beyond what
+# sepaxml can do, by an optional "pmtinf" number (used by split.py to keep
+# blocks under the bank's limits).
+
+def _BlockKey(payment):
+    return payment["execution_date"], payment.get("pmtinf", 0)
+
+class SepaStream:
+    def __init__(self, config, schema, payments):
+        """payments is a callable returning a fresh iterable of payment dicts
+        (same keys as for sepaxml's add_payment) every time it is called."""
+        # sepaxml helpers, so IDs look exactly like the ones it generates
+        from sepaxml.utils import make_msg_id
+        from text_unidecode import unidecode
+
+        for item in ("name", "currency", "IBAN"):
+            if item not in config:
+                raise Exception("Config file did not validate. " + item.upper() + "_MISSING ")
+        self.config = config
+        self.schema = schema
+        self.msg_id = make_msg_id()
+        self.debtor_name = unidecode(config["name"])[:70]
+        self._bic_tag = "BIC" if schema == "pain.001.001.03" else "BICFI"
+        self._payments = payments
+        self._totals = {}  # (execution date, pmtinf) -> [number of transactions, sum in cents]
+        self._last_key = None
+        self._contiguous = True  # every block's payments come in one run
+
+    def add_payment(self, payment):
+        # Validate like sepaxml does and count the payment into its block
+        missing = [item.upper() + "_MISSING" for item in ("name", "IBAN", "amount", "description", "execution_date")
+                   if item not in payment]
+        if missing:
+            raise Exception("Payment did not validate: " + " ".join(missing))
+        if not isinstance(payment["amount"], int):
+            raise Exception("Payment did not validate: AMOUNT_NOT_INTEGER")
+        if not isinstance(payment["execution_date"], datetime.date):
+            raise Exception("Payment did not validate: EXECUTION_DATE_INVALID_OR_NOT_DATETIME_INSTANCE")
+
+        key = _BlockKey(payment)
+        if key != self._last_key and key in self._totals:
+            self._contiguous = False
+        self._last_key = key
+        totals = self._totals.setdefault(key, [0, 0])
+        totals[0] += 1
+        totals[1] += payment["amount"]
+
+    @property
+    def number_of_transactions(self):
+        return sum(n for n, _ in self._totals.values())
+
+    @property
+    def control_sum(self):
+        # In cents
+        return sum(s for _, s in self._totals.values())
+
+    def write(self, out):
+        """Write the document to the binary file handle out."""
+        w = lambda s: out.write(s.encode("utf-8"))
+
+        self._write_header(w)
+        written = 0
+        if self._contiguous:
+            # Blocks follow each other in the payments, so one pass does it
+            key = None
+            for payment in self._payments():
+                if _BlockKey(payment) != key:
+                    if key is not None:
+                        w("</PmtInf>")
+                    key = _BlockKey(payment)
+                    self._write_pmtinf_header(w, key)
+                w(self.transaction_xml(payment))
+                written += 1
+            if key is not None:
+                w("</PmtInf>")
+        else:
+            # Blocks in order of first appearance, one pass over the payments each
+            for key in self._totals:
+                self._write_pmtinf_header(w, key)
+                for payment in self._payments():
+                    if _BlockKey(payment) == key:
+                        w(self.transaction_xml(payment))
+                        written += 1
+                w("</PmtInf>")
+        w("</CstmrCdtTrfInitn></Document>")
+
+        if written != self.number_of_transactions:
+            raise Exception("The payments changed while the SEPA file was written.")
+
+    def export(self):
+        # Whole document as bytes, for callers that need it in memory
+        buffer = io.BytesIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    def overhead(self, blocks=1):
+        """Size in bytes of the document without its transactions."""
+        buffer = io.BytesIO()
+        w = lambda s: buffer.write(s.encode("utf-8"))
+        self._write_header(w)
+        for _ in range(blocks):
+            self._write_pmtinf_header(w, (datetime.date.today(), 0), 0, 0)
+            w("</PmtInf>")
+        w("</CstmrCdtTrfInitn></Document>")
+        # Leave room for the counts and sums, which are zero here
+        return len(buffer.getvalue()) + 32 * (blocks + 1)
+
+    def _write_header(self, w):
+        from sepaxml.utils import int_to_decimal_str
+
+        w('<?xml version="1.0" encoding="UTF-8"?>')
+        w(f'<Document xmlns="urn:iso:std:iso:20022:tech:xsd:{self.schema}" '
+          f'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><CstmrCdtTrfInitn>')
+        w(f"<GrpHdr><MsgId>{escape(self.msg_id)}</MsgId>"
+          f"<CreDtTm>{datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}</CreDtTm>"
+          f"<NbOfTxs>{self.number_of_transactions}</NbOfTxs>"
+          f"<CtrlSum>{int_to_decimal_str(self.control_sum)}</CtrlSum>"
+          f"<InitgPty><Nm>{escape(self.debtor_name)}</Nm></InitgPty></GrpHdr>")
+
+    def _write_pmtinf_header(self, w, key, count=None, amount=None):
+        from sepaxml.utils import make_id, int_to_decimal_str
+
+        execution_date = key[0]
+        if count is None:
+            count, amount = self._totals[key]
+        config = self.config
+        bic_tag = self._bic_tag
+        w(f"<PmtInf><PmtInfId>{escape(make_id(self.debtor_name))}</PmtInfId>"
+          f"<PmtMtd>TRF</PmtMtd><BtchBookg>true</BtchBookg>"
+          f"<NbOfTxs>{count}</NbOfTxs><CtrlSum>{int_to_decimal_str(amount)}</CtrlSum>")
+        if not config.get("domestic", False):
+            w("<PmtTpInf><SvcLvl><Cd>SEPA</Cd></SvcLvl></PmtTpInf>")
+        if self.schema == "pain.001.001.03":
+            w(f"<ReqdExctnDt>{execution_date.isoformat()}</ReqdExctnDt>")
+        else:
+            w(f"<ReqdExctnDt><Dt>{execution_date.isoformat()}</Dt></ReqdExctnDt>")
+        w(f"<Dbtr><Nm>{escape(self.debtor_name)}</Nm></Dbtr>"
+          f"<DbtrAcct><Id><IBAN>{escape(config['IBAN'])}</IBAN></Id></DbtrAcct>")
+        if "BIC" in config:
+            w(f"<DbtrAgt><FinInstnId><{bic_tag}>{escape(config['BIC'])}</{bic_tag}></FinInstnId></DbtrAgt>")
+        else:
+            w("<DbtrAgt><FinInstnId /></DbtrAgt>")
+        w("<ChrgBr>SLEV</ChrgBr>")
+
+    def transaction_xml(self, payment):
+        # One <CdtTrfTxInf> element; also used by split.py to size chunks
+        from sepaxml.utils import int_to_decimal_str
+        from text_unidecode import unidecode
+
+        bic_tag = self._bic_tag
+        parts = [
+            f"<CdtTrfTxInf><PmtId><EndToEndId>{escape(payment.get('endtoend_id', 'NOTPROVIDED'))}</EndToEndId></PmtId>",
+            f"<Amt><InstdAmt Ccy={quoteattr(payment.get('currency', self.config['currency']))}>"
+            f"{int_to_decimal_str(payment['amount'])}</InstdAmt></Amt>",
+        ]
+        if payment.get("BIC"):
+            parts.append(f"<CdtrAgt><FinInstnId><{bic_tag}>{escape(payment['BIC'])}</{bic_tag}></FinInstnId></CdtrAgt>")
+        parts.append(
+            f"<Cdtr><Nm>{escape(unidecode(payment['name'])[:70])}</Nm></Cdtr>"
+            f"<CdtrAcct><Id><IBAN>{escape(payment['IBAN'])}</IBAN></Id></CdtrAcct>"
+            f"<RmtInf><Ustrd>{escape(unidecode(payment['description'])[:140])}</Ustrd></RmtInf></CdtTrfTxInf>"
+        )
+        return "".join(parts)
+
+
+def ValidateSepaFile(source, schema):
+    """Validate a written SEPA file against the schema shipped with sepaxml.
+
+    source is a path or a readable binary stream (e.g. a zip entry). It is
+    parsed lazily, so large files are not loaded as a whole.
+    Raises sepaxml's ValidationError, like SepaTransfer.export() does.
+    """
+    import sepaxml
+    import xmlschema
+    from sepaxml.validation import ValidationError
+
+    xsd = os.path.join(os.path.dirname(sepaxml.__file__), "schemas", schema + ".xsd")
+    try:
+        xmlschema.XMLSchema(xsd).validate(xmlschema.XMLResource(source, lazy=True))
+    except xmlschema.XMLSchemaValidationError as e:
+        raise ValidationError(
+            "The output SEPA file contains validation errors. This is likely due to an illegal value in one of "
+            "your input fields."
+        ) from e
@@ -11,7 +11,30 @@ def LoadSettings(SETTINGS_FILE):
         "placeholder_reference": "e.g., Lab Payment 10 July 2025 - 10am",
         "placeholder_experiment": "e.g., Study A - Session 1",
         "default_amount": 5.00,
-        "default_schema": "pain.001.001.03"
+        "default_schema": "pain.001.001.03",
+        "iban_cache": True,
+        "virtual_preview_threshold": 2000,
+        "sepa_engine": "sepaxml",
+        "pdf_engine": "platypus",
+        "split_max_transactions": 0,
+        "split_max_bytes": 0,
+        "split_max_control_sum": 0,
+        "split_per": "file",
+        "split_workers": 0,
+        "zip_compression": "deflated",
+        "zip_compresslevel": None,
+        "zip_pdf_compression": "stored",
+        "zip_direct": True,
+        "trace": False,
+        "trace_memory": False,
+        "trace_report": "json",
+        "ledger": True,
+        "watch_folder": "",
+        "watch_interval": 2,
+        "watch_debounce": 2,
+        "watch_workers": 0,
+        "monitor_interval": 1,
+        "payout_rules": {}
     }
 
     if not os.path.exists(SETTINGS_FILE):
@@ -28,4 +51,11 @@ def LoadSettings(SETTINGS_FILE):
             return json.load(f)
     except Exception as e:
         messagebox.showerror("Error", f"Failed to load settings.json: {e}")
-        return default_settings
\ No newline at end of file
+        return default_settings
+
+def SaveSettings(SETTINGS_FILE, settings):
+    # Through a temporary file, so a failed write can't leave a truncated settings.json
+    temp_file = SETTINGS_FILE + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=4)
+    os.replace(temp_file, SETTINGS_FILE)
\ No newline at end of file
@@ -0,0 +1,224 @@
+import io
+import os
+import json
+import math
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from export import SepaPayment, MakeSepa, WriteSepa, WriteDocuments, OpenArchive, NoProgress
+from rows import PaymentBatch, FormatCents, TotalCents
+from timing import Span
+
+# Splitting a batch that is too big for the bank. The limits come from
+# settings.json (0 means no limit):
+#   split_max_transactions  payments per file / PmtInf block
+#   split_max_bytes         size of the XML per file / PmtInf block
+#   split_max_control_sum   sum of the amounts per file / PmtInf block
+#   split_per               "file": several XML files, generated in parallel
+#                           "pmtinf": one XML file with several PmtInf blocks
+#   split_workers           worker processes for "file" (0: one per CPU)
+# The rows are cut into consecutive chunks (so the preview order is kept) of
+# about equal size, using as few chunks as the limits allow. A manifest lists
+# every chunk with its number of transactions and control sum; the PDFs and
+# the zip cover all chunks together.
+
+def BatchLimits(settings):
+    per = settings.get("split_per") or "file"
+    if per not in ("file", "pmtinf"):
+        raise ValueError(f'split_per in settings.json must be "file" or "pmtinf", not "{per}".')
+    return {
+        "transactions": int(settings.get("split_max_transactions") or 0),
+        "bytes": int(settings.get("split_max_bytes") or 0),
+        # In cents, like the amounts in the XML
+        "control_sum": int(round(float(settings.get("split_max_control_sum") or 0) * 100)),
+        "per": per,
+        "workers": int(settings.get("split_workers") or 0) or None,
+    }
+
+def _Cents(row):
+    return row["cents"]
+
+def _TransactionSizes(config, data_rows, schema):
+    # Bytes each row takes up in the XML (End-to-End IDs are always 32 characters)
+    from sepastream import SepaStream
+
+    stream = SepaStream(config, schema, None)
+    today = datetime.date.today()
+    sizes = [len(stream.transaction_xml(SepaPayment(row, config, today, "0" * 32)).encode("utf-8"))
+             for row in data_rows]
+    return sizes, stream.overhead()
+
+def SplitRows(data_rows, limits, config, schema):
+    """Cut data_rows into consecutive chunks that respect limits.
+
+    Returns a list of row lists; [data_rows] when no splitting is needed.
+    Raises ValueError if a single payment already exceeds a limit.
+    """
+    max_tx, max_bytes, max_sum = limits["transactions"], limits["bytes"], limits["control_sum"]
+    if not data_rows or not (max_tx or max_bytes or max_sum):
+        return [data_rows]
+
+    count = len(data_rows)
+    cents = [_Cents(row) for row in data_rows]
+    sizes, overhead = _TransactionSizes(config, data_rows, schema) if max_bytes else (None, 0)
+    budget = max_bytes - overhead  # bytes left for the transactions of one chunk
+    if max_bytes and budget <= 0:
+        raise ValueError(f"split_max_bytes ({max_bytes}) is smaller than an empty SEPA file ({overhead} bytes).")
+
+    for i, row in enumerate(data_rows):
+        if max_sum and cents[i] > max_sum:
+            raise ValueError(f"Row {i + 1} ({row['name']}: {row['amount']:.2f}) alone exceeds split_max_control_sum.")
+        if max_bytes and sizes[i] > budget:
+            raise ValueError(f"Row {i + 1} ({row['name']}) alone exceeds split_max_bytes.")
+
+    # Lower bound for the number of chunks, from each limit on its own
+    needed = 1
+    if max_tx:
+        needed = max(needed, math.ceil(count / max_tx))
+    if max_sum:
+        needed = max(needed, math.ceil(sum(cents) / max_sum))
+    if max_bytes:
+        needed = max(needed, math.ceil(sum(sizes) / budget))
+
+    def balanced(n):
+        # Aim for equal row counts per chunk, cutting a chunk short where a
+        # limit is hit; None if n chunks are not enough that way
+        ends = []
+        start = 0
+        for k in range(n):
+            if start == count:
+                break
+            target = math.ceil((count - start) / (n - k))
+            end, total, size = start, 0, 0
+            while end < count and end - start < target:
+                if max_sum and total + cents[end] > max_sum:
+                    break
+                if max_bytes and size + sizes[end] > budget:
+                    break
+                total += cents[end]
+                size += sizes[end] if max_bytes else 0
+                end += 1
+            ends.append(end)
+            start = end
+        return ends if start == count else None
+
+    n = needed
+    ends = balanced(n)
+    while ends is None:
+        n += 1
+        ends = balanced(n)
+    if len(ends) == 1:
+        return [data_rows]
+    return [data_rows[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+def _WriteChunk(config, rows, schema, engine, xml_path=None):
+    # Runs in a worker process: the rows are copies, so hand the End-to-End
+    # IDs back for the PDFs. Without xml_path the XML itself goes back as
+    # well, for the parent to put into the zip.
+    sepa = MakeSepa(config, rows, schema, engine)
+    ids = [row["endtoend_id"] for row in rows]
+    if xml_path is None:
+        data = sepa.export()
+        if hasattr(sepa, "write"):
+            from sepastream import ValidateSepaFile
+
+            ValidateSepaFile(io.BytesIO(data), schema)
+        return ids, len(data), data
+    WriteSepa(xml_path, sepa)
+    return ids, os.path.getsize(xml_path), None
+
+def WriteBatch(base_path, config, chunks, schema, engine="sepaxml", per="file",
+               zip_output=False, password=None, workers=None, pdfs=None, zip_options=None, progress=None):
+    """Write a batch split by SplitRows, plus its manifest and PDFs.
+
+    per="file" writes base_path_part1of3.xml etc. in a process pool of
+    workers processes (workers=1 writes them one after the other here);
+    per="pmtinf" writes base_path.xml with one PmtInf block per chunk.
+    pdfs, zip_options and progress are passed on to WriteDocuments. Returns
+    (output_files, problems) like WriteOutputs.
+    """
+    progress = progress or NoProgress
+    archive = OpenArchive(base_path, zip_output, password, zip_options)
+    if archive is None:
+        return _WriteBatch(base_path, config, chunks, schema, engine, per, zip_output, password, workers, pdfs,
+                           zip_options, None, progress)
+    with archive:
+        return _WriteBatch(base_path, config, chunks, schema, engine, per, zip_output, password, workers, pdfs,
+                           zip_options, archive, progress)
+
+def _WriteBatch(base_path, config, chunks, schema, engine, per, zip_output, password, workers, pdfs,
+                zip_options, archive, progress):
+    data_rows = [row for chunk in chunks for row in chunk]
+    entries = []
+
+    if per == "pmtinf":
+        xml_path = base_path + ".xml"
+        sepa = MakeSepa(config, data_rows, schema, engine, blocks=[len(c) for c in chunks], progress=progress)
+        progress("Writing SEPA XML")
+        WriteSepa(xml_path, sepa, archive)
+        files = [xml_path]
+        for k, chunk in enumerate(chunks, 1):
+            entries.append({"file": os.path.basename(xml_path), "pmtinf": k, "transactions": len(chunk),
+                            "control_sum": FormatCents(TotalCents(chunk))})
+    else:
+        n = len(chunks)
+        files = [f"{base_path}_part{k}of{n}.xml" for k in range(1, n + 1)]
+        # Into the zip, the workers hand back the XML instead of writing it.
+        # Each worker gets a batch of just its chunk (rows of the whole batch
+        # would take the whole batch along when pickled)
+        tasks = [(config, PaymentBatch(chunk), schema, engine, None if archive else path) for chunk, path in zip(chunks, files)]
+        results = []
+        with Span("sepa parts", parts=n, rows=len(data_rows)):
+            try:
+                progress("Writing SEPA files", 0, n)
+                if workers == 1 or n == 1:
+                    for task in tasks:
+                        results.append(_WriteChunk(*task))
+                        progress("Writing SEPA files", len(results), n)
+                else:
+                    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, n)) as pool:
+                        futures = [pool.submit(_WriteChunk, *task) for task in tasks]
+                        try:
+                            for f in futures:
+                                results.append(f.result())
+                                progress("Writing SEPA files", len(results), n)
+                        except Exception:
+                            # Don't start the parts that are still queued
+                            pool.shutdown(cancel_futures=True)
+                            raise
+            except Exception:
+                # All or nothing: don't leave some of the parts behind
+                for path in files:
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+
+        for chunk, path, (ids, size, data) in zip(chunks, files, results):
+            for row, endtoend_id in zip(chunk, ids):
+                row["endtoend_id"] = endtoend_id
+            if archive is not None:
+                archive.writestr(os.path.basename(path), data)
+            entries.append({"file": os.path.basename(path), "transactions": len(chunk),
+                            "control_sum": FormatCents(TotalCents(chunk)), "bytes": size})
+
+    manifest_path = base_path + "_manifest.json"
+    manifest = {
+        "experiment": config.get("experiment"),
+        "reference": config.get("reference"),
+        "currency": config.get("currency"),
+        "schema": schema,
+        "split_per": per,
+        "transactions": len(data_rows),
+        "control_sum": FormatCents(TotalCents(data_rows)),
+        "chunks": entries,
+    }
+    if archive is not None:
+        archive.writestr(os.path.basename(manifest_path), json.dumps(manifest, indent=4).encode("utf-8"))
+        return WriteDocuments(base_path, [], config, data_rows, zip_output, password, pdfs, zip_options, archive,
+                              progress=progress)
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+
+    return WriteDocuments(base_path, files + [manifest_path], config, data_rows, zip_output, password, pdfs,
+                          zip_options, progress=progress)
@@ -0,0 +1,161 @@
+import os
+import csv
+import codecs
+
+from utils import DetectEncoding
+from parse import IterParseRecords
+from timing import Span
+
+# Following a .pay file while zTree is still writing it (the payment
+# monitor in main.py), so invalid IBANs show up while the participants are
+# still in the lab. TailParser remembers how far it got - the byte offset,
+# the header and the encoding with its decoder state - and each read()
+# only decodes and parses the complete lines appended since. A line that is
+# still being written stays in a buffer until its line break arrives.
+#
+# If the part already read changes (zTree rewrote the file, or it was
+# replaced), the parser starts over from the beginning; so does it if the
+# encoding guessed from the lines so far turns out to be wrong.
+#
+# Only a BOM settles the encoding of a file that is still growing. Without
+# one the parser goes by what the bytes so far decode as: UTF-8 (what zTree
+# writes), else cp1252, else the full detection - but chardet on a few
+# lines is little better than a coin toss, so every such guess stays
+# provisional. A later chunk that doesn't decode re-detects from the whole
+# file, and the final read checks the guess against DetectEncoding on the
+# complete file (what ParseRows uses), re-parsing if they disagree.
+
+# Bytes before the offset compared on every read to notice a rewrite
+_CHECK_SIZE = 64
+
+_BOMS = (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE, codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+class TailParser:
+    """Incrementally parses a growing .pay file.
+
+    rows and discarded_rows hold everything read so far (as ParseRows
+    returns them); read() adds what was appended since the last call.
+    """
+
+    def __init__(self, pay_path):
+        self.pay_path = pay_path
+        self.reset()
+
+    def reset(self):
+        self.rows = []
+        self.discarded_rows = []
+        self.fieldnames = None
+        self.detection = None
+        self.offset = 0
+        self._decoder = None
+        self._buffer = ""
+        self._head = b""
+        self._check = b""
+
+    def _changed(self, f, size):
+        # The file shrank, or the bytes around the start or the offset differ
+        if size < self.offset:
+            return True
+        if self._head:
+            f.seek(0)
+            if f.read(len(self._head)) != self._head:
+                return True
+        if self._check:
+            f.seek(self.offset - len(self._check))
+            if f.read(len(self._check)) != self._check:
+                return True
+        return False
+
+    def _detect(self, data):
+        # data is everything read so far. Without a BOM the result is only a
+        # guess for the file so far ("guessed"); an incomplete character at
+        # the end doesn't count against an encoding
+        if data.startswith(_BOMS):
+            return DetectEncoding(self.pay_path)
+        for encoding in ("utf-8", "cp1252"):
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(data)
+                return {"encoding": encoding, "method": encoding, "guessed": True}
+            except UnicodeDecodeError:
+                pass
+        return dict(DetectEncoding(self.pay_path), guessed=True)
+
+    def _restart(self, detection, final):
+        # Parse the whole file again in the given encoding
+        self.reset()
+        self.detection = detection
+        self._decoder = codecs.getincrementaldecoder(detection["encoding"])()
+        new_rows, new_discarded, _ = self.read(final)
+        return new_rows, new_discarded, True
+
+    def read(self, final=False):
+        """Parse what was appended since the last read.
+
+        Returns (new_rows, new_discarded_rows, restarted). If restarted is
+        True the file had to be read from the beginning again, and the new
+        rows replace everything returned before. With final=True a last
+        line without a line break is parsed as well (the file is complete).
+        """
+        restarted = False
+        with open(self.pay_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if self.offset and self._changed(f, size):
+                self.reset()
+                restarted = True
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+
+        if not data and not final:
+            return [], [], restarted
+        if self.detection is None:
+            if b"\n" not in data and not final:
+                # Not even the header is complete yet
+                return [], [], restarted
+            self.detection = self._detect(data)
+            self._decoder = codecs.getincrementaldecoder(self.detection["encoding"])()
+        if final and self.detection.get("guessed"):
+            # The file is complete: settle the encoding as ParseRows would
+            detection = DetectEncoding(self.pay_path)
+            if codecs.lookup(detection["encoding"]).name != codecs.lookup(self.detection["encoding"]).name:
+                return self._restart(detection, final)
+            self.detection = detection
+        try:
+            text = self._decoder.decode(data, final=final)
+        except UnicodeDecodeError:
+            if not self.detection.get("guessed"):
+                raise
+            # The guess was wrong after all: guess again from everything
+            # written so far and read it all in that encoding
+            with open(self.pay_path, "rb") as f:
+                return self._restart(self._detect(f.read(self.offset + len(data))), final)
+
+        if not self._head:
+            self._head = data[:_CHECK_SIZE]
+        self.offset += len(data)
+        self._check = (self._check + data)[-_CHECK_SIZE:]
+
+        # Only complete lines are parsed; the rest waits for the next read
+        self._buffer += text
+        if final:
+            complete, self._buffer = self._buffer, ""
+        else:
+            cut = self._buffer.rfind("\n") + 1
+            complete, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        if not complete:
+            return [], [], restarted
+        lines = [line.rstrip("\r") for line in complete.split("\n") if line.strip()]
+        if not lines:
+            return [], [], restarted
+
+        if self.fieldnames is None:
+            self.fieldnames = next(csv.reader(lines[:1], delimiter='\t'))
+            lines = lines[1:]
+        new_discarded = []
+        with Span("tail parse", bytes=len(data)) as span:
+            records = csv.DictReader(lines, fieldnames=self.fieldnames, delimiter='\t')
+            new_rows = list(IterParseRecords(records, self.fieldnames, new_discarded.append))
+            span.set(rows=len(new_rows), discarded=len(new_discarded))
+        self.rows.extend(new_rows)
+        self.discarded_rows.extend(new_discarded)
+        return new_rows, new_discarded, restarted
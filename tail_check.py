@@ -0,0 +1,101 @@
+"""
+Regression check of the payment monitor's TailParser (tail.py).
+
+Writes synthetic .pay files (see benchmark.py) the way zTree does while a
+session runs, a few lines at a time or in arbitrary byte chunks, reads them
+with a TailParser after every append and finally with read(final=True), and
+compares the rows and discarded rows with ParseRows on the complete file.
+The cases cover UTF-8, UTF-8 with BOM, UTF-16 and cp1252 files with
+non-ASCII names in the first lines, where guessing the encoding from the
+part written so far can go wrong. The exit code is 1 if any case differs.
+
+Example:
+    python tail_check.py
+    python tail_check.py --rows 2000 --seeds 20
+"""
+
+import os
+import sys
+import random
+import argparse
+import tempfile
+
+from benchmark import GeneratePayFile
+from utils import DecodeFile
+from parse import ParseRows
+from tail import TailParser
+
+
+def _Appends(data, step, rng):
+    # The file content in the pieces zTree would add: step lines at a time,
+    # or random byte chunks when step is None
+    if step is None:
+        start = 0
+        while start < len(data):
+            end = start + rng.randint(1, 200)
+            yield data[start:end]
+            start = end
+        return
+    lines = data.splitlines(keepends=True)
+    for start in range(0, len(lines), step):
+        yield b"".join(lines[start:start + step])
+
+def RunCase(work_dir, rows, encoding, non_ascii_ratio, step, seed):
+    """Feed one generated file to a TailParser; returns None if the result
+    matches ParseRows, else a description of the difference."""
+    rng = random.Random(seed)
+    pay_path = os.path.join(work_dir, "session.pay")
+    source_path = os.path.join(work_dir, "source.pay")
+    GeneratePayFile(source_path, rows, "combo", encoding, 0.1, non_ascii_ratio, seed)
+    with open(source_path, "rb") as f:
+        data = f.read()
+
+    open(pay_path, "wb").close()
+    tail = TailParser(pay_path)
+    try:
+        for piece in _Appends(data, step, rng):
+            with open(pay_path, "ab") as f:
+                f.write(piece)
+            tail.read()
+        tail.read(final=True)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+    rows_expected, discarded_expected = ParseRows(DecodeFile(pay_path))
+    if tail.rows != rows_expected:
+        wrong = next((a, b) for a, b in zip(tail.rows + [None] * len(rows_expected), rows_expected) if a != b)
+        return f"{len(tail.rows)} rows instead of {len(rows_expected)}, first difference {wrong[0]} != {wrong[1]}"
+    if tail.discarded_rows != discarded_expected:
+        return f"{len(tail.discarded_rows)} discarded rows instead of {len(discarded_expected)}"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check TailParser against ParseRows on growing .pay files.")
+    parser.add_argument("--rows", type=int, default=300, help="payees per file")
+    parser.add_argument("--seeds", type=int, default=5, help="files per case")
+    args = parser.parse_args(argv)
+
+    cases = [(encoding, ratio, step)
+             for encoding in ("utf-8", "utf-8-sig", "utf-16", "cp1252")
+             for ratio in (0.0, 0.3, 1.0)
+             for step in (1, 4, 50, None)]
+    failures = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        for encoding, ratio, step in cases:
+            for seed in range(args.seeds):
+                problem = RunCase(work_dir, args.rows, encoding, ratio, step, seed)
+                if problem is not None:
+                    failures += 1
+                    appends = "byte chunks" if step is None else f"{step} lines at a time"
+                    print(f"{encoding}, {ratio:.0%} non-ASCII, {appends}, seed {seed}: {problem}")
+    total = len(cases) * args.seeds
+    if failures:
+        print(f"{failures} of {total} files differ.")
+        return 1
+    print(f"All {total} files match.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+import builtins
+import tempfile
+import importlib
+import threading
+
+# Startup profiling. Set the environment variable ZTREESEPA_PROFILE to 1 to
+# print per-import and per-phase timings to stderr, or to a file path to
+# append them to that file instead. The windowed .exe has no stderr, so
+# there the output goes to ztreesepa_profile.txt in the temp directory.
+# When the variable is unset everything here is a no-op.
+
+_PROFILE = os.environ.get("ZTREESEPA_PROFILE", "")
+_TO_STDERR = _PROFILE.lower() in ("1", "true", "yes")
+_start = time.perf_counter()
+_lock = threading.Lock()
+
+def _Emit(line):
+    with _lock:
+        if _TO_STDERR and sys.stderr is not None:
+            print(line, file=sys.stderr, flush=True)
+            return
+        path = os.path.join(tempfile.gettempdir(), "ztreesepa_profile.txt") if _TO_STDERR else _PROFILE
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def Phase(name):
+    # Mark the end of a startup phase, stamped with the time since launch
+    if _PROFILE:
+        _Emit(f"[{(time.perf_counter() - _start) * 1000:9.1f} ms] phase  {name}")
+
+def ProfileImports():
+    """Time every module imported from now on.
+
+    Each first-time import is reported with its cumulative time (including
+    the modules it pulls in), indented by nesting depth, so the expensive
+    dependency chains stand out.
+    """
+    if not _PROFILE:
+        return
+    original_import = builtins.__import__
+    depth = threading.local()
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+        depth.value = getattr(depth, "value", 0) + 1
+        t0 = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            depth.value -= 1
+            elapsed = (time.perf_counter() - t0) * 1000
+            _Emit(f"[{(time.perf_counter() - _start) * 1000:9.1f} ms] import {'  ' * depth.value}{name} ({elapsed:.1f} ms)")
+
+    builtins.__import__ = timed_import
+
+def WarmUp(modules):
+    """Import the given modules on a daemon thread.
+
+    Used once the main window is up, so the heavy dependencies are loaded
+    by the time the user first imports a file or generates output. Each
+    entry is a module name or a callable. Failures are ignored here; they
+    surface with a proper message when the feature is actually used.
+    """
+    def run():
+        for item in modules:
+            t0 = time.perf_counter()
+            try:
+                if callable(item):
+                    item()
+                else:
+                    importlib.import_module(item)
+            except Exception:
+                pass
+            if _PROFILE:
+                name = getattr(item, "__name__", item)
+                Phase(f"warmed up {name} ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+        Phase("background warm-up finished")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+# Run tracing. Spans time the stages of an import or export (decoding,
+# parsing and IBAN checks, building and writing the SEPA XML, each PDF, the
+# zip) with row counts and byte sizes, so a slow export on a lab machine
+# shows where the time went. Switched on with "trace": true in settings.json
+# or the environment variable ZTREESEPA_TRACE=1; "trace_memory": true (or
+# ZTREESEPA_TRACE=memory) also records the peak Python memory of every span
+# via tracemalloc, which slows everything down noticeably. When tracing is
+# off, Span() returns a shared no-op object, so the spans cost next to
+# nothing. Each export writes its spans next to the output (see
+# WriteTraceReport), and the last run is kept for the Help menu.
+
+_TRACE = os.environ.get("ZTREESEPA_TRACE", "").lower()
+_tracing = _TRACE in ("1", "true", "yes", "memory")
+_trace_memory = _TRACE == "memory"
+_run_start = time.perf_counter()
+_spans = []
+_active = threading.local()
+
+def EnableTracing(enabled, memory=False):
+    """Turn tracing on or off (the environment variable wins if set)."""
+    global _tracing, _trace_memory
+    if _TRACE:
+        return
+    _tracing = bool(enabled)
+    _trace_memory = _tracing and bool(memory)
+
+def Tracing():
+    return _tracing
+
+def StartTrace(saved=None):
+    """Start a new run, or continue one saved with SaveTrace (e.g. the
+    import of the file that is now exported, so each export reports it)."""
+    global _run_start
+    import tracemalloc
+
+    with _lock:
+        if saved is None:
+            _run_start = time.perf_counter()
+            _spans[:] = []
+        else:
+            _run_start, spans = saved
+            _spans[:] = spans
+    if _trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def SaveTrace():
+    with _lock:
+        return _run_start, list(_spans)
+
+def TraceSpans():
+    # The spans of the current run, as dicts in the order they started
+    # (spans timed elsewhere, without a start, come last)
+    with _lock:
+        spans = list(_spans)
+    return sorted(spans, key=lambda s: (s["start_ms"] is None, s["start_ms"] or 0))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **fields):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("name", "fields", "start", "depth", "base", "seen")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        # Counts that are only known once the work is done
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = getattr(_active, "stack", None)
+        if stack is None:
+            stack = _active.stack = []
+        self.depth = len(stack)
+        self.base = self.seen = None
+        if _trace_memory:
+            import tracemalloc
+
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                # The enclosing span keeps the peak it reached so far
+                if stack and stack[-1].seen is not None:
+                    stack[-1].seen = max(stack[-1].seen, peak)
+                tracemalloc.reset_peak()
+                self.base = self.seen = current
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _active.stack.pop()
+        record = {
+            "name": self.name,
+            "start_ms": round((self.start - _run_start) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "depth": self.depth,
+            "thread": threading.current_thread().name,
+        }
+        if self.base is not None:
+            import tracemalloc
+
+            peak = max(self.seen, tracemalloc.get_traced_memory()[1])
+            record["peak_bytes"] = peak - self.base
+        record.update(self.fields)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        with _lock:
+            _spans.append(record)
+        return False
+
+def Span(name, **fields):
+    """Time the enclosed block as one span of the current run.
+
+        with Span("parse") as span:
+            ...
+            span.set(rows=len(rows))
+    """
+    if not _tracing:
+        return _NO_SPAN
+    return _Span(name, fields)
+
+def AddSpan(name, seconds, **fields):
+    # A span for work timed elsewhere, e.g. in a worker process
+    if _tracing:
+        with _lock:
+            _spans.append(dict({"name": name, "start_ms": None, "duration_ms": round(seconds * 1000, 3),
+                                "depth": 0, "thread": "worker process"}, **fields))
+
+
+def SummarizeSpans(spans):
+    # Per span name, in order of first appearance: count and total time
+    summary = {}
+    for span in spans:
+        entry = summary.setdefault(span["name"], {"name": span["name"], "count": 0, "duration_ms": 0.0})
+        entry["count"] += 1
+        entry["duration_ms"] = round(entry["duration_ms"] + span["duration_ms"], 3)
+    return list(summary.values())
+
+_CSV_COLUMNS = ["name", "start_ms", "duration_ms", "depth", "thread", "rows", "bytes", "peak_bytes", "error"]
+
+def WriteTraceReport(base_path, fmt="json"):
+    """Write the spans of the current run to base_path_trace.json (or .csv).
+
+    Returns the path, or None when tracing is off. The report holds timings
+    and counts only, no names or IBANs.
+    """
+    if not _tracing:
+        return None
+    spans = TraceSpans()
+    if fmt == "csv":
+        import csv
+
+        path = base_path + "_trace.csv"
+        columns = _CSV_COLUMNS + sorted({key for span in spans for key in span} - set(_CSV_COLUMNS))
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(spans)
+        return path
+
+    import json
+
+    path = base_path + "_trace.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "memory": _trace_memory,
+                   "summary": SummarizeSpans(spans), "spans": spans}, f, indent=2)
+    return path
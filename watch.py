@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from merge import ReadSession
+
+# Watch mode: .pay files copied into a shared folder are read (decoded,
+# parsed and IBAN-checked) in the background as they appear, so importing
+# one of them later only has to pick up the cached result.
+#
+# The folder is polled with os.scandir, which is cheap even on a network
+# share and works the same everywhere. A file is only read once its size
+# and modification time have stayed the same for `debounce` seconds, so a
+# file that is still being copied is skipped until it is complete. Files
+# are read by a pool of worker processes (merge.ReadSession, as for a
+# multi-session import). Results are kept in memory only: they contain
+# names and IBANs in clear, which the on-disk caches never store.
+
+def _Key(path):
+    # The file dialog may spell a path differently (slashes, case on Windows)
+    return os.path.normcase(os.path.abspath(path))
+
+def _Signature(entry):
+    stat = entry.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+class WatchFolder:
+    """Reads the .pay files in folder in the background.
+
+    start() begins polling every interval seconds on a daemon thread, stop()
+    ends it. result(path) returns (rows, discarded_rows) for a file whose
+    cached result is still current, else None.
+    """
+
+    def __init__(self, folder, interval=2.0, debounce=2.0, workers=None):
+        self.folder = os.path.abspath(folder)
+        self.interval = interval
+        self.debounce = debounce
+        self.workers = workers
+        self._lock = threading.Lock()
+        # All keyed by _Key(path)
+        self._seen = {}       # (signature, time it was first seen with it)
+        self._pending = {}    # signature being read
+        self._results = {}    # (signature, rows, discarded_rows), or (signature, None, error)
+        self._pool = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except OSError:
+                # The share may be unreachable for a while; try again later
+                pass
+            self._stop.wait(self.interval)
+
+    def poll(self):
+        """Scan the folder once and start reading files that have settled."""
+        now = time.monotonic()
+        found = {}
+        for entry in os.scandir(self.folder):
+            if not entry.name.lower().endswith(".pay") or not entry.is_file():
+                continue
+            try:
+                found[_Key(entry.path)] = (entry.path, _Signature(entry))
+            except OSError:
+                continue
+
+        settled = []
+        with self._lock:
+            for key, (path, signature) in found.items():
+                seen = self._seen.get(key)
+                if seen is None or seen[0] != signature:
+                    # New or still changing: wait for it to settle
+                    self._seen[key] = (signature, now)
+                    continue
+                if now - seen[1] < self.debounce:
+                    continue
+                current = self._results.get(key)
+                if self._pending.get(key) == signature or (current and current[0] == signature):
+                    continue
+                self._pending[key] = signature
+                settled.append((key, path, signature))
+            # Forget files that were removed
+            for key in set(self._seen) - set(found):
+                del self._seen[key]
+                self._results.pop(key, None)
+
+        for key, path, signature in settled:
+            self._submit(key, path, signature)
+
+    def _submit(self, key, path, signature):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers or None)
+        try:
+            future = self._pool.submit(ReadSession, path)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed); start a new pool on the next poll
+            self._pool = None
+            with self._lock:
+                self._pending.pop(key, None)
+            return
+        future.add_done_callback(lambda f: self._done(key, signature, f))
+
+    def _done(self, key, signature, future):
+        if future.cancelled():
+            return
+        with self._lock:
+            if self._pending.get(key) == signature:
+                del self._pending[key]
+            error = future.exception()
+            if error is not None:
+                self._results[key] = (signature, None, error)
+            else:
+                rows, discarded_rows = future.result()
+                self._results[key] = (signature, rows, discarded_rows)
+
+    def result(self, pay_path):
+        """(rows, discarded_rows) of pay_path if it was read and has not
+        changed since, else None (also if reading it failed, so the caller
+        reads it itself and reports the error). The rows are copies, so the
+        caller may change them."""
+        with self._lock:
+            cached = self._results.get(_Key(pay_path))
+        if cached is None or cached[1] is None:
+            return None
+        try:
+            stat = os.stat(pay_path)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != cached[0]:
+            return None
+        return [dict(row) for row in cached[1]], [dict(row) for row in cached[2]]
+
+    def counts(self):
+        """(files read, files waiting to settle or being read)."""
+        with self._lock:
+            ready = waiting = 0
+            for key, (signature, _) in self._seen.items():
+                cached = self._results.get(key)
+                if cached is None or cached[0] != signature:
+                    waiting += 1
+                elif cached[1] is not None:
+                    ready += 1
+        return ready, waiting